@@ -0,0 +1,245 @@
+"""
+asyncio Provider interface.
+
+This module defines the AsyncProvider base class, an alternative to Provider
+for providers that spend most of their time waiting on I/O (PMU sockets,
+Modbus devices, Elasticsearch, ...). Requests, publishing and any other
+provider tasks share one asyncio event loop instead of a thread each.
+
+Requests use the same protocol as Provider (see Provider.__message_handler)
+and are served concurrently from a zmq.asyncio ROUTER socket, so existing
+REQ clients work unchanged. Writes are processed one at a time.
+"""
+
+import asyncio
+import fnmatch
+import functools
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Coroutine, List, Optional, Set
+
+import zmq
+import zmq.asyncio
+
+import pybennu.distributed.metrics as metrics
+import pybennu.distributed.publisher as publisher
+import pybennu.distributed.swig._Endpoint as E
+import pybennu.distributed.transport as transport
+from pybennu.distributed.provider import is_pattern, merge_reads, parse_writes
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncProvider(ABC):
+    """
+    asyncio Provider base class.
+
+    Inheriting providers must implement the coroutines:
+
+    - query()
+    - read(tag)
+    - write(tags)
+    - periodic_publish()
+
+    Blocking calls (e.g. a power flow solve) should be run with
+    run_blocking() so they don't stall the event loop. Additional long
+    running coroutines (e.g. one per polled device) can be started with
+    spawn().
+    """
+
+    WRITE_VERBS = {"WRITE", "WRITEREAD"}
+
+    def __init__(self, server_endpoint: str, publish_endpoint: str) -> None:
+        """Initialize connection environment."""
+        self.__server_endpoint = server_endpoint
+        self.__publisher = publisher.Publisher(publish_endpoint)
+        self.__tasks: Set[asyncio.Task] = set()
+        self.__write_lock: Optional[asyncio.Lock] = None
+
+        # request metrics, reported by the STATS verb
+        self.metrics = metrics.get_registry()
+        self.debug_sample = metrics.Sampler(100)
+
+    @abstractmethod
+    async def query(self) -> str:
+        """
+        Return all current tag names.
+
+        Must return 'ACK=tag1,tag2,...' or 'ERR=<error message>'.
+        """
+        pass
+
+    @abstractmethod
+    async def read(self, tag: str) -> str:
+        """
+        Read the current value of a single tag.
+
+        Must return 'ACK=<value>' or 'ERR=<error message>'.
+        """
+        pass
+
+    @abstractmethod
+    async def write(self, tags: dict) -> str:
+        """
+        Write values to one or more tags.
+
+        Must return 'ACK=<success message>' or 'ERR=<error message>'.
+        """
+        pass
+
+    @abstractmethod
+    async def periodic_publish(self) -> None:
+        """
+        Publish all tags periodically, e.g. with asyncio.sleep() between
+        publishes. Inheriting providers must implement.
+        """
+        pass
+
+    async def read_many(self, tags: List[str]) -> str:
+        """
+        Read the current values of several tags.
+
+        Returns 'ACK=tag1:value1,tag2:value2,...' or 'ERR=<error message>'.
+        The default implementation awaits read() for each tag concurrently.
+        """
+        replies = await asyncio.gather(*(self.read(tag) for tag in tags))
+        return merge_reads(tags, list(replies))
+
+    @property
+    def publisher(self) -> publisher.Publisher:
+        """The Publisher used by this provider, e.g. to enable binary mode."""
+        return self.__publisher
+
+    async def publish(self, msg) -> None:
+        """
+        Publish message using publisher.
+
+        The message can be a text message or a dictionary of tag values.
+        Publishing sends UDP datagrams and doesn't block on the network, so
+        it is done directly from the event loop.
+        """
+        self.__publisher.publish(msg)
+
+    async def run_blocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking function in the default executor and await its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """
+        Run a coroutine as a task of the provider. Errors are printed rather
+        than lost, and the task is kept referenced until it is done.
+        """
+        task = asyncio.ensure_future(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__task_done)
+        return task
+
+    def __task_done(self, task: asyncio.Task) -> None:
+        self.__tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print("provider task error: {}".format(task.exception()))
+
+    def run(self) -> None:
+        """Run the provider event loop until it is interrupted."""
+        asyncio.run(self.main())
+
+    async def main(self) -> None:
+        """Start periodic publishing and serve requests."""
+        self.__write_lock = asyncio.Lock()
+        self.spawn(self.periodic_publish())
+        await self.serve()
+
+    async def serve(self) -> None:
+        """Listen for requests and reply to each one from its own task."""
+        if isinstance(self.__server_endpoint, str):
+            address = self.__server_endpoint
+        else:
+            address = E.Endpoint_str_get(self.__server_endpoint)
+
+        socket = transport.socket(zmq.ROUTER, aio=True)
+        socket.bind(address)
+        try:
+            while True:
+                frames = await socket.recv_multipart()
+                self.spawn(self.__reply(socket, frames))
+        finally:
+            transport.close(socket, linger=0)
+
+    async def __reply(self, socket: zmq.asyncio.Socket, frames: List[bytes]) -> None:
+        # REQ clients send [identity, empty delimiter, request]
+        envelope, request = frames[:-1], frames[-1]
+        reply = await self.handle_request(request.decode('utf-8').strip('\x00'))
+        await socket.send_multipart(envelope + [(reply + '\x00').encode('utf-8')])
+
+    async def handle_request(self, message: str) -> str:
+        """Handle a request message and return the reply."""
+        if not message:
+            return "ERR=Message empty"
+        elif '=' not in message:
+            return "ERR=Invalid message request"
+
+        op, _, payload = message.partition('=')
+        verb = op.upper()
+        debug = logger.isEnabledFor(logging.DEBUG) and self.debug_sample()
+        if debug:
+            logger.debug("Received %s request with payload %s", op, payload)
+
+        start = time.perf_counter()
+        try:
+            if verb in self.WRITE_VERBS:
+                async with self.__write_lock:
+                    reply = await self.__dispatch(verb, op, payload)
+            else:
+                reply = await self.__dispatch(verb, op, payload)
+        except Exception as err:
+            reply = "ERR=Request handler failed: {}".format(err)
+        elapsed = time.perf_counter() - start
+
+        if verb not in ("QUERY", "READ", "WRITE", "WRITEREAD", "STATS"):
+            verb = "UNKNOWN"
+        self.metrics.count("requests." + verb)
+        if not reply.startswith("ACK"):
+            self.metrics.count("errors." + verb)
+        self.metrics.observe("latency." + verb, elapsed)
+
+        if debug:
+            logger.debug("Sending reply for payload %s -- %s", payload, reply)
+        return reply
+
+    async def __dispatch(self, verb: str, op: str, payload: str) -> str:
+        if verb == "QUERY":
+            return await self.query()
+        elif verb == "READ":
+            return await self.__read_handler(payload)
+        elif verb == "WRITE":
+            return await self.write(parse_writes(payload))
+        elif verb == "WRITEREAD":
+            writes, _, reads = payload.partition(';')
+            tags = parse_writes(writes)
+            reply = await self.write(tags)
+            if reply.startswith("ACK"):
+                reply = await self.__read_handler(reads or ','.join(tags) + ',')
+            return reply
+        elif verb == "STATS":
+            return "ACK=" + self.metrics.format(payload or '*')
+        return "ERR=Unknown command type '%s'" % op
+
+    async def __read_handler(self, payload: str) -> str:
+        if ',' in payload:
+            tags = [tag for tag in payload.split(',') if tag]
+        elif is_pattern(payload):
+            tags = await self.__match_tags(payload)
+            if not tags:
+                return "ERR=No tags match '%s'" % payload
+        else:
+            # single tag, reply is passed through as-is
+            return await self.read(payload)
+        return await self.read_many(tags)
+
+    async def __match_tags(self, pattern: str) -> List[str]:
+        status, _, data = (await self.query()).partition('=')
+        if status != "ACK":
+            return []
+        return fnmatch.filter([tag for tag in data.split(',') if tag], pattern)
@@ -0,0 +1,134 @@
+"""Write batching support.
+
+This module defines the WriteBatcher class, used by the Provider base class
+to merge bursts of WRITE requests (e.g. an RTU writing 20 breaker statuses
+one request at a time) into a single write, so a solver-backed provider
+solves once per burst instead of once per request.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import pybennu.distributed.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBatcher:
+    """
+    Merge writes arriving within window seconds of each other and apply
+    them with a single call to the provider's write().
+
+    Writes are acknowledged as soon as they are queued. Queued writes are
+    applied window seconds after the last one arrived, and at most
+    max_delay seconds after the first one, or as soon as flush() is called.
+    The provider flushes before handling any other request, so reads always
+    see the writes acknowledged before them. When the same tag is written
+    several times in a batch, the last value wins.
+
+    Writes are checked with validate before they are queued, so writes
+    to unknown or read-only tags are rejected with its 'ERR=' reply rather
+    than acknowledged (and counted as writes.rejected). Since the merged
+    write happens after its requests were acknowledged, a batched write
+    that still fails (e.g. the solve fails) is logged and counted
+    (writes.errors) rather than returned to the clients.
+    """
+
+    def __init__(self, write: Callable[[Dict[str, str]], str],
+                 window: float = 0.01, max_delay: float = 0.1,
+                 validate: Optional[Callable[[Dict[str, str]], Optional[str]]] = None) -> None:
+        """
+        Args:
+            write: applies a dictionary of tag values, returns the reply
+            window: seconds to wait for more writes before applying them
+            max_delay: maximum seconds a queued write waits to be applied
+            validate: checks a dictionary of tag values before it is
+                queued, returns an 'ERR=<error message>' reply to reject
+                it or None
+        """
+        self.window = window
+        self.max_delay = max_delay
+        self.__write = write
+        self.__validate = validate
+        self.__pending: Dict[str, str] = {}
+        self.__requests = 0
+        self.__first = 0.0
+        self.__last = 0.0
+        self.__lock = threading.Lock()          # protects the pending writes
+        self.__apply_lock = threading.Lock()    # one merged write at a time
+        self.__queued = threading.Event()
+        self.__stop = threading.Event()
+        self.__metrics = metrics.get_registry()
+
+    def submit(self, tags: Dict[str, str]) -> str:
+        """Queue a write and return its reply."""
+        if self.__validate is not None:
+            error = self.__validate(tags)
+            if error is not None:
+                self.__metrics.count("writes.rejected")
+                return error
+        now = time.monotonic()
+        with self.__lock:
+            if not self.__pending:
+                self.__first = now
+            self.__pending.update(tags)
+            self.__requests += 1
+            self.__last = now
+        self.__queued.set()
+        return "ACK=Queued write of {} tags".format(len(tags))
+
+    def flush(self) -> Optional[str]:
+        """Apply the queued writes now.
+
+        Returns:
+            The reply of the merged write, None if nothing was queued.
+        """
+        with self.__apply_lock:
+            with self.__lock:
+                batch, self.__pending = self.__pending, {}
+                requests, self.__requests = self.__requests, 0
+            if not batch:
+                return None
+
+            self.__metrics.count("writes.batches")
+            self.__metrics.count("writes.requests", requests)
+            try:
+                reply = self.__write(batch)
+            except Exception as e:
+                reply = "ERR=Batched write failed: {}".format(e)
+            if not reply.startswith("ACK"):
+                self.__metrics.count("writes.errors")
+                logger.error("Batched write of %d tags failed: %s", len(batch), reply)
+            return reply
+
+    def stop(self) -> None:
+        """Stop the batching loop, applying the queued writes first."""
+        self.__stop.set()
+        self.__queued.set()
+
+    def run(self) -> None:
+        """Batching loop, applies queued writes when they are due."""
+        while True:
+            self.__queued.wait()
+            if self.__stop.is_set():
+                self.flush()
+                return
+
+            with self.__lock:
+                due = min(self.__last + self.window, self.__first + self.max_delay)
+                # cleared under the lock, so a write queued from here on
+                # wakes the loop up again
+                self.__queued.clear()
+            delay = due - time.monotonic()
+            if delay > 0:
+                if self.__stop.wait(delay):
+                    continue
+                with self.__lock:
+                    due = min(self.__last + self.window, self.__first + self.max_delay)
+                if due > time.monotonic():
+                    # more writes arrived, wait for them too
+                    self.__queued.set()
+                    continue
+            self.flush()
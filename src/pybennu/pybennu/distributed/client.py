@@ -1,9 +1,99 @@
 """pybennu client interface.
 """
 
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
 import zmq
 
 import pybennu.distributed.swig._Endpoint as E
+import pybennu.distributed.transport as transport
+
+
+class ConnectionPool:
+    """ Pool of persistent ZMQ REQ sockets, keyed by endpoint.
+
+    Sockets are reused across requests instead of being created and torn
+    down for each one. Each request waits for its reply with zmq polling,
+    so a timeout never leaves a thread blocked in recv. A REQ socket that
+    timed out or failed can't be used again (it is still waiting for the
+    reply), so it is closed and a fresh socket is connected on the next
+    request to that endpoint.
+
+    Requests wait for their reply forever by default, like a plain REQ
+    socket. Timeouts are opt-in, per pool or per request.
+    """
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        """
+        Args:
+            timeout: default request timeout in seconds, None to wait forever.
+        """
+        self.timeout = timeout
+        self.__lock = threading.Lock()
+        self.__idle: Dict[str, List[zmq.Socket]] = {}
+
+    def request(self, endpoint: str, message: str, timeout: Optional[float] = None) -> str:
+        """ Send a request and return the reply (without the null byte).
+
+        Args:
+            endpoint: endpoint string, e.g. 'tcp://172.16.1.2:5555'
+            message: request message, e.g. 'READ=bus-1.voltage'
+            timeout: seconds to wait for the reply, defaults to self.timeout
+
+        Raises:
+            TimeoutError: no reply was received in time
+            zmq.ZMQError: the request could not be sent
+        """
+        timeout = self.timeout if timeout is None else timeout
+        socket = self.__acquire(endpoint)
+        try:
+            socket.send_string(message+'\0') # must include null byte
+            if timeout is not None and not socket.poll(int(timeout * 1000), zmq.POLLIN):
+                raise TimeoutError("no reply from {} after {} seconds".format(endpoint, timeout))
+            reply = socket.recv_string()
+        except BaseException:
+            transport.close(socket, linger=0)
+            raise
+        self.__release(endpoint, socket)
+        return reply.rstrip('\x00')
+
+    def close(self) -> None:
+        """ Close all idle sockets.
+        """
+        with self.__lock:
+            for sockets in self.__idle.values():
+                for socket in sockets:
+                    transport.close(socket, linger=0)
+            self.__idle.clear()
+
+    def __acquire(self, endpoint: str) -> zmq.Socket:
+        with self.__lock:
+            sockets = self.__idle.get(endpoint)
+            if sockets:
+                return sockets.pop()
+        socket = transport.socket(zmq.REQ)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(endpoint)
+        return socket
+
+    def __release(self, endpoint: str, socket: zmq.Socket) -> None:
+        with self.__lock:
+            self.__idle.setdefault(endpoint, []).append(socket)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """ Return the process-wide connection pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
 
 
 class Client:
@@ -12,48 +102,64 @@ class Client:
     This class implements functionality to connect to a Provider via ZMQ
     sockets and send request messages. Inheriting classes can implement
     their own reply handler by setting self.reply_handler = <custom handler>.
+
+    Requests go through a ConnectionPool (the process-wide one by default),
+    so creating many Client objects for the same endpoint is cheap.
     """
     __kACK = "ACK"
     __kERROR = "ERR"
 
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, timeout=None, pool=None):
         """ Initialize connection environment.
+
+        Args:
+            endpoint: Endpoint object or endpoint string.
+            timeout: request timeout in seconds, defaults to the pool timeout
+                (none for the process-wide pool, requests wait forever).
+            pool: ConnectionPool to use, defaults to the process-wide pool.
         """
         self.__endpoint = endpoint
+        self.timeout = timeout
+        self.__pool = pool if pool is not None else get_pool()
         self.reply_handler = self.__defaultHandler
         self.connect()
 
     def connect(self):
-        """ Connect to Provider listening socket
+        """ Resolve the Provider endpoint.
 
-        This function creates a ZMQ REQ socket and "connects" to it.
+        Sockets are connected (and reconnected) by the connection pool
+        when requests are sent.
         """
-        self.__context = zmq.Context()
-        self.__socket = self.__context.socket(zmq.REQ)
-        self.__socket.setsockopt(zmq.LINGER, 0)
-        self.__socket.connect(E.Endpoint_str_get(self.__endpoint))
+        if isinstance(self.__endpoint, str):
+            self.__address = self.__endpoint
+        else:
+            self.__address = E.Endpoint_str_get(self.__endpoint)
 
     def __defaultHandler(self, reply):
         """ Default reply handler.
         """
         print("Client received reply: %s" % reply)
 
+    def request(self, message):
+        """ Send message to Provider and return the raw reply.
+
+        Raises:
+            TimeoutError: no reply was received in time (only with a timeout)
+        """
+        return self.__pool.request(self.__address, message, self.timeout)
+
     def send(self, message):
         """ Send message to Provider
         """
-        # send update
-        self.__socket.send_string(message+'\0') # must include null byte
-        # get response
-        msg = self.__socket.recv_string()
-        reply = msg.split('=')
-        status = reply[0]
-        data = reply[1]
+        msg = self.request(message)
+        status, _, data = msg.partition('=')
 
         if status == self.__kACK:
             print("I: ACK")
             self.reply_handler(data)
         else:
             print("I: ERR -- %s" % msg)
+        return msg
 
     def write_analog_point(self, tag, value):
         """Updates the analog value of a tag.
@@ -76,3 +182,99 @@ class Client:
         val = "true" if value else "false"
         update = "WRITE=" + tag + ":" + val
         self.send(update)
+
+    def read_points(self, tags: Iterable[str]) -> Dict[str, str]:
+        """Reads several tags with a single request.
+
+        Args:
+            tags: names of the tags to read.
+
+        Returns:
+            Dictionary of tag names to (unparsed) values.
+
+        Raises:
+            RuntimeError: the Provider replied with an error.
+        """
+        # trailing comma makes a single tag use the multi-tag reply format
+        return self.__points(self.request("READ=" + ','.join(tags) + ','))
+
+    def read_matching(self, pattern: str) -> Dict[str, str]:
+        """Reads all tags matching a glob pattern, e.g. 'bus-1.*'.
+
+        Raises:
+            RuntimeError: the Provider replied with an error.
+        """
+        return self.__points(self.request("READ=" + pattern))
+
+    def write_read(self, values: Mapping[str, object],
+                   tags: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Writes tag values and reads tags back with a single request.
+
+        Args:
+            values: dictionary of tag names to values to write.
+            tags: tags to read after the write, defaults to the written tags.
+
+        Raises:
+            RuntimeError: the Provider replied with an error.
+        """
+        writes = ','.join("{}:{}".format(tag, 'true' if value is True else
+                                         'false' if value is False else value)
+                          for tag, value in values.items())
+        reads = ','.join(tags) + ',' if tags else ''
+        return self.__points(self.request("WRITEREAD=" + writes + ';' + reads))
+
+    def state_version(self) -> Tuple[int, float]:
+        """Reads the Provider's state version and its simulation time.
+
+        The reserved tags '_version' and '_sim_time' can also be passed to
+        read_points() or write_read() to get the version of the values read.
+
+        Raises:
+            RuntimeError: the Provider replied with an error.
+        """
+        points = self.read_points(['_version', '_sim_time'])
+        return int(float(points['_version'])), float(points['_sim_time'])
+
+    def stats(self, pattern: str = '') -> Dict[str, float]:
+        """Reads the Provider's request and publish metrics.
+
+        Args:
+            pattern: glob pattern of the metric names, defaults to all.
+
+        Raises:
+            RuntimeError: the Provider replied with an error.
+        """
+        return {name: float(value) for name, value in
+                self.__points(self.request("STATS=" + pattern)).items()}
+
+    def contingencies(self, outages: str = '') -> Dict[str, Dict[str, str]]:
+        """Runs an N-1 contingency analysis on providers that support it
+        (the CONTINGENCY verb, e.g. PyPower).
+
+        Args:
+            outages: 'branch', 'gen' or a glob pattern of device names,
+                defaults to all single outages.
+
+        Returns:
+            Dictionary of outage names to their results (converged,
+            iterations, solve_time, min_voltage, max_loading, ...).
+
+        Raises:
+            RuntimeError: the Provider replied with an error.
+        """
+        results: Dict[str, Dict[str, str]] = {}
+        for tag, value in self.__points(self.request("CONTINGENCY=" + outages)).items():
+            name, _, field = tag.rpartition('.')
+            results.setdefault(name, {})[field] = value
+        return results
+
+    def __points(self, reply: str) -> Dict[str, str]:
+        status, _, data = reply.partition('=')
+        if status != self.__kACK:
+            raise RuntimeError(data or reply)
+        points = {}
+        for point in data.split(','):
+            tag, sep, value = point.partition(':')
+            if sep:
+                points[tag] = value
+        return points
@@ -0,0 +1,627 @@
+"""pybennu publish message codecs.
+
+Text format (the default, and the only format C++ field devices understand):
+
+    <tag>:<value>,<tag>:<value>,...
+
+Some providers (RTDS, OPAL-RT, Siren) wrap the tag values in an envelope:
+
+    Write={<tag>:<value>,<tag>:<value>,...}
+
+Providers can prefix messages with the reserved tags _version (a counter
+bumped on every state update) and _sim_time (the simulation or solve time
+of that update), so subscribers can tell which values belong together.
+
+Binary format (opt-in, Python subscribers only):
+
+    Every binary frame starts with a NUL byte. C++ subscribers read published
+    datagrams as C strings, so they see an empty message and ignore it.
+
+    header:  marker (u8, always 0), version (u8), kind (u8), flags (u8)
+
+    SCHEMA:  header, schema id (u32), part (u16), parts (u16),
+             then entries of tag id (u32), name length (u16), name (utf-8)
+
+    DATA:    header, schema id (u32), sequence (u32), record count (u16),
+             then records of tag id (u32), value type (u8), value
+
+    FRAGMENT: header, frame id (u32), fragment index (u16), fragment count
+              (u16), then a slice of the encoded message
+
+    A schema (the tag dictionary) maps tag ids to tag names. It is announced
+    periodically and whenever a new tag shows up, so subscribers that join
+    late can resync. Data frames refer to the schema they were encoded with
+    by its id. All integers are little-endian.
+
+Fragmented format (opt-in, Python subscribers only):
+
+    Any message (usually a text message) can be encoded once to bytes and
+    sent as FRAGMENT frames. Subscribers reassemble the fragments and handle
+    the result as if it had been received in a single datagram. Fragments
+    are not split on tag boundaries, so a message with a lost fragment is
+    dropped as a whole.
+
+Compression (opt-in, fragmented format only):
+
+    A fragmented message with the COMPRESSED flag set in its header carries
+    a dictionary id (u32) followed by a zlib stream. The stream is
+    compressed with the preset dictionary of that id, or without one if the
+    id is 0. Dictionaries are built from the publisher's tag names (see
+    build_dictionary) and announced periodically as fragmented messages
+    with the DICTIONARY flag set, carrying the dictionary id (u32) followed
+    by the dictionary.
+"""
+
+import numbers
+import struct
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+MARKER = 0x00
+VERSION = 1
+
+KIND_SCHEMA = 1
+KIND_DATA = 2
+KIND_FRAGMENT = 3
+
+# header flags
+FLAG_COMPRESSED = 0x01
+FLAG_DICTIONARY = 0x02
+
+# value types
+TYPE_FALSE = 0
+TYPE_TRUE = 1
+TYPE_FLOAT = 2
+TYPE_INT = 3
+TYPE_STR = 4
+
+HEADER = struct.Struct('<BBBB')
+SCHEMA_HEADER = struct.Struct('<IHH')
+SCHEMA_ENTRY = struct.Struct('<IH')
+DATA_HEADER = struct.Struct('<IIH')
+RECORD = struct.Struct('<IB')
+FRAGMENT_HEADER = struct.Struct('<IHH')
+FLOAT = struct.Struct('<d')
+INT = struct.Struct('<q')
+STR_LEN = struct.Struct('<H')
+
+MAX_RECORDS = 0xFFFF
+MAX_FRAGMENTS = 0xFFFF
+MAX_DICTIONARY = 32768  # zlib only uses the last 32 KiB of a preset dictionary
+DICTIONARY_ID = struct.Struct('<I')
+
+
+class CodecError(ValueError):
+    """Raised when a binary frame can't be decoded."""
+
+
+# ===== Text format =====
+
+def parse_value(value: str) -> Any:
+    """Convert a text value to a bool, float or (failing both) a string.
+
+    This mirrors the way the C++ InputModule interprets published values.
+    """
+    if value == 'true':
+        return True
+    if value == 'false':
+        return False
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def format_value(value: Any) -> str:
+    """Convert a value to its text representation."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def parse_text(message: str) -> Dict[str, str]:
+    """Split a text publish message into a dictionary of raw tag values.
+
+    Points that are empty or don't have a value are skipped.
+    """
+    values = {}
+    for point in message.split(','):
+        tag, sep, value = point.partition(':')
+        if not sep or not tag:
+            continue
+        values[tag] = value.split(':', 1)[0]
+    return values
+
+
+def encode_text(values: Mapping[str, Any]) -> str:
+    """Build a text publish message from a dictionary of tag values."""
+    return ''.join(['{}:{},'.format(tag, format_value(value))
+                    for tag, value in values.items()])
+
+
+def split_envelope(message: str) -> Tuple[str, str, str]:
+    """Split a text publish message into the opening of its envelope (e.g.
+    'Write={'), the tag values and the closing ('}'). The opening and
+    closing are empty for messages without an envelope.
+    """
+    opening, sep, body = message.partition('{')
+    if sep and body.endswith('}') and ':' not in opening and ',' not in opening:
+        return opening + sep, body[:-1], '}'
+    return '', message, ''
+
+
+def join_envelope(opening: str, body: str, closing: str) -> str:
+    """Inverse of split_envelope(), wrap tag values in an envelope."""
+    if not opening:
+        return body
+    return opening + body.rstrip(',') + closing
+
+
+# reserved tags carrying the provider state version (see Provider.state_changed)
+VERSION_TAG = '_version'
+SIM_TIME_TAG = '_sim_time'
+VERSION_TAGS = (VERSION_TAG, SIM_TIME_TAG)
+
+
+def version_values(version: int, sim_time: float) -> Dict[str, Any]:
+    """The reserved version tags of a provider state version."""
+    return {VERSION_TAG: version, SIM_TIME_TAG: sim_time}
+
+
+def pop_version(values: Dict[str, Any]) -> Tuple[Optional[int], Optional[float]]:
+    """Remove the reserved version tags from a dictionary of (raw or typed)
+    tag values and return the version and simulation time, if present.
+    """
+    version = values.pop(VERSION_TAG, None)
+    sim_time = values.pop(SIM_TIME_TAG, None)
+    if version is not None:
+        version = int(float(version))
+    if sim_time is not None:
+        sim_time = float(sim_time)
+    return version, sim_time
+
+
+def is_binary(frame: bytes) -> bool:
+    """True if a received datagram is a binary frame."""
+    return len(frame) >= HEADER.size and frame[0] == MARKER
+
+
+def text_fragments(data: bytes, mtu: int) -> Iterator[memoryview]:
+    """Split an encoded text message into datagrams of at most mtu bytes.
+
+    Datagrams are split after a ',' so each one is a valid text message on
+    its own. A single point longer than the MTU is sent in a datagram of its
+    own rather than cut in half.
+    """
+    view = memoryview(data)
+    size = len(data)
+    start = 0
+    while size - start > mtu:
+        end = data.rfind(b',', start, start + mtu)
+        if end < start:
+            end = data.find(b',', start + mtu)
+            if end < 0:
+                break
+        yield view[start:end + 1]
+        start = end + 1
+    if start < size:
+        yield view[start:]
+
+
+# ===== Binary format =====
+
+def _pack_record(tag_id: int, value: Any) -> bytes:
+    if isinstance(value, bool):
+        return RECORD.pack(tag_id, TYPE_TRUE if value else TYPE_FALSE)
+    if isinstance(value, numbers.Integral) and -2**63 <= value < 2**63:
+        return RECORD.pack(tag_id, TYPE_INT) + INT.pack(value)
+    if isinstance(value, numbers.Real):
+        return RECORD.pack(tag_id, TYPE_FLOAT) + FLOAT.pack(value)
+    raw = format_value(value).encode('utf-8')
+    return RECORD.pack(tag_id, TYPE_STR) + STR_LEN.pack(len(raw)) + raw
+
+
+class BinaryEncoder:
+    """Assigns tag ids and packs tag values into binary frames.
+
+    Frames are split on record boundaries so each one fits in the MTU and
+    can be decoded on its own, i.e. losing a datagram only loses the
+    values that were in it.
+    """
+
+    def __init__(self, mtu: int) -> None:
+        self.mtu = mtu
+        self.schema_id = 0
+        self.__ids: Dict[str, int] = {}
+        self.__names: List[str] = []
+        self.__seq = 0
+
+    def register(self, tags: Iterable[str]) -> bool:
+        """Add any unknown tags to the schema.
+
+        Returns:
+            True if the schema changed and must be announced again.
+        """
+        added = False
+        for tag in tags:
+            if tag not in self.__ids:
+                self.__ids[tag] = len(self.__names)
+                self.__names.append(tag)
+                added = True
+        if added:
+            self.schema_id = zlib.crc32('\n'.join(self.__names).encode('utf-8'))
+        return added
+
+    def schema_frames(self) -> List[bytes]:
+        """Encode the tag dictionary into one or more SCHEMA frames."""
+        prefix = HEADER.size + SCHEMA_HEADER.size
+        parts: List[List[bytes]] = []
+        chunks: List[bytes] = []
+        size = prefix
+        for tag_id, name in enumerate(self.__names):
+            raw = name.encode('utf-8')
+            entry = SCHEMA_ENTRY.pack(tag_id, len(raw)) + raw
+            if chunks and size + len(entry) > self.mtu:
+                parts.append(chunks)
+                chunks = []
+                size = prefix
+            chunks.append(entry)
+            size += len(entry)
+        parts.append(chunks)
+
+        header = HEADER.pack(MARKER, VERSION, KIND_SCHEMA, 0)
+        return [header + SCHEMA_HEADER.pack(self.schema_id, i, len(parts)) + b''.join(c)
+                for i, c in enumerate(parts)]
+
+    def data_frames(self, values: Mapping[str, Any]) -> List[bytes]:
+        """Encode tag values into one or more DATA frames.
+
+        All tags must have been registered first.
+        """
+        prefix = HEADER.size + DATA_HEADER.size
+        groups: List[List[bytes]] = []
+        chunks: List[bytes] = []
+        size = prefix
+        ids = self.__ids
+        for tag, value in values.items():
+            record = _pack_record(ids[tag], value)
+            if chunks and (size + len(record) > self.mtu or len(chunks) == MAX_RECORDS):
+                groups.append(chunks)
+                chunks = []
+                size = prefix
+            chunks.append(record)
+            size += len(record)
+        if chunks:
+            groups.append(chunks)
+
+        header = HEADER.pack(MARKER, VERSION, KIND_DATA, 0)
+        frames = []
+        for chunks in groups:
+            self.__seq = (self.__seq + 1) & 0xFFFFFFFF
+            frames.append(header + DATA_HEADER.pack(self.schema_id, self.__seq, len(chunks))
+                          + b''.join(chunks))
+        return frames
+
+
+class BinaryDecoder:
+    """Decodes binary frames, tracking the schemas announced by publishers."""
+
+    # old schemas are kept around briefly so frames that were in flight
+    # while a schema changed can still be decoded
+    MAX_SCHEMAS = 4
+
+    def __init__(self) -> None:
+        self.__schemas: Dict[int, Dict[int, str]] = {}
+        self.unknown_schema = 0
+        self.unknown_tags = 0
+        self.sequence = 0
+
+    def decode(self, frame: bytes) -> Optional[Dict[str, Any]]:
+        """Decode a binary frame.
+
+        Returns:
+            Dictionary of tag values for DATA frames, None for SCHEMA frames
+            or DATA frames whose schema hasn't been received yet.
+
+        Raises:
+            CodecError: frame is truncated or of an unknown version/kind
+        """
+        try:
+            _, version, kind, _ = HEADER.unpack_from(frame, 0)
+            if version != VERSION:
+                raise CodecError('unsupported frame version {}'.format(version))
+            if kind == KIND_DATA:
+                return self.__decode_data(frame)
+            if kind == KIND_SCHEMA:
+                self.__decode_schema(frame)
+                return None
+        except (struct.error, UnicodeDecodeError, IndexError) as err:
+            raise CodecError('malformed frame: {}'.format(err)) from err
+        raise CodecError('unknown frame kind {}'.format(kind))
+
+    def __decode_schema(self, frame: bytes) -> None:
+        schema_id, _, _ = SCHEMA_HEADER.unpack_from(frame, HEADER.size)
+        names = self.__schemas.get(schema_id)
+        if names is None:
+            if len(self.__schemas) >= self.MAX_SCHEMAS:
+                del self.__schemas[next(iter(self.__schemas))]
+            names = self.__schemas[schema_id] = {}
+
+        offset = HEADER.size + SCHEMA_HEADER.size
+        end = len(frame)
+        while offset < end:
+            tag_id, length = SCHEMA_ENTRY.unpack_from(frame, offset)
+            offset += SCHEMA_ENTRY.size
+            if offset + length > end:
+                raise CodecError('truncated schema entry')
+            names[tag_id] = frame[offset:offset + length].decode('utf-8')
+            offset += length
+
+    def __decode_data(self, frame: bytes) -> Optional[Dict[str, Any]]:
+        schema_id, seq, count = DATA_HEADER.unpack_from(frame, HEADER.size)
+        names = self.__schemas.get(schema_id)
+        if names is None:
+            self.unknown_schema += 1
+            return None
+        self.sequence = seq
+
+        values = {}
+        offset = HEADER.size + DATA_HEADER.size
+        for _ in range(count):
+            tag_id, vtype = RECORD.unpack_from(frame, offset)
+            offset += RECORD.size
+            if vtype == TYPE_FLOAT:
+                value = FLOAT.unpack_from(frame, offset)[0]
+                offset += FLOAT.size
+            elif vtype == TYPE_TRUE:
+                value = True
+            elif vtype == TYPE_FALSE:
+                value = False
+            elif vtype == TYPE_INT:
+                value = INT.unpack_from(frame, offset)[0]
+                offset += INT.size
+            elif vtype == TYPE_STR:
+                length = STR_LEN.unpack_from(frame, offset)[0]
+                offset += STR_LEN.size
+                value = frame[offset:offset + length].decode('utf-8')
+                offset += length
+            else:
+                raise CodecError('unknown value type {}'.format(vtype))
+
+            name = names.get(tag_id)
+            if name is None:
+                self.unknown_tags += 1
+                continue
+            values[name] = value
+        return values
+
+
+# ===== Fragmented format =====
+
+class FragmentEncoder:
+    """Splits encoded messages into FRAGMENT frames.
+
+    Frames are assembled in a single reusable buffer, so the message is only
+    copied once into each datagram.
+    """
+
+    def __init__(self, mtu: int) -> None:
+        self.mtu = mtu
+        self.frame_id = 0
+        self.__buffer = bytearray()
+
+    def frames(self, data: bytes, flags: int = 0) -> Iterator[memoryview]:
+        """Yield the FRAGMENT frames for an encoded message.
+
+        Each yielded frame is only valid until the next one is requested.
+        """
+        prefix = HEADER.size + FRAGMENT_HEADER.size
+        chunk = self.mtu - prefix
+        if chunk <= 0:
+            raise CodecError('MTU too small for fragment frames')
+        count = max(1, -(-len(data) // chunk))
+        if count > MAX_FRAGMENTS:
+            raise CodecError('message too large ({} bytes)'.format(len(data)))
+
+        if len(self.__buffer) != self.mtu:
+            self.__buffer = bytearray(self.mtu)
+        buffer = self.__buffer
+        view = memoryview(data)
+        out = memoryview(buffer)
+
+        self.frame_id = (self.frame_id + 1) & 0xFFFFFFFF
+        HEADER.pack_into(buffer, 0, MARKER, VERSION, KIND_FRAGMENT, flags)
+        for index in range(count):
+            part = view[index * chunk:(index + 1) * chunk]
+            FRAGMENT_HEADER.pack_into(buffer, HEADER.size, self.frame_id, index, count)
+            buffer[prefix:prefix + len(part)] = part
+            yield out[:prefix + len(part)]
+
+
+class FragmentAssembler:
+    """Reassembles FRAGMENT frames into messages.
+
+    Only a few messages are kept pending at a time. A pending message is
+    given up on (and its missing fragments counted as lost) once a frame
+    MAX_PENDING messages newer shows up. The ids of the last few completed
+    messages are remembered, so a late copy of one of their fragments is
+    counted as a duplicate instead of starting a message that can never
+    complete.
+
+    Counters:
+        messages: messages reassembled
+        fragments: fragments received
+        lost: fragments missing from messages that were given up on
+        out_of_order: fragments received after a later fragment or message
+        duplicates: fragments received more than once
+        incomplete: messages dropped because of lost fragments
+    """
+
+    MAX_PENDING = 4
+
+    def __init__(self) -> None:
+        self.__pending: Dict[int, List[Optional[bytes]]] = {}
+        self.__last_index: Dict[int, int] = {}
+        self.__completed: Deque[int] = deque(maxlen=2 * self.MAX_PENDING)
+        self.__newest: Optional[int] = None
+        self.messages = 0
+        self.fragments = 0
+        self.lost = 0
+        self.out_of_order = 0
+        self.duplicates = 0
+        self.incomplete = 0
+
+    def counters(self) -> Dict[str, int]:
+        """Current counter values."""
+        return {
+            'messages': self.messages,
+            'fragments': self.fragments,
+            'lost': self.lost,
+            'out_of_order': self.out_of_order,
+            'duplicates': self.duplicates,
+            'incomplete': self.incomplete,
+        }
+
+    def add(self, frame: bytes) -> Optional[Tuple[int, bytes]]:
+        """Add a FRAGMENT frame.
+
+        Returns:
+            The header flags and the reassembled message once all of its
+            fragments were received, None otherwise.
+
+        Raises:
+            CodecError: frame is malformed
+        """
+        try:
+            _, version, kind, flags = HEADER.unpack_from(frame, 0)
+            frame_id, index, count = FRAGMENT_HEADER.unpack_from(frame, HEADER.size)
+        except struct.error as err:
+            raise CodecError('malformed frame: {}'.format(err)) from err
+        if version != VERSION or kind != KIND_FRAGMENT:
+            raise CodecError('not a fragment frame')
+        if count == 0 or index >= count:
+            raise CodecError('bad fragment index {}/{}'.format(index, count))
+        self.fragments += 1
+
+        if self.__newest is None or _newer(frame_id, self.__newest):
+            self.__newest = frame_id
+            self.__expire()
+        elif frame_id != self.__newest:
+            self.out_of_order += 1
+
+        parts = self.__pending.get(frame_id)
+        if parts is None:
+            if frame_id in self.__completed:
+                self.duplicates += 1
+                return None
+            if frame_id != self.__newest \
+                    and (self.__newest - frame_id) & 0xFFFFFFFF >= self.MAX_PENDING:
+                # message was already completed or given up on
+                return None
+            parts = self.__pending[frame_id] = [None] * count
+        elif len(parts) != count:
+            raise CodecError('inconsistent fragment count for frame {}'.format(frame_id))
+
+        if parts[index] is not None:
+            self.duplicates += 1
+            return None
+        if index < self.__last_index.get(frame_id, -1):
+            self.out_of_order += 1
+        self.__last_index[frame_id] = index
+        parts[index] = bytes(frame[HEADER.size + FRAGMENT_HEADER.size:])
+
+        if any(part is None for part in parts):
+            return None
+        del self.__pending[frame_id]
+        del self.__last_index[frame_id]
+        self.__completed.append(frame_id)
+        self.messages += 1
+        return flags, b''.join(parts)
+
+    def __expire(self) -> None:
+        newest = self.__newest
+        for frame_id in list(self.__pending):
+            if (newest - frame_id) & 0xFFFFFFFF >= self.MAX_PENDING:
+                parts = self.__pending.pop(frame_id)
+                del self.__last_index[frame_id]
+                self.lost += sum(1 for part in parts if part is None)
+                self.incomplete += 1
+
+
+def _newer(a: int, b: int) -> bool:
+    """True if u32 sequence number a comes after b (with wrap-around)."""
+    return a != b and (a - b) & 0xFFFFFFFF < 0x80000000
+
+
+# ===== Compression =====
+
+def build_dictionary(tags: Iterable[str]) -> bytes:
+    """Build a zlib preset dictionary from tag names.
+
+    The dictionary holds '<tag>:' for every tag, so each tag name in a text
+    message compresses to a back reference. zlib favours the end of the
+    dictionary, and only uses its last MAX_DICTIONARY bytes.
+    """
+    data = ','.join([tag + ':' for tag in tags]).encode('utf-8')
+    return data[-MAX_DICTIONARY:]
+
+
+def dictionary_id(dictionary: bytes) -> int:
+    """Id of a preset dictionary, never 0 (which means no dictionary)."""
+    return zlib.crc32(dictionary) or 1
+
+
+def compress(data: bytes, dictionary: Optional[bytes] = None, level: int = 6) -> bytes:
+    """Compress a message, returning the payload of a COMPRESSED message."""
+    if dictionary:
+        compressor = zlib.compressobj(level, zdict=dictionary)
+        did = dictionary_id(dictionary)
+    else:
+        compressor = zlib.compressobj(level)
+        did = 0
+    return DICTIONARY_ID.pack(did) + compressor.compress(data) + compressor.flush()
+
+
+class Decompressor:
+    """Decompresses COMPRESSED messages, tracking announced dictionaries."""
+
+    MAX_DICTIONARIES = 4
+
+    def __init__(self) -> None:
+        self.__dictionaries: Dict[int, bytes] = {}
+        self.unknown_dictionary = 0
+
+    def add_dictionary(self, payload: bytes) -> None:
+        """Store the dictionary announced by a DICTIONARY message."""
+        try:
+            (did,) = DICTIONARY_ID.unpack_from(payload, 0)
+        except struct.error as err:
+            raise CodecError('malformed dictionary: {}'.format(err)) from err
+        if did not in self.__dictionaries and len(self.__dictionaries) >= self.MAX_DICTIONARIES:
+            del self.__dictionaries[next(iter(self.__dictionaries))]
+        self.__dictionaries[did] = bytes(payload[DICTIONARY_ID.size:])
+
+    def decompress(self, payload: bytes) -> Optional[bytes]:
+        """Decompress a COMPRESSED message.
+
+        Returns:
+            The message, or None if its dictionary hasn't been received yet.
+
+        Raises:
+            CodecError: payload is corrupt
+        """
+        try:
+            (did,) = DICTIONARY_ID.unpack_from(payload, 0)
+            if did:
+                dictionary = self.__dictionaries.get(did)
+                if dictionary is None:
+                    self.unknown_dictionary += 1
+                    return None
+                decompressor = zlib.decompressobj(zdict=dictionary)
+            else:
+                decompressor = zlib.decompressobj()
+            data = decompressor.decompress(payload[DICTIONARY_ID.size:])
+            return data + decompressor.flush()
+        except (struct.error, zlib.error) as err:
+            raise CodecError('corrupt compressed message: {}'.format(err)) from err
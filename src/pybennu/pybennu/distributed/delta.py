@@ -0,0 +1,96 @@
+"""Delta publishing support.
+
+This module defines the DeltaTracker class, used by the Provider base class
+to publish only the tags whose values changed since they were last published.
+"""
+
+import fnmatch
+import numbers
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Tuple
+
+import pybennu.distributed.codec as codec
+
+
+class DeltaTracker:
+    """
+    Track the last published value of each tag and filter out unchanged ones.
+
+    A tag is considered changed if its value differs from the last published
+    value by more than its deadband: max(absolute, relative * abs(last)).
+    Non-numeric values (including booleans) change whenever they differ.
+
+    Every keyframe_interval seconds all tags are let through, so subscribers
+    that joined late (or missed datagrams) resync.
+    """
+
+    def __init__(self, keyframe_interval: float = 10.0,
+                 absolute: float = 0.0, relative: float = 0.0) -> None:
+        self.keyframe_interval = keyframe_interval
+        self.__default: Tuple[float, float] = (absolute, relative)
+        self.__patterns: List[Tuple[str, Tuple[float, float]]] = []
+        self.__deadbands: Dict[str, Tuple[float, float]] = {}  # resolved per tag
+        self.__last: Dict[str, Any] = {}
+        self.__last_keyframe = 0.0
+        self.__lock = threading.Lock()
+
+    def set_deadband(self, pattern: str, absolute: float = 0.0, relative: float = 0.0) -> None:
+        """
+        Set the deadband for tags matching a glob pattern, e.g. '*.voltage'.
+
+        Patterns set later take precedence over patterns set earlier.
+        """
+        with self.__lock:
+            self.__patterns.insert(0, (pattern, (absolute, relative)))
+            self.__deadbands.clear()
+
+    def reset(self) -> None:
+        """Forget all published values, so the next filter is a keyframe."""
+        with self.__lock:
+            self.__last.clear()
+            self.__last_keyframe = 0.0
+
+    def filter(self, values: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        Return the tags that must be published and record them as published.
+
+        Text values are compared after conversion with codec.parse_value,
+        but returned unchanged.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            last = self.__last
+            if now - self.__last_keyframe >= self.keyframe_interval:
+                self.__last_keyframe = now
+                for tag, value in values.items():
+                    last[tag] = codec.parse_value(value) if isinstance(value, str) else value
+                return dict(values)
+
+            changed = {}
+            for tag, value in values.items():
+                current = codec.parse_value(value) if isinstance(value, str) else value
+                if tag not in last or self.__exceeds(tag, last[tag], current):
+                    last[tag] = current
+                    changed[tag] = value
+            return changed
+
+    def __exceeds(self, tag: str, previous: Any, current: Any) -> bool:
+        if isinstance(current, bool) or isinstance(previous, bool) \
+                or not isinstance(current, numbers.Real) \
+                or not isinstance(previous, numbers.Real):
+            return current != previous
+
+        deadband = self.__deadbands.get(tag)
+        if deadband is None:
+            deadband = self.__default
+            for pattern, band in self.__patterns:
+                if fnmatch.fnmatchcase(tag, pattern):
+                    deadband = band
+                    break
+            self.__deadbands[tag] = deadband
+
+        absolute, relative = deadband
+        if not absolute and not relative:
+            return current != previous
+        return abs(current - previous) > max(absolute, relative * abs(previous))
@@ -0,0 +1,164 @@
+"""pybennu metrics.
+
+This module defines a small, thread-safe metrics registry (counters and
+latency histograms) used to instrument providers, servers and publishers.
+A process-wide registry is returned by get_registry().
+
+Metrics are reported as a text message in the same format as published
+data and multi-tag READ replies:
+
+    <name>:<value>,<name>:<value>,...
+
+Histograms are reported as <name>.count, .mean, .p50, .p95, .p99 and .max,
+in seconds.
+"""
+
+import bisect
+import fnmatch
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class Histogram:
+    """Latency histogram with logarithmic buckets.
+
+    Buckets go from 1 us to 100 s with 20 buckets per decade, so percentiles
+    are accurate to about 12%. Values outside that range are clamped.
+    """
+
+    BOUNDS: List[float] = [10 ** (i / 20.0) * 1e-6 for i in range(0, 161)]
+
+    def __init__(self) -> None:
+        self.__buckets = [0] * len(self.BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record a value (in seconds)."""
+        index = min(bisect.bisect_left(self.BOUNDS, value), len(self.BOUNDS) - 1)
+        self.__buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (0-100)."""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, n in zip(self.BOUNDS, self.__buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Count, mean, p50, p95, p99 and max."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """Registry of named counters and histograms."""
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__counters: Dict[str, float] = {}
+        self.__histograms: Dict[str, Histogram] = {}
+        self.__dump_stop: Optional[threading.Event] = None
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add value to a counter."""
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration in a histogram."""
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Record the duration of a with block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self) -> None:
+        """Clear all counters and histograms."""
+        with self.__lock:
+            self.__counters.clear()
+            self.__histograms.clear()
+
+    def snapshot(self, pattern: str = '*') -> Dict[str, float]:
+        """All metrics whose name matches a glob pattern, flattened."""
+        values: Dict[str, float] = {}
+        with self.__lock:
+            for name, value in self.__counters.items():
+                if fnmatch.fnmatchcase(name, pattern):
+                    values[name] = value
+            for name, histogram in self.__histograms.items():
+                if fnmatch.fnmatchcase(name, pattern):
+                    for key, value in histogram.summary().items():
+                        values['{}.{}'.format(name, key)] = value
+        return dict(sorted(values.items()))
+
+    def format(self, pattern: str = '*') -> str:
+        """Metrics as a '<name>:<value>,...' text message."""
+        return ''.join(['{}:{:.6g},'.format(name, value)
+                        for name, value in self.snapshot(pattern).items()])
+
+    def start_dump(self, interval: float,
+                   output: Callable[[str], None] = print) -> None:
+        """Output all metrics every interval seconds from a daemon thread."""
+        self.stop_dump()
+        stop = self.__dump_stop = threading.Event()
+
+        def dump():
+            while not stop.wait(interval):
+                output("Stats: " + self.format())
+
+        threading.Thread(target=dump, name="metrics-dump", daemon=True).start()
+
+    def stop_dump(self) -> None:
+        """Stop the periodic dump thread, if any."""
+        if self.__dump_stop:
+            self.__dump_stop.set()
+            self.__dump_stop = None
+
+
+class Sampler:
+    """Returns True once every `every` calls, e.g. to sample debug logging."""
+
+    def __init__(self, every: int = 100) -> None:
+        self.every = every
+        self.__calls = itertools.count()
+
+    def __call__(self) -> bool:
+        return self.every > 0 and next(self.__calls) % self.every == 0
+
+
+_registry = Metrics()
+
+
+def get_registry() -> Metrics:
+    """ Return the process-wide metrics registry.
+    """
+    return _registry
@@ -5,11 +5,51 @@ This module defines the pybennu Provider base class. It is the interface which
 all providers will implement.
 """
 
+import fnmatch
+import logging
 import threading
+import time
 from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
 
+import pybennu.distributed.codec as codec
+import pybennu.distributed.metrics as metrics
 import pybennu.distributed.publisher as publisher
 import pybennu.distributed.server as server
+from pybennu.distributed.batch import WriteBatcher
+from pybennu.distributed.delta import DeltaTracker
+from pybennu.distributed.scheduler import ChangePublisher, PublishScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def parse_writes(payload: str) -> Dict[str, str]:
+    """Parse a WRITE payload ('<tag>:<value>,...') into a dictionary."""
+    tags = {}
+    for tag in payload.split(','):
+        if tag:
+            split = tag.split(':')
+            tags[split[0]] = split[1]
+    return tags
+
+
+def merge_reads(tags: List[str], replies: List[str]) -> str:
+    """Merge single-tag READ replies into one 'ACK=<tag>:<value>,...' reply."""
+    pairs = []
+    for tag, reply in zip(tags, replies):
+        status, _, data = reply.partition('=')
+        if status != "ACK":
+            return "ERR=Failed to read tag '{}': {}".format(tag, data)
+        # some providers already reply with '<tag>:<value>'
+        if not data.startswith(tag + ':'):
+            data = tag + ':' + data
+        pairs.append(data)
+    return "ACK=" + ','.join(pairs)
+
+
+def is_pattern(payload: str) -> bool:
+    """True if a READ payload is a glob pattern rather than a tag name."""
+    return any(c in payload for c in '*?[')
 
 
 class Provider(ABC):
@@ -22,17 +62,66 @@ class Provider(ABC):
     - read(tag)
     - write(tags)
     - periodic_publish()
+
+    Providers that implement snapshot() can also publish with a
+    PublishScheduler (see enable_publish_scheduler()) instead of their
+    periodic_publish() loop, and publish as soon as their state changes
+    (see enable_change_publish() and state_changed()).
+
+    Every call to state_changed() bumps the provider state version. With
+    publish_version set, published messages are prefixed with the version
+    and simulation time (see codec.VERSION_TAGS), and they can always be
+    read like any other tag, e.g. 'READ=bus-1.voltage,_version,_sim_time'.
+
+    Providers can handle request verbs of their own by listing them in
+    commands and implementing command().
+
+    Writes (WRITE, WRITEREAD and batched writes) are applied one at a
+    time. READ, QUERY and provider-specific requests don't wait for them:
+    served concurrently (see set_server_workers()), they only see the state
+    before or after a write, never halfway through it, if the provider
+    swaps new state in whole once a write is done, e.g. by serving reads
+    from an immutable snapshot of its values as PyPower does. Providers that
+    change their state outside of requests (e.g. from a background thread)
+    must serialize that with write() themselves.
     """
 
+    # request verbs that change the provider state
+    write_verbs: Tuple[str, ...] = ("WRITE", "WRITEREAD")
+
+    # provider-specific request verbs, handled by command()
+    commands: Tuple[str, ...] = ()
+
     def __init__(self, server_endpoint: str, publish_endpoint: str) -> None:
         """Initialize connection environment."""
         self.__publisher = publisher.Publisher(publish_endpoint)
+        self.__delta: Optional[DeltaTracker] = None
+        self.__scheduler: Optional[PublishScheduler] = None
+        self.__change: Optional[ChangePublisher] = None
+        self.__batcher: Optional[WriteBatcher] = None
+
+        # writes are applied one at a time, reads don't wait for them
+        self.__write_lock = threading.Lock()
+
+        # state version, bumped by state_changed(). It starts from the
+        # startup time in microseconds so it keeps increasing across restarts.
+        self.publish_version = False
+        self.__version = int(time.time() * 1e6)
+        self.__sim_time = 0.0
+        self.__version_lock = threading.Lock()
+
+        # request metrics, reported by the STATS verb
+        self.metrics = metrics.get_registry()
+        self.debug_sample = metrics.Sampler(100)
 
         self.__publish_thread = threading.Thread(target=self.periodic_publish)
         self.__publish_thread.daemon = True
 
-        self.__server = server.Server(server_endpoint)
-        self.__server.request_handler = self.__message_handler
+        # the server is created in run(), so the server mode can be chosen
+        # with set_server_workers() after the provider is initialized
+        self.__server_endpoint = server_endpoint
+        self.__server_workers = 0
+        self.__server = None
 
     @abstractmethod
     def query(self) -> str:
@@ -69,50 +158,331 @@ class Provider(ABC):
         """
         pass
 
-    def publish(self, msg: str) -> None:
-        """Publish message using publisher."""
-        self.__publisher.publish(msg)
+    def command(self, verb: str, payload: str) -> str:
+        """
+        Handle a provider-specific request verb.
+
+        Inheriting providers list their own verbs in commands and implement
+        this. It is called without holding the write lock, so long-running
+        commands should copy the state they need and work on the copy.
+        Must return 'ACK=<reply>' or 'ERR=<error message>'.
+        """
+        return "ERR=Unknown command type '{}'".format(verb)
+
+    def validate_write(self, tags: Dict[str, str]) -> Optional[str]:
+        """
+        Check a write before it is queued for batching.
+
+        Returns 'ERR=<error message>' if write() would reject the tags or
+        values, None otherwise. The default implementation accepts every
+        write, inheriting providers that batch writes implement this so
+        clients aren't acknowledged writes that can't be applied.
+        """
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return the current value of every published tag.
+
+        Inheriting providers implement this to support scheduled publishing.
+        """
+        raise NotImplementedError(
+            "{} doesn't support scheduled publishing".format(type(self).__name__))
+
+    @property
+    def publisher(self) -> publisher.Publisher:
+        """The Publisher used by this provider, e.g. to enable binary mode."""
+        return self.__publisher
+
+    def enable_delta_publish(self, keyframe_interval: float = 10.0,
+                             absolute: float = 0.0, relative: float = 0.0) -> DeltaTracker:
+        """
+        Only publish tags whose value changed since they were last published.
+
+        All tags are still published every keyframe_interval seconds so late
+        joiners can resync. The default deadband (absolute and/or relative)
+        applies to every numeric tag, per-tag deadbands can be set with
+        set_deadband() on the returned DeltaTracker.
+        """
+        self.__delta = DeltaTracker(keyframe_interval, absolute, relative)
+        return self.__delta
+
+    def enable_publish_scheduler(self, default_rate: float = 1.0,
+                                 change_interval: float = 0.1,
+                                 keyframe_interval: float = 10.0) -> PublishScheduler:
+        """
+        Publish tags in rate classes from snapshot() instead of running
+        periodic_publish(). Classes are added and tags assigned to them on
+        the returned PublishScheduler. Must be called before run().
+
+        Delta publishing doesn't apply to scheduled publishes, on-change
+        classes serve the same purpose.
+
+        Raises:
+            NotImplementedError: the provider doesn't implement snapshot()
+        """
+        self.__require_snapshot("scheduled publishing")
+        self.__scheduler = PublishScheduler(
+            self.snapshot, lambda values: self.__publisher.publish(self.__versioned(values)),
+            default_rate, change_interval, keyframe_interval)
+        return self.__scheduler
+
+    def enable_change_publish(self, window: float = 0.01,
+                              min_interval: float = 0.1) -> ChangePublisher:
+        """
+        Publish the current state (from snapshot()) window seconds after the
+        provider calls state_changed(), e.g. after a write triggered a solve,
+        instead of waiting for the next periodic publish. Publishes are at
+        least min_interval seconds apart. Must be called before run().
+
+        Raises:
+            NotImplementedError: the provider doesn't implement snapshot()
+        """
+        self.__require_snapshot("change publishing")
+        self.__change = ChangePublisher(
+            lambda: self.publish(self.snapshot()), window, min_interval)
+        return self.__change
+
+    def __require_snapshot(self, feature: str) -> None:
+        if type(self).snapshot is Provider.snapshot:
+            raise NotImplementedError("{} doesn't implement snapshot(), required for {}".format(
+                type(self).__name__, feature))
+
+    def enable_write_batching(self, window: float = 0.01,
+                              max_delay: float = 0.1) -> WriteBatcher:
+        """
+        Merge WRITE requests arriving within window seconds of each other
+        into a single write() call, applied at most max_delay seconds after
+        the first one. WRITE requests are checked with validate_write()
+        and acknowledged once queued, any other request first applies the
+        queued writes. Must be called before run().
+        """
+        self.__batcher = WriteBatcher(self.__locked_write, window, max_delay,
+                                      self.validate_write)
+        return self.__batcher
+
+    def __locked_write(self, tags: Dict[str, str]) -> str:
+        with self.__write_lock:
+            return self.write(tags)
+
+    def state_changed(self, sim_time: Optional[float] = None) -> None:
+        """
+        Signal that the provider state changed. Inheriting providers call
+        this after updating their state (while still holding the lock that
+        protects it, if any), with the simulation time of the update when
+        they know it. It bumps the state version and, if change publishing
+        is enabled, triggers a publish.
+        """
+        with self.__version_lock:
+            self.__version += 1
+            self.__sim_time = time.time() if sim_time is None else sim_time
+        if self.__change:
+            self.__change.notify()
+
+    def version(self) -> Tuple[int, float]:
+        """The current state version and its simulation time."""
+        with self.__version_lock:
+            return self.__version, self.__sim_time
+
+    def publish(self, msg, version: Optional[Tuple[int, float]] = None) -> None:
+        """
+        Publish message using publisher.
+
+        The message can be a text message or a dictionary of tag values.
+        If delta publishing is enabled, unchanged tags are filtered out
+        (text messages keep their envelope, see codec.split_envelope()).
+        If publish_version is set, the message is prefixed with the state
+        version, the current one unless the version (as returned by
+        version()) the message was built from is given.
+        """
+        if self.__delta:
+            opening = closing = ''
+            if isinstance(msg, str):
+                opening, body, closing = codec.split_envelope(msg)
+                msg = codec.parse_text(body)
+            msg = self.__delta.filter(msg)
+            if not msg:
+                return
+            if opening:
+                msg = codec.join_envelope(opening, codec.encode_text(msg), closing)
+        self.__publisher.publish(self.__versioned(msg, version))
+
+    def __versioned(self, msg, version: Optional[Tuple[int, float]] = None):
+        if not self.publish_version:
+            return msg
+        values = codec.version_values(*(version or self.version()))
+        if isinstance(msg, str):
+            # the version tags go inside the envelope, if any
+            opening, body, closing = codec.split_envelope(msg)
+            return codec.join_envelope(opening, codec.encode_text(values) + body, closing)
+        values.update(msg)
+        return values
+
+    def set_server_workers(self, workers: int) -> None:
+        """
+        Serve requests from a pool of worker threads instead of a single
+        REP loop, so READ and QUERY requests are served concurrently with
+        each other and with the write in progress. Writes are still
+        processed one at a time. Must be called before run().
+        """
+        self.__server_workers = workers
 
     def run(self) -> None:
         """Start periodic publish thread and server."""
+        if self.__server_workers > 0:
+            self.__server = server.WorkerServer(self.__server_endpoint, self.__server_workers)
+        else:
+            self.__server = server.Server(self.__server_endpoint)
+        self.__server.request_handler = self.__message_handler
+
+        if self.__scheduler:
+            # scheduled classes replace the periodic publish loop
+            self.__publish_thread = threading.Thread(target=self.__scheduler.run)
+            self.__publish_thread.daemon = True
         self.__publish_thread.start()
+        if self.__change:
+            threading.Thread(target=self.__change.run, daemon=True).start()
+        if self.__batcher:
+            threading.Thread(target=self.__batcher.run, daemon=True).start()
         self.__server.run()
 
+    def read_many(self, tags: List[str]) -> str:
+        """
+        Read the current values of several tags.
+
+        Returns 'ACK=tag1:value1,tag2:value2,...' or 'ERR=<error message>'
+        if any of the tags can't be read. The default implementation calls
+        read() for each tag, providers can override it to read all the
+        values under a single lock.
+        """
+        return merge_reads(tags, [self.read(tag) for tag in tags])
+
+    def __match_tags(self, pattern: str) -> List[str]:
+        status, _, data = self.query().partition('=')
+        if status != "ACK":
+            return []
+        return fnmatch.filter([tag for tag in data.split(',') if tag], pattern)
+
+    def __read_handler(self, payload: str) -> str:
+        if ',' in payload:
+            tags = [tag for tag in payload.split(',') if tag]
+        elif is_pattern(payload):
+            tags = self.__match_tags(payload)
+            if not tags:
+                return "ERR=No tags match '%s'" % payload
+        elif payload in codec.VERSION_TAGS:
+            return "ACK=" + codec.format_value(
+                dict(zip(codec.VERSION_TAGS, self.version()))[payload])
+        else:
+            # single tag, reply is passed through as-is
+            return self.read(payload)
+
+        reserved = [tag for tag in tags if tag in codec.VERSION_TAGS]
+        if not reserved:
+            return self.read_many(tags)
+
+        # the version read before the values, they are at least that recent
+        version = dict(zip(codec.VERSION_TAGS, self.version()))
+        tags = [tag for tag in tags if tag not in codec.VERSION_TAGS]
+        reply = self.read_many(tags) if tags else "ACK="
+        if reply.startswith("ACK"):
+            pairs = ['{}:{}'.format(tag, codec.format_value(version[tag])) for tag in reserved]
+            reply += (',' if tags else '') + ','.join(pairs)
+        return reply
+
     def __message_handler(self, message: str) -> str:
         """
         Message requests should be in the form:
             QUERY=
             READ=<tag name>
+            READ=<tag name>,<tag name>[,...]
+            READ=<glob pattern>
             WRITE=<tag name>:<value>[,<tag name>:<value>,...]
             WRITE={tag name:value, tag name:value}
+            WRITEREAD=<tag name>:<value>[,...][;<tag name>[,<tag name>,...]]
+            STATS=[<glob pattern>]
+            <VERB>=<payload>  (provider-specific, see command())
+
+        Note that the WRITE example with braces above uses a JSON blob as the
+        payload instead of a plain ol' string.
+
+        A READ of a single tag returns the reply of read() unchanged. A READ
+        of several tags (a single tag followed by a comma counts too) or of
+        a glob pattern such as 'bus-1.*' returns a single
+        'ACK=<tag>:<value>,...' reply. WRITEREAD writes the given values and
+        then reads the listed tags (the written tags if none are listed).
+        STATS returns the request and publish metrics (see
+        pybennu.distributed.metrics) as 'ACK=<name>:<value>,...'.
 
-        Note that the last example above uses a JSON blob as the payload
-        instead of a plain ol' string.
+        The reserved tags _version and _sim_time can be read along with any
+        other tags, they reply with the state version the values read are
+        at least as recent as (see state_changed()).
+
+        With write batching enabled (see enable_write_batching()), WRITE
+        replies as soon as the write is validated and queued.
+
+        Requests and replies are logged at debug level, for one request out
+        of every debug_sample.every.
         """
         if not message:
             return "ERR=Message empty"
         elif '=' not in message:
             return "ERR=Invalid message request"
 
-        split = message.split('=')
-        op = split[0]
-        payload = split[1]
-        print("Received %s request with payload %s" % (op, payload))
+        op, _, payload = message.partition('=')
+        verb = op.upper()
+        debug = logger.isEnabledFor(logging.DEBUG) and self.debug_sample()
+        if debug:
+            logger.debug("Received %s request with payload %s", op, payload)
+
+        start = time.perf_counter()
+        reply = self.__dispatch(verb, op, payload)
+        elapsed = time.perf_counter() - start
+
+        if verb not in ("QUERY", "READ", "WRITE", "WRITEREAD", "STATS") \
+                and verb not in self.commands:
+            verb = "UNKNOWN"
+        self.metrics.count("requests." + verb)
+        if not reply.startswith("ACK"):
+            self.metrics.count("errors." + verb)
+        self.metrics.observe("latency." + verb, elapsed)
+
+        if debug:
+            logger.debug("Sending reply for payload %s -- %s", payload, reply)
+        return reply
+
+    def __dispatch(self, verb: str, op: str, payload: str) -> str:
+        if self.__batcher:
+            if verb == "WRITE":
+                return self.__batcher.submit(parse_writes(payload))
+            # read your writes
+            self.__batcher.flush()
+
+        if verb == "STATS":
+            return "ACK=" + self.metrics.format(payload or '*')
 
+        if verb in self.write_verbs:
+            with self.__write_lock:
+                return self.__handle(verb, op, payload)
+        return self.__handle(verb, op, payload)
+
+    def __handle(self, verb: str, op: str, payload: str) -> str:
         reply = ""
-        if op == "QUERY" or op == "query":
+        if verb == "QUERY":
             reply += self.query()
-        elif op == "READ" or op == "read":
-            reply += self.read(payload)
-        elif op == "WRITE" or op == "write":
-            tags = {}
-            for tag in payload.split(','):
-                if tag:
-                    split = tag.split(':')
-                    tags[split[0]] = split[1]
+        elif verb == "READ":
+            reply += self.__read_handler(payload)
+        elif verb == "WRITE":
+            reply += self.write(parse_writes(payload))
+        elif verb == "WRITEREAD":
+            writes, _, reads = payload.partition(';')
+            tags = parse_writes(writes)
             reply += self.write(tags)
+            if reply.startswith("ACK"):
+                reads = reads or ','.join(tags) + ','
+                reply = self.__read_handler(reads)
+        elif verb in self.commands:
+            reply += self.command(verb, payload)
         else:
-            reply += "ERR=Unknown command type '%s'", op
-
-        print("Sending reply for payload %s -- %s" % (payload, reply))
+            reply += "ERR=Unknown command type '%s'" % op
         return reply
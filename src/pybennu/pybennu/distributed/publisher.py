@@ -3,9 +3,15 @@
 This module defines the Publisher base class.
 """
 
+import time
+
 import zmq
 
+import pybennu.distributed.codec as codec
+import pybennu.distributed.metrics as metrics
+import pybennu.distributed.shm as shm
 import pybennu.distributed.swig._Endpoint as E
+import pybennu.distributed.transport as transport
 
 
 class Publisher:
@@ -13,12 +19,45 @@ class Publisher:
 
     This class implements functionality to connect to a ZMQ RADIO socket and
     publish data.
+
+    Messages are published in the text format by default. Setting
+    ``binary = True`` switches to the binary format (see
+    pybennu.distributed.codec), which only Python subscribers understand.
+
+    Text messages larger than the MTU are split on tag boundaries into
+    several datagrams. Setting ``fragment = True`` instead sends them as
+    numbered fragments that Python subscribers reassemble into the complete
+    message (and count lost fragments for).
+
+    Setting ``compress = True`` zlib-compresses each message before sending
+    it as fragments (Python subscribers only). Text messages are compressed
+    with a preset dictionary of the tag names, built from the first message
+    published or set with set_dictionary(), and announced to subscribers
+    every schema_interval seconds.
+
+    A 'shm://<name>' endpoint publishes to a shared-memory ring instead of
+    UDP, for subscribers on the same host (see pybennu.distributed.shm).
+    Messages are then written whole rather than split to fit the MTU.
+
+    Publish durations, messages, datagrams and bytes sent are recorded in
+    the process-wide metrics registry.
     """
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, binary=False):
         """ Initialize connection environment.
         """
         self.MTU = 1465
 
+        # binary mode settings
+        self.binary = binary
+        self.schema_interval = 5.0  # seconds between schema announcements
+
+        # fragmented text mode
+        self.fragment = False
+
+        # compressed mode settings
+        self.compress = False
+        self.compression_level = 6
+
         if isinstance(endpoint, str):
             # if using a DynamicSimulatorSettings class, endpoint needs to be converted to an actual endpoint
             self.__endpoint = E.new_Endpoint()
@@ -27,38 +66,114 @@ class Publisher:
             self.__endpoint = endpoint
 
         self.__group = E.Endpoint_hash(self.__endpoint)
+        self.__encoder = codec.BinaryEncoder(self.MTU)
+        self.__fragmenter = codec.FragmentEncoder(self.MTU)
+        self.__last_schema = 0.0
+        self.__dictionary = None
+        self.__last_dictionary = 0.0
+        self.__metrics = metrics.get_registry()
         self.connect()
 
     def connect(self):
         """ Connect to publish socket
 
-        This function creates a ZMQ RADIO socket and "connects" to it.
+        This function creates a ZMQ RADIO socket and "connects" to it, or
+        opens the shared-memory ring of a 'shm://' endpoint.
         """
-        self.__context = zmq.Context()
-        self.__socket = self.__context.socket(zmq.RADIO)
-        self.__socket.connect(E.Endpoint_str_get(self.__endpoint))
+        address = E.Endpoint_str_get(self.__endpoint)
+        if shm.is_local(address):
+            self.__socket = None
+            self.__ring = shm.RingWriter(shm.endpoint_name(address))
+            self.MTU = self.__ring.max_frame
+            return
+        self.__ring = None
+        self.__socket = transport.socket(zmq.RADIO)
+        self.__socket.connect(address)
 
     def publish(self, msg):
         """ Publish a message to the socket.
+
+        Args:
+            msg: text message ("tag:value,tag:value,...") or a
+                dictionary of tag values.
         """
+        start = time.perf_counter()
         try:
-            size = len(msg)
-            if size > self.MTU:
-                parts = msg.split(',')
-                b_count = 0
-                message = ""
-                for p in parts:
-                    part = p + ','
-                    b_count += len(part)
-                    temp = message + part
-                    # If adding the part is smaller than MTU and we haven't consumed all the msg...
-                    if len(temp) < self.MTU and b_count <= size:
-                        message = temp
-                    # Otherwise, send the message without 'part' and reset message
-                    else:
-                        self.__socket.send_string(message, group=self.__group)
-                        message = part
+            if self.binary:
+                if isinstance(msg, str):
+                    # binary frames carry the tag values only, without the
+                    # Write={...} envelope some providers publish
+                    msg = codec.parse_text(codec.split_envelope(msg)[1])
+                msg = {tag: codec.parse_value(value) if isinstance(value, str) else value
+                       for tag, value in msg.items()}
+                self.__publish_binary(msg)
             else:
-                self.__socket.send_string(msg, group=self.__group)
+                if not isinstance(msg, str):
+                    msg = codec.encode_text(msg)
+                self.__publish_text(msg)
         except Exception as e:
+            self.__metrics.count("publish.errors")
             print("Publish error: {}".format(e))
+        self.__metrics.count("publish.messages")
+        self.__metrics.observe("publish.duration", time.perf_counter() - start)
+
+    def set_dictionary(self, tags):
+        """ Set the tag names the compression dictionary is built from.
+        """
+        self.__dictionary = codec.build_dictionary(tags)
+        self.__last_dictionary = 0.0
+
+    def __publish_text(self, msg):
+        data = msg.encode('utf-8')
+        if self.compress:
+            if self.__dictionary is None:
+                self.set_dictionary(codec.parse_text(codec.split_envelope(msg)[1]))
+            self.__publish_compressed(data, self.__dictionary)
+            return
+        if self.fragment:
+            self.__fragmenter.mtu = self.MTU
+            frames = self.__fragmenter.frames(data)
+        else:
+            frames = codec.text_fragments(data, self.MTU)
+        self.__send(frames)
+
+    def __publish_binary(self, values):
+        # compressed frames are fragmented afterwards, so they aren't
+        # limited by the MTU
+        self.__encoder.mtu = 0x7FFFFFFF if self.compress else self.MTU
+        now = time.monotonic()
+        changed = self.__encoder.register(values)
+        frames = []
+        if changed or now - self.__last_schema >= self.schema_interval:
+            self.__last_schema = now
+            frames.extend(self.__encoder.schema_frames())
+        frames.extend(self.__encoder.data_frames(values))
+
+        if self.compress:
+            for frame in frames:
+                self.__publish_compressed(frame, None)
+        else:
+            self.__send(frames)
+
+    def __publish_compressed(self, data, dictionary):
+        self.__fragmenter.mtu = self.MTU
+        now = time.monotonic()
+        if dictionary and now - self.__last_dictionary >= self.schema_interval:
+            self.__last_dictionary = now
+            announcement = codec.DICTIONARY_ID.pack(codec.dictionary_id(dictionary)) + dictionary
+            self.__send(self.__fragmenter.frames(announcement, codec.FLAG_DICTIONARY))
+        payload = codec.compress(data, dictionary, self.compression_level)
+        self.__metrics.count("publish.uncompressed_bytes", len(data))
+        self.__send(self.__fragmenter.frames(payload, codec.FLAG_COMPRESSED))
+
+    def __send(self, frames):
+        count = size = 0
+        for frame in frames:
+            if self.__ring is not None:
+                self.__ring.write(frame)
+            else:
+                self.__socket.send(frame, group=self.__group)
+            count += 1
+            size += len(frame)
+        self.__metrics.count("publish.datagrams", count)
+        self.__metrics.count("publish.bytes", size)
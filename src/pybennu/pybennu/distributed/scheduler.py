@@ -0,0 +1,199 @@
+"""Publish scheduling support.
+
+This module defines the PublishScheduler class, used by the Provider base
+class to publish groups of tags at different rates from a single thread, and
+the ChangePublisher class, used to publish as soon as a provider's state
+changes.
+"""
+
+import fnmatch
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import pybennu.distributed.metrics as metrics
+from pybennu.distributed.delta import DeltaTracker
+
+
+class PublishScheduler:
+    """
+    Publish tags in rate classes, e.g. breaker statuses at 10 Hz, measurements
+    at 1 Hz and static ratings only when they change.
+
+    Tags are assigned to classes with glob patterns, tags that don't match any
+    pattern are in the 'default' class. A class with a rate of 0 is published
+    on change only: its tags are checked every change_interval seconds and
+    the changed ones are published, with a full keyframe every
+    keyframe_interval seconds so late joiners can resync.
+
+    All classes are published from one timer thread. The state is captured
+    once per tick with the snapshot callable and each due class publishes
+    its own tags in its own message.
+    """
+
+    DEFAULT = 'default'
+    ON_CHANGE = 0.0
+
+    def __init__(self, snapshot: Callable[[], Mapping[str, Any]],
+                 publish: Callable[[Dict[str, Any]], None],
+                 default_rate: float = 1.0, change_interval: float = 0.1,
+                 keyframe_interval: float = 10.0) -> None:
+        """
+        Args:
+            snapshot: returns the current value of every tag
+            publish: publishes a dictionary of tag values
+            default_rate: rate (Hz) of the default class, 0 for on-change
+            change_interval: seconds between checks of on-change classes
+            keyframe_interval: seconds between full on-change class publishes
+        """
+        self.change_interval = change_interval
+        self.keyframe_interval = keyframe_interval
+        self.__snapshot = snapshot
+        self.__publish = publish
+        self.__rates: Dict[str, float] = {}
+        self.__trackers: Dict[str, DeltaTracker] = {}
+        self.__patterns: List[Tuple[str, str]] = []
+        self.__members: Dict[str, str] = {}  # resolved class per tag
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.add_class(self.DEFAULT, default_rate)
+
+    def add_class(self, name: str, rate: float) -> None:
+        """Add (or change the rate of) a class, rate in Hz or 0 for on-change."""
+        if rate < 0:
+            raise ValueError("rate of publish class '{}' can't be negative".format(name))
+        with self.__lock:
+            self.__rates[name] = rate
+            if rate == self.ON_CHANGE:
+                self.__trackers[name] = DeltaTracker(self.keyframe_interval)
+            else:
+                self.__trackers.pop(name, None)
+
+    def assign(self, pattern: str, name: str) -> None:
+        """
+        Assign tags matching a glob pattern, e.g. '*.active', to a class.
+
+        Patterns assigned later take precedence over patterns assigned earlier.
+        """
+        with self.__lock:
+            if name not in self.__rates:
+                raise KeyError("unknown publish class '{}'".format(name))
+            self.__patterns.insert(0, (pattern, name))
+            self.__members.clear()
+
+    def class_of(self, tag: str) -> str:
+        """Name of the class a tag is published in."""
+        name = self.__members.get(tag)
+        if name is None:
+            name = self.DEFAULT
+            for pattern, cls in self.__patterns:
+                if fnmatch.fnmatchcase(tag, pattern):
+                    name = cls
+                    break
+            self.__members[tag] = name
+        return name
+
+    def stop(self) -> None:
+        """Stop the timer loop."""
+        self.__stop.set()
+
+    def run(self) -> None:
+        """Timer loop, publishes each class when it is due."""
+        deadlines: Dict[str, float] = {}
+        while not self.__stop.is_set():
+            now = time.monotonic()
+            with self.__lock:
+                rates = dict(self.__rates)
+            due = []
+            for name, rate in rates.items():
+                deadline = deadlines.get(name, now)
+                if deadline <= now:
+                    due.append(name)
+                    period = self.change_interval if rate == self.ON_CHANGE else 1.0 / rate
+                    # don't try to catch up on missed ticks
+                    deadlines[name] = max(deadline + period, now)
+
+            if due:
+                try:
+                    with metrics.get_registry().timer("publish.cycle"):
+                        self.publish_classes(due)
+                except Exception as e:
+                    print("provider scheduled publish error: {}".format(e))
+
+            next_deadline = min(deadlines[name] for name in rates)
+            self.__stop.wait(max(0.0, next_deadline - time.monotonic()))
+
+    def publish_classes(self, names: List[str],
+                        values: Optional[Mapping[str, Any]] = None) -> None:
+        """Publish the tags of the given classes, from a new snapshot by default."""
+        if values is None:
+            values = self.__snapshot()
+
+        with self.__lock:
+            groups: Dict[str, Dict[str, Any]] = {name: {} for name in names}
+            for tag, value in values.items():
+                group = groups.get(self.class_of(tag))
+                if group is not None:
+                    group[tag] = value
+            trackers = {name: self.__trackers.get(name) for name in names}
+
+        for name, group in groups.items():
+            tracker = trackers[name]
+            if tracker is not None:
+                group = tracker.filter(group)
+            if group:
+                self.__publish(group)
+
+
+class ChangePublisher:
+    """
+    Publish shortly after a provider signals that its state changed.
+
+    Changes signalled within window seconds of each other are coalesced into
+    one publish, and publishes are at least min_interval seconds apart so a
+    burst of writes can't flood the network.
+    """
+
+    def __init__(self, publish: Callable[[], None],
+                 window: float = 0.01, min_interval: float = 0.1) -> None:
+        """
+        Args:
+            publish: publishes the current state
+            window: seconds to wait for more changes before publishing
+            min_interval: minimum seconds between two publishes
+        """
+        self.window = window
+        self.min_interval = min_interval
+        self.__publish = publish
+        self.__changed = threading.Event()
+        self.__stop = threading.Event()
+        self.__last = 0.0
+
+    def notify(self) -> None:
+        """Signal that the state changed."""
+        self.__changed.set()
+
+    def stop(self) -> None:
+        """Stop the publish loop."""
+        self.__stop.set()
+        self.__changed.set()
+
+    def run(self) -> None:
+        """Publish loop, waits for changes and publishes them."""
+        while True:
+            self.__changed.wait()
+            if self.__stop.is_set():
+                return
+
+            delay = max(self.window, self.__last + self.min_interval - time.monotonic())
+            if delay > 0 and self.__stop.wait(delay):
+                return
+
+            # changes signalled from here on trigger another publish
+            self.__changed.clear()
+            self.__last = time.monotonic()
+            try:
+                with metrics.get_registry().timer("publish.cycle"):
+                    self.__publish()
+            except Exception as e:
+                print("provider change publish error: {}".format(e))
@@ -1,9 +1,16 @@
 """pybennu server interface.
 """
 
+import logging
+import threading
+
 import zmq
 
+import pybennu.distributed.metrics as metrics
 import pybennu.distributed.swig._Endpoint as E
+import pybennu.distributed.transport as transport
+
+logger = logging.getLogger(__name__)
 
 
 class Server:
@@ -13,6 +20,9 @@ class Server:
     wait for requests from clients, and respond. Inheriting classes can
     implement their own request handler by setting self.request_handler =
     <custom handler>.
+
+    Requests and replies are logged at debug level, for one request out of
+    every debug_sample.every.
     """
     __kACK = "ACK"
     __kERROR = "ERR"
@@ -29,13 +39,13 @@ class Server:
             self.__endpoint = endpoint
 
         self.request_handler = self.__defaultHandler
+        self.debug_sample = metrics.Sampler(100)
         self.bind()
 
     def bind(self):
         """ Bind to listening socket.
         """
-        self.__context = zmq.Context()
-        self.__socket = self.__context.socket(zmq.REP)
+        self.__socket = transport.socket(zmq.REP)
         self.__socket.bind(E.Endpoint_str_get(self.__endpoint))
 
     def __defaultHandler(self, request):
@@ -46,7 +56,86 @@ class Server:
         """
         while True:
             request = self.__socket.recv_string()
-            print("Server ---- Received request: {}".format(request))
+            debug = logger.isEnabledFor(logging.DEBUG) and self.debug_sample()
+            if debug:
+                logger.debug("Server ---- Received request: %s", request)
             reply = self.request_handler(request.strip('\x00'))
             self.__socket.send_string(reply+'\x00') # must include null byte
-            print("Server ---- Sent reply: {}".format(reply))
+            if debug:
+                logger.debug("Server ---- Sent reply: %s", reply)
+
+
+class WorkerServer:
+    """ Concurrent server class.
+
+    Drop-in alternative to Server (same request_handler contract) that binds
+    a ZMQ ROUTER socket and hands requests to a pool of worker threads
+    through an inproc DEALER socket. Requests whose verb is listed in
+    serialized_verbs (WRITE by default) are run one at a time, so writes
+    go through a single writer while READ and QUERY requests are served
+    concurrently by the other workers. WRITEREAD requests are serialized
+    too, since they start with a write.
+
+    Reads are served from whatever state the request handler exposes while
+    a write is in progress, so handlers must swap in new state atomically
+    (e.g. under a lock) for reads to see a consistent snapshot.
+    """
+
+    def __init__(self, endpoint, workers=4):
+        """ Initialize connection environment.
+        """
+        if isinstance(endpoint, str):
+            # if using a DynamicSimulatorSettings class, endpoint needs to be converted to an actual endpoint
+            self.__endpoint = E.new_Endpoint()
+            E.Endpoint_str_set(self.__endpoint, endpoint)
+        else:
+            self.__endpoint = endpoint
+
+        self.workers = workers
+        self.serialized_verbs = {"WRITE", "WRITEREAD"}
+        self.request_handler = self.__defaultHandler
+        self.debug_sample = metrics.Sampler(100)
+        self.__write_lock = threading.Lock()
+        self.bind()
+
+    def bind(self):
+        """ Bind to listening socket and to the inproc worker socket.
+        """
+        self.__frontend = transport.socket(zmq.ROUTER)
+        self.__frontend.bind(E.Endpoint_str_get(self.__endpoint))
+        self.__backend_address = "inproc://pybennu-workers-%x" % id(self)
+        self.__backend = transport.socket(zmq.DEALER)
+        self.__backend.bind(self.__backend_address)
+
+    def __defaultHandler(self, request):
+        return "ACK="
+
+    def run(self):
+        """ Start the worker threads and forward requests to them.
+        """
+        for i in range(self.workers):
+            worker = threading.Thread(target=self.__worker, name="server-worker-%d" % i)
+            worker.daemon = True
+            worker.start()
+        zmq.proxy(self.__frontend, self.__backend)
+
+    def __worker(self):
+        socket = transport.socket(zmq.REP)
+        socket.connect(self.__backend_address)
+        while True:
+            request = socket.recv_string()
+            debug = logger.isEnabledFor(logging.DEBUG) and self.debug_sample()
+            if debug:
+                logger.debug("Server ---- Received request: %s", request)
+            request = request.strip('\x00')
+            try:
+                if request.split('=', 1)[0].upper() in self.serialized_verbs:
+                    with self.__write_lock:
+                        reply = self.request_handler(request)
+                else:
+                    reply = self.request_handler(request)
+            except Exception as err:
+                reply = "ERR=Request handler failed: {}".format(err)
+            socket.send_string(reply+'\x00') # must include null byte
+            if debug:
+                logger.debug("Server ---- Sent reply: %s", reply)
@@ -0,0 +1,249 @@
+"""Shared-memory publish transport.
+
+This module defines the RingWriter and RingReader classes, used by the
+Publisher and Subscriber classes for 'shm://<name>' endpoints: messages are
+written to a ring buffer in a memory-mapped file (/dev/shm/pybennu-<name>)
+that subscribers on the same host read directly, with no UDP or ZMQ hop.
+
+The frames written are the same as the ones published over UDP (text,
+binary or fragments), so everything above the transport works unchanged.
+
+Layout (little-endian):
+
+    header:  magic (4 bytes), version (u32), capacity (u64), head (u64),
+             reserved (u64), padded to 64 bytes
+    data:    capacity bytes of records: length (u32), payload, padded to
+             8 bytes. A length of WRAP means the next record is at the start
+             of the data area.
+
+head is the total number of bytes ever written. Before writing a record the
+writer advances reserved to where the record ends, and it advances head to
+the same place once the record is filled in. Readers only read up to head,
+and check reserved after copying a record out: if reserved is more than a
+ring ahead of the record, the writer may have been overwriting it during
+the copy, so the record is dropped (and counted as an overrun) rather than
+delivered torn. There is a single writer per ring; any number of readers.
+"""
+
+import mmap
+import os
+import struct
+import time
+from typing import List, Optional
+
+HEADER = struct.Struct('<4sIQQQ')
+HEADER_SIZE = 64
+HEAD_OFFSET = 16
+RESERVED_OFFSET = 24
+COUNTER = struct.Struct('<Q')
+LENGTH = struct.Struct('<I')
+MAGIC = b'BNSH'
+VERSION = 2
+WRAP = 0xFFFFFFFF
+ALIGN = 8
+
+DEFAULT_CAPACITY = 4 * 1024 * 1024
+
+
+def path(name: str) -> str:
+    """File backing the ring of an endpoint name (or absolute path)."""
+    if name.startswith('/'):
+        return name
+    return '/dev/shm/pybennu-{}'.format(name)
+
+
+def is_local(address: str) -> bool:
+    """True for shared-memory endpoint strings."""
+    return address.startswith('shm://')
+
+
+def endpoint_name(address: str) -> str:
+    """Ring name of a 'shm://<name>' endpoint string."""
+    return address[len('shm://'):]
+
+
+def _padded(size: int) -> int:
+    return (size + ALIGN - 1) & ~(ALIGN - 1)
+
+
+class RingWriter:
+    """Writes frames to a shared-memory ring.
+
+    An existing ring with the same capacity is reused (so readers keep
+    following it across publisher restarts), otherwise it is recreated.
+    """
+
+    def __init__(self, name: str, capacity: int = DEFAULT_CAPACITY) -> None:
+        capacity = _padded(capacity)
+        self.capacity = capacity
+        self.max_frame = capacity // 2 - LENGTH.size
+        self.__path = path(name)
+
+        fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = HEADER_SIZE + capacity
+            reuse = os.fstat(fd).st_size == size
+            if not reuse:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.__map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, version, current, head, _ = HEADER.unpack_from(self.__map, 0)
+        if not (reuse and magic == MAGIC and version == VERSION and current == capacity):
+            head = 0
+        # a writer that died mid-record leaves reserved ahead of head
+        HEADER.pack_into(self.__map, 0, MAGIC, VERSION, capacity, head, head)
+        self.__head = head
+        self.__data = memoryview(self.__map)[HEADER_SIZE:]
+
+    def write(self, frame: bytes) -> None:
+        """Append a frame to the ring.
+
+        Raises:
+            ValueError: frame is larger than max_frame
+        """
+        size = len(frame)
+        if size > self.max_frame:
+            raise ValueError('frame of {} bytes exceeds the shared-memory '
+                             'limit of {} bytes'.format(size, self.max_frame))
+        record = _padded(LENGTH.size + size)
+        offset = self.__head % self.capacity
+        skip = self.capacity - offset if offset + record > self.capacity else 0
+        end = self.__head + skip + record
+        COUNTER.pack_into(self.__map, RESERVED_OFFSET, end)
+        if skip:
+            LENGTH.pack_into(self.__data, offset, WRAP)
+            offset = 0
+        LENGTH.pack_into(self.__data, offset, size)
+        start = offset + LENGTH.size
+        self.__data[start:start + size] = frame
+        self.__head = end
+        COUNTER.pack_into(self.__map, HEAD_OFFSET, end)
+
+    def close(self) -> None:
+        """Unmap the ring, leaving the file for readers."""
+        self.__data.release()
+        self.__map.close()
+
+    def unlink(self) -> None:
+        """Remove the file backing the ring."""
+        try:
+            os.unlink(self.__path)
+        except FileNotFoundError:
+            pass
+
+
+class RingReader:
+    """Reads frames from a shared-memory ring.
+
+    The ring is opened on first use, so readers can start before the
+    writer. Reading starts at the frames written after the ring was opened,
+    like joining a multicast group. overruns counts how many times the
+    reader fell more than a ring behind the writer and skipped ahead.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.__path = path(name)
+        self.__map: Optional[mmap.mmap] = None
+        self.__data: Optional[memoryview] = None
+        self.__capacity = 0
+        self.__position = 0
+        self.overruns = 0
+
+    def __open(self) -> bool:
+        try:
+            fd = os.open(self.__path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size <= HEADER_SIZE:
+                return False
+            self.__map = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        magic, version, capacity, head, _ = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != VERSION or HEADER_SIZE + capacity != size:
+            self.__map.close()
+            self.__map = None
+            return False
+        self.__capacity = capacity
+        self.__position = head
+        self.__data = memoryview(self.__map)[HEADER_SIZE:]
+        return True
+
+    def read(self) -> List[bytes]:
+        """Return the frames written since the last read (possibly none)."""
+        if self.__map is None and not self.__open():
+            return []
+
+        frames = []
+        data = self.__data
+        capacity = self.__capacity
+        position = self.__position
+        (head,) = COUNTER.unpack_from(self.__map, HEAD_OFFSET)
+        if head < position:
+            # the writer recreated the ring
+            position = head
+
+        while position < head:
+            if head - position > capacity:
+                self.overruns += 1
+                position = head
+                break
+            offset = position % capacity
+            (size,) = LENGTH.unpack_from(data, offset)
+            frame = None
+            if size != WRAP:
+                start = offset + LENGTH.size
+                frame = bytes(data[start:start + size])
+
+            # the writer may have been overwriting the record while it was
+            # read (reserved only ever runs ahead of head)
+            (reserved,) = COUNTER.unpack_from(self.__map, RESERVED_OFFSET)
+            if reserved - position > capacity:
+                self.overruns += 1
+                (head,) = COUNTER.unpack_from(self.__map, HEAD_OFFSET)
+                position = max(head, position)
+                break
+            if frame is None:
+                position += capacity - offset
+                continue
+            frames.append(frame)
+            position += _padded(LENGTH.size + size)
+
+        self.__position = position
+        return frames
+
+    def close(self) -> None:
+        """Unmap the ring."""
+        if self.__map is not None:
+            self.__data.release()
+            self.__map.close()
+            self.__map = None
+
+
+class Backoff:
+    """Polling delay for readers: spin briefly after traffic, then sleep
+    progressively longer (up to max_sleep seconds) while the ring is idle.
+    """
+
+    def __init__(self, spins: int = 100, max_sleep: float = 0.001) -> None:
+        self.spins = spins
+        self.max_sleep = max_sleep
+        self.__idle = 0
+
+    def reset(self) -> None:
+        """Traffic was received."""
+        self.__idle = 0
+
+    def wait(self) -> None:
+        """Nothing was received, wait before polling again."""
+        self.__idle += 1
+        if self.__idle <= self.spins:
+            time.sleep(0)
+        else:
+            time.sleep(min(self.max_sleep, 1e-5 * (self.__idle - self.spins)))
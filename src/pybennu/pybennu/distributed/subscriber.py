@@ -1,12 +1,32 @@
 """pybennu subscriber interface.
 
 This module defines the Subscriber base class. It implements an interface to
-subscribe to data published by a Provider.
+subscribe to data published by a Provider. It also defines SubscriberCache,
+which keeps the latest value of every tag received by one or more
+Subscribers.
 """
 
+import fnmatch
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
 import zmq
 
+import pybennu.distributed.codec as codec
+import pybennu.distributed.shm as shm
 import pybennu.distributed.swig._Endpoint as E
+import pybennu.distributed.transport as transport
+
+
+class _Source:
+    """ Per-publisher decoding state of a Subscriber. """
+    def __init__(self, label, reader=None):
+        self.label = label
+        self.reader = reader    # shm.RingReader of 'shm://' sources
+        self.decoder = codec.BinaryDecoder()
+        self.assembler = codec.FragmentAssembler()
+        self.decompressor = codec.Decompressor()
 
 
 class Subscriber:
@@ -16,32 +36,383 @@ class Subscriber:
     and subscribe to data being published by a Provider RADIO socket.
     Inheriting classes can implement their own subscription handler by
     setting self.susbcription_handler = <custom handler>.
+
+    Text messages are passed as-is to the subscription handler. Binary
+    frames are decoded into a dictionary of typed tag values and passed to
+    self.values_handler, which by default re-formats them as a text message
+    for the subscription handler. Consumers that want typed values without
+    any string parsing can set self.values_handler = <custom handler>.
+
+    Fragmented messages are reassembled (and decompressed) before being
+    handled. counters() returns the lost/out-of-order fragment and
+    undecodable frame counts.
+
+    A single Subscriber (one socket, one thread) can follow several
+    Providers: add_source() binds another endpoint and joins its group.
+    While a handler runs, self.current_source holds the label of the
+    source the message came from.
+
+    'shm://<name>' sources are read from the shared-memory ring of a
+    Publisher on the same host (see pybennu.distributed.shm) instead of UDP.
     """
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, label=None):
         """ Initialize connection environment.
+
+        Args:
+            endpoint: Endpoint object or endpoint string of the first source,
+                None to only use sources added with add_source().
+            label: label of the first source, defaults to the endpoint string.
         """
         self.__endpoint = endpoint
+        self.__label = label
         self.subscription_handler = self.__defaultHandler
+        self.values_handler = self.__defaultValuesHandler
+        self.current_source = None
+        self.__sources = {}
+        self.__addresses = set()
         self.bind()
 
     def bind(self):
         """ Bind to DISH socket and join a group.
         """
-        self.__context = zmq.Context()
-        self.__socket = self.__context.socket(zmq.DISH)
-        self.__socket.bind(E.Endpoint_str_get(self.__endpoint))
-        self.__socket.join(E.Endpoint_hash(self.__endpoint))
+        self.__socket = transport.socket(zmq.DISH)
+        if self.__endpoint is not None:
+            self.add_source(self.__endpoint, self.__label)
+
+    def add_source(self, endpoint, label=None):
+        """ Subscribe to another Provider's publish endpoint.
+
+        Args:
+            endpoint: Endpoint object or endpoint string, e.g.
+                'udp://239.0.0.1:40000'.
+            label: label of the source (see current_source), defaults to the
+                endpoint string.
+
+        Returns:
+            The group name the source publishes to.
+        """
+        if isinstance(endpoint, str):
+            address = endpoint
+            endpoint = E.new_Endpoint()
+            E.Endpoint_str_set(endpoint, address)
+        address = E.Endpoint_str_get(endpoint)
+        group = E.Endpoint_hash(endpoint)
+        if group in self.__sources:
+            return group
+
+        if shm.is_local(address):
+            reader = shm.RingReader(shm.endpoint_name(address))
+            self.__sources[group] = _Source(label if label is not None else address, reader)
+            return group
+
+        if address not in self.__addresses:
+            self.__socket.bind(address)
+            self.__addresses.add(address)
+        self.__socket.join(group)
+        self.__sources[group] = _Source(label if label is not None else address)
+        return group
+
+    def sources(self):
+        """ Return the labels of all sources.
+        """
+        return [source.label for source in self.__sources.values()]
 
     def __defaultHandler(self, message):
         print("Received subscription update: %s" % message)
 
+    def __defaultValuesHandler(self, values):
+        self.subscription_handler(codec.encode_text(values))
+
+    def counters(self):
+        """ Return the fragment reassembly and binary decoding counters,
+        summed over all sources.
+        """
+        counters = {}
+        for source in self.__sources.values():
+            current = {'fragment_' + name: value
+                       for name, value in source.assembler.counters().items()}
+            current['unknown_schema'] = source.decoder.unknown_schema
+            current['unknown_tags'] = source.decoder.unknown_tags
+            current['unknown_dictionary'] = source.decompressor.unknown_dictionary
+            if source.reader is not None:
+                current['shm_overruns'] = source.reader.overruns
+            for name, value in current.items():
+                counters[name] = counters.get(name, 0) + value
+        return counters
+
+    def __reassemble(self, source, frame):
+        reassembled = source.assembler.add(frame)
+        if reassembled is None:
+            return None
+        flags, message = reassembled
+        if flags & codec.FLAG_DICTIONARY:
+            source.decompressor.add_dictionary(message)
+            return None
+        if flags & codec.FLAG_COMPRESSED:
+            return source.decompressor.decompress(message)
+        return message
+
     def run(self):
-        """ Listen for messages from a Publisher.
+        """ Listen for messages from the Publishers.
         """
+        if any(source.reader is not None for source in self.__sources.values()):
+            self.__run_local()
+            return
+
         while True:
             try:
-                message = self.__socket.recv_string()
+                frame = self.__socket.recv(copy=False)
             except zmq.Again:
                 print("E: Subscriber missed a message")
                 continue
-            self.subscription_handler(message)
+
+            source = self.__sources.get(frame.group)
+            if source is not None:
+                self.__handle(source, frame.bytes)
+
+    def __run_local(self):
+        # shared-memory rings can't be waited on, so poll them (and the DISH
+        # socket, if there are UDP sources too)
+        local = [source for source in self.__sources.values() if source.reader is not None]
+        remote = len(local) < len(self.__sources)
+        backoff = shm.Backoff()
+        while True:
+            received = False
+            for source in local:
+                for message in source.reader.read():
+                    received = True
+                    self.__handle(source, message)
+
+            while remote and self.__socket.poll(0):
+                frame = self.__socket.recv(copy=False)
+                source = self.__sources.get(frame.group)
+                received = True
+                if source is not None:
+                    self.__handle(source, frame.bytes)
+
+            if received:
+                backoff.reset()
+            else:
+                backoff.wait()
+
+    def __handle(self, source, message):
+        self.current_source = source.label
+
+        if codec.is_binary(message) and message[2] == codec.KIND_FRAGMENT:
+            try:
+                message = self.__reassemble(source, message)
+            except codec.CodecError as err:
+                print("E: Subscriber dropped a fragment: %s" % err)
+                return
+            if message is None:
+                return
+
+        if codec.is_binary(message):
+            try:
+                values = source.decoder.decode(message)
+            except codec.CodecError as err:
+                print("E: Subscriber dropped a binary frame: %s" % err)
+                return
+            if values is not None:
+                self.values_handler(values)
+        else:
+            self.subscription_handler(message.decode('utf-8'))
+
+
+class CacheEntry(NamedTuple):
+    """ Latest value of a tag in a SubscriberCache. """
+    value: Any          # bool, float or str (see codec.parse_value)
+    timestamp: float    # time.time() when the value was received
+    sequence: int       # cache update (message) number that set the value
+    version: Optional[int] = None   # provider state version, if published
+
+
+class SubscriberCache:
+    """ Latest typed value, receive time and sequence number of each tag.
+
+    Feed it from one or more Subscribers with attach(), or directly with
+    update()/update_text(). Text messages are parsed once, and only the tags
+    the cache is interested in are converted.
+
+    Change callbacks registered with on_change() are called, outside of the
+    cache lock, with (tag, value, previous value) whenever a tag's value
+    changes (previous is None the first time a tag is received).
+    
+    Messages prefixed with a provider state version (see
+    Provider.publish_version) set the version of their entries, and of
+    the following unversioned messages with the same prefix and source (the
+    rest of a message split over several datagrams). Messages with an older
+    version than the latest one received from their source are duplicates or
+    arrived out of order, they are dropped and counted in stale_messages.
+    Versions are tracked per source label (see Subscriber.current_source),
+    since each provider counts its own.
+    """
+
+    def __init__(self, tags: Optional[Iterable[str]] = None):
+        """
+        Args:
+            tags: names of the tags to keep, None to keep every tag.
+        """
+        self.tags = set(tags) if tags is not None else None
+        self.sequence = 0
+        self.stale_messages = 0
+        # (prefix, source label) -> latest (version, simulation time)
+        self.__versions: Dict[Tuple[str, Optional[str]], Tuple[int, float]] = {}
+        self.__entries: Dict[str, CacheEntry] = {}
+        self.__callbacks: List[Tuple[str, Callable[[str, Any, Any], None]]] = []
+        self.__lock = threading.Lock()
+
+    def attach(self, subscriber: Subscriber, prefix: str = '', by_source: bool = False) -> None:
+        """ Feed every message received by a Subscriber into the cache.
+
+        Args:
+            subscriber: Subscriber whose handlers are replaced.
+            prefix: prepended to the received tag names, e.g. to tell the
+                sources of several subscribers apart.
+            by_source: prefix the received tag names with
+                '<source label>/' instead, for subscribers with several
+                sources.
+        """
+        if by_source:
+            subscriber.subscription_handler = lambda message: self.update_text(
+                message, subscriber.current_source + '/', subscriber.current_source)
+            subscriber.values_handler = lambda values: self.update(
+                values, subscriber.current_source + '/', subscriber.current_source)
+        else:
+            subscriber.subscription_handler = lambda message: self.update_text(
+                message, prefix, subscriber.current_source)
+            subscriber.values_handler = lambda values: self.update(
+                values, prefix, subscriber.current_source)
+
+    def on_change(self, callback: Callable[[str, Any, Any], None], pattern: str = '*') -> None:
+        """ Call callback(tag, value, previous) when a tag matching a glob
+        pattern changes.
+        """
+        with self.__lock:
+            self.__callbacks.append((pattern, callback))
+
+    def update_text(self, message: str, prefix: str = '',
+                    source: Optional[str] = None) -> Dict[str, Any]:
+        """ Update the cache from a text message ("tag:value,tag:value,...",
+        optionally in a "Write={...}" envelope), received from the source
+        with the given label.
+
+        Returns:
+            Dictionary of the typed values that were stored.
+        """
+        values = {}
+        raw = codec.parse_text(codec.split_envelope(message)[1])
+        version = codec.pop_version(raw)
+        for tag, value in raw.items():
+            tag = prefix + tag
+            if self.tags is None or tag in self.tags:
+                values[tag] = codec.parse_value(value)
+        return self.__store(values, (prefix, source), version)
+
+    def update(self, values: Mapping[str, Any], prefix: str = '',
+               source: Optional[str] = None) -> Dict[str, Any]:
+        """ Update the cache from a dictionary of typed values, received
+        from the source with the given label.
+
+        Returns:
+            Dictionary of the values that were stored.
+        """
+        stored = {}
+        version = (None, None)
+        if codec.VERSION_TAG in values:
+            values = dict(values)
+            version = codec.pop_version(values)
+        for tag, value in values.items():
+            tag = prefix + tag
+            if self.tags is None or tag in self.tags:
+                stored[tag] = codec.parse_value(value) if isinstance(value, str) else value
+        return self.__store(stored, (prefix, source), version)
+
+    def __store(self, values: Dict[str, Any], key: Tuple[str, Optional[str]],
+                version: Tuple[Optional[int], Optional[float]] = (None, None)) -> Dict[str, Any]:
+        now = time.time()
+        changes = []
+        with self.__lock:
+            latest = self.__versions.get(key)
+            if version[0] is not None:
+                if latest is not None and version[0] < latest[0]:
+                    self.stale_messages += 1
+                    return {}
+                latest = self.__versions[key] = (version[0], version[1])
+            current = latest[0] if latest is not None else None
+
+            self.sequence += 1
+            entries = self.__entries
+            for tag, value in values.items():
+                previous = entries.get(tag)
+                entries[tag] = CacheEntry(value, now, self.sequence, current)
+                if previous is None or previous.value != value:
+                    changes.append((tag, value, previous.value if previous else None))
+            callbacks = list(self.__callbacks)
+
+        if callbacks:
+            for tag, value, previous in changes:
+                for pattern, callback in callbacks:
+                    if pattern == '*' or fnmatch.fnmatchcase(tag, pattern):
+                        callback(tag, value, previous)
+        return values
+
+    def get(self, tag: str, default: Any = None) -> Any:
+        """ Latest value of a tag, or default if it hasn't been received. """
+        entry = self.__entries.get(tag)
+        return entry.value if entry is not None else default
+
+    def entry(self, tag: str) -> Optional[CacheEntry]:
+        """ Latest value, timestamp and sequence of a tag. """
+        return self.__entries.get(tag)
+
+    def snapshot(self, tags: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """ Consistent copy of the latest values (of the given tags only, if
+        any), i.e. no update is applied halfway through.
+        """
+        with self.__lock:
+            if tags is None:
+                return {tag: entry.value for tag, entry in self.__entries.items()}
+            return {tag: self.__entries[tag].value for tag in tags if tag in self.__entries}
+
+    def entries(self) -> Dict[str, CacheEntry]:
+        """ Consistent copy of all cache entries. """
+        with self.__lock:
+            return dict(self.__entries)
+
+    def version(self, prefix: str = '', source: Optional[str] = None) -> Optional[Tuple[int, float]]:
+        """ Latest provider state version and simulation time received
+        from the source with the given prefix and label, None if none was.
+        The label can be left out when a single source feeds the prefix
+        (None if several do, their versions aren't comparable).
+        """
+        with self.__lock:
+            if source is not None:
+                return self.__versions.get((prefix, source))
+            versions = [latest for (name, _), latest in self.__versions.items() if name == prefix]
+        return versions[0] if len(versions) == 1 else None
+
+    def consistent(self, tags: Iterable[str]) -> bool:
+        """ True if the given tags were all received and have the same
+        provider state version, i.e. they come from the same state update.
+        """
+        with self.__lock:
+            versions = {self.__entries[tag].version if tag in self.__entries else None
+                        for tag in tags}
+        return len(versions) == 1 and None not in versions
+
+    def age(self, tag: str) -> Optional[float]:
+        """ Seconds since a tag was last received, None if it never was. """
+        entry = self.__entries.get(tag)
+        return time.time() - entry.timestamp if entry is not None else None
+
+    def stale(self, max_age: float) -> List[str]:
+        """ Tags not received in the last max_age seconds, including the
+        expected tags (see tags) that were never received.
+        """
+        cutoff = time.time() - max_age
+        with self.__lock:
+            stale = [tag for tag, entry in self.__entries.items() if entry.timestamp < cutoff]
+            if self.tags is not None:
+                stale.extend(tag for tag in self.tags if tag not in self.__entries)
+        return stale
@@ -0,0 +1,139 @@
+"""pybennu transport runtime.
+
+This module owns the process-wide ZMQ context shared by every Publisher,
+Server, Subscriber and Client (like the C++ bennu Context singleton), and
+applies the same socket options to every socket it creates.
+
+Options must be set with configure() before the sockets they should apply
+to are created. io_threads only takes effect if it is set before the
+context is first used.
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+import zmq
+import zmq.asyncio
+
+import pybennu.distributed.metrics as metrics
+
+# option name -> ZMQ socket option; None values leave the ZMQ default
+_SOCKET_OPTIONS = {
+    'sndhwm': zmq.SNDHWM,
+    'rcvhwm': zmq.RCVHWM,
+    'linger': zmq.LINGER,
+    'sndbuf': zmq.SNDBUF,
+    'rcvbuf': zmq.RCVBUF,
+    'tcp_keepalive': zmq.TCP_KEEPALIVE,
+    'tcp_keepalive_idle': zmq.TCP_KEEPALIVE_IDLE,
+    'tcp_keepalive_intvl': zmq.TCP_KEEPALIVE_INTVL,
+    'tcp_keepalive_cnt': zmq.TCP_KEEPALIVE_CNT,
+}
+
+_options: Dict[str, Optional[int]] = {name: None for name in _SOCKET_OPTIONS}
+_options['io_threads'] = 1
+
+_lock = threading.Lock()
+_context: Optional[zmq.Context] = None
+_async_context: Optional[zmq.asyncio.Context] = None
+_counters: Dict[str, int] = {'created': 0, 'closed': 0}
+
+
+def configure(**options: Optional[int]) -> None:
+    """ Set transport options.
+
+    Args:
+        io_threads: number of ZMQ I/O threads.
+        sndhwm, rcvhwm: send/receive high water marks (messages).
+        linger: milliseconds to keep unsent messages after close.
+        sndbuf, rcvbuf: kernel send/receive buffer sizes (bytes).
+        tcp_keepalive: 1 to enable TCP keepalive, 0 to disable it.
+        tcp_keepalive_idle, tcp_keepalive_intvl, tcp_keepalive_cnt:
+            TCP keepalive idle time, probe interval (seconds) and count.
+
+    Raises:
+        KeyError: unknown option
+    """
+    with _lock:
+        for name, value in options.items():
+            if name not in _options:
+                raise KeyError("unknown transport option '{}'".format(name))
+            _options[name] = value
+        if _context is not None and options.get('io_threads') is not None:
+            print("W: transport io_threads set after the ZMQ context was created, ignoring")
+
+
+def configure_from_settings(settings: Any) -> None:
+    """ Set transport options from a settings model (see
+    pybennu.settings.TransportSettings) or any object with the option names
+    as attributes.
+    """
+    configure(**{name: getattr(settings, name) for name in _options
+                 if hasattr(settings, name)})
+
+
+def context() -> zmq.Context:
+    """ Return the process-wide ZMQ context, creating it on first use.
+    """
+    global _context
+    with _lock:
+        if _context is None:
+            _context = zmq.Context(io_threads=_options['io_threads'] or 1)
+        return _context
+
+
+def async_context() -> zmq.asyncio.Context:
+    """ Return an asyncio view of the process-wide ZMQ context.
+    """
+    global _async_context
+    shared = context()
+    with _lock:
+        if _async_context is None:
+            _async_context = zmq.asyncio.Context.shadow(shared)
+        return _async_context
+
+
+def socket(kind: int, aio: bool = False) -> zmq.Socket:
+    """ Create a socket on the shared context with the configured options.
+
+    Args:
+        kind: ZMQ socket type, e.g. zmq.REQ.
+        aio: create a zmq.asyncio socket.
+    """
+    ctx = async_context() if aio else context()
+    sock = ctx.socket(kind)
+    with _lock:
+        options = [(_SOCKET_OPTIONS[name], value)
+                   for name, value in _options.items()
+                   if name in _SOCKET_OPTIONS and value is not None]
+        _counters['created'] += 1
+    for option, value in options:
+        try:
+            sock.setsockopt(option, value)
+        except zmq.ZMQError:
+            # e.g. TCP options on a UDP RADIO/DISH socket
+            pass
+    metrics.get_registry().count('transport.sockets_created')
+    return sock
+
+
+def close(sock: zmq.Socket, linger: Optional[int] = None) -> None:
+    """ Close a socket created by socket() and count it as closed.
+    """
+    if sock.closed:
+        return
+    sock.close(linger=linger)
+    with _lock:
+        _counters['closed'] += 1
+    metrics.get_registry().count('transport.sockets_closed')
+
+
+def counters() -> Dict[str, int]:
+    """ Return the sockets created, closed and still open in this process.
+    """
+    with _lock:
+        return {
+            'created': _counters['created'],
+            'closed': _counters['closed'],
+            'open': _counters['created'] - _counters['closed'],
+        }
@@ -29,7 +29,8 @@ from configparser import ConfigParser, NoOptionError
 
 from elasticsearch import Elasticsearch, helpers
 
-from pybennu.distributed.subscriber import Subscriber
+import pybennu.distributed.codec as codec
+from pybennu.distributed.subscriber import Subscriber, SubscriberCache
 from pybennu.providers.utils.daemon import Daemon
 import pybennu.distributed.swig._Endpoint as E
 
@@ -110,6 +111,8 @@ class GroundTruthMonitor(Daemon, Subscriber):
 
         self.__es = Elasticsearch([{'host': elastic_ip, 'port':'9200'}])
         Subscriber.__init__(self, self.publish_endpoint)
+        # latest value of every tag, parsed once per message
+        self.cache = SubscriberCache()
         self.time_last_send = datetime.now()
         Daemon.__init__(self, '/var/run/bennu-ground-truth-mon-%s.pid' % (args.env))
 
@@ -152,38 +155,34 @@ class GroundTruthMonitor(Daemon, Subscriber):
         time_diff = now - self.time_last_send
         self.__parse_filter()
 
-        points = message.split(',')
-
-        for point in points:
-            if len(point)>1: #end of message may be empty
-                message_dict = {}
-                split = point.split(':')
-                tag = split[0]
-                value = split[1]
-                if 'alert' in tag or 'batch' in tag:
-                    if time_diff.seconds >= 30:
-                        self.time_last_send = now
-                    else:
-                        return
-
-                message_dict['@timestamp'] = datetime.now()
-                message_dict['provider'] = E.Endpoint_str_get(self.publish_endpoint)
-                tags = tag.split('.')
-                if len(tags) == 2:
-                    message_dict['device'] = tags[0]
-                    message_dict['field'] = tags[1]
+        provider = E.Endpoint_str_get(self.publish_endpoint)
+
+        for tag, value in self.cache.update_text(message).items():
+            message_dict = {}
+            if 'alert' in tag or 'batch' in tag:
+                if time_diff.seconds >= 30:
+                    self.time_last_send = now
                 else:
-                    message_dict['device'] = tags[0]
-                    message_dict['field'] = ''
-                try:
-                    message_dict['value'] = float(value)
-                except:
-                    message_dict['status'] = value
+                    return
+
+            message_dict['@timestamp'] = datetime.now()
+            message_dict['provider'] = provider
+            tags = tag.split('.')
+            if len(tags) == 2:
+                message_dict['device'] = tags[0]
+                message_dict['field'] = tags[1]
+            else:
+                message_dict['device'] = tags[0]
+                message_dict['field'] = ''
+            if isinstance(value, float):
+                message_dict['value'] = value
+            else:
+                message_dict['status'] = codec.format_value(value)
 
-                #check that message is in filter
-                if self.__filter_message(message_dict):
-                    with self.__lock:
-                        self.new_data.append(message_dict)
+            #check that message is in filter
+            if self.__filter_message(message_dict):
+                with self.__lock:
+                    self.new_data.append(message_dict)
 
     def __parse_filter(self):
         filters = self._filter.split(' ')
@@ -17,89 +17,52 @@ import math
 from distutils.util import strtobool
 from py_expression_eval import Parser
 
-from pybennu.distributed.subscriber import Subscriber
+from pybennu.distributed.subscriber import Subscriber, SubscriberCache
 from pybennu.distributed.client import Client
 import pybennu.distributed.swig._Endpoint as E
 
-#Adding a timeout helper to cause client objects not to feeze program
-import signal
-from contextlib import contextmanager
-
-
-@contextmanager
-def timeout(time):
-    # Register a function to raise a TimeoutError on the signal.
-    signal.signal(signal.SIGALRM, raise_timeout)
-    # Schedule the signal to be sent after ``time``
-    signal.alarm(time)
-
-    try:
-        yield
-    except TimeoutError:
-        pass
-    finally:
-        # Unregister the signal so it won't be triggered
-        # if the timeout is not reached.
-        signal.signal(signal.SIGALRM, signal.SIG_IGN)
-
-
-def raise_timeout(signum, frame):
-    raise TimeoutError
-
 logging.basicConfig(level=logging.DEBUG,format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('alicanto')
 #logger.addHandler(logging.StreamHandler())
 
 
 class alicantoSubscriber(Subscriber):
-    def __init__(self, sub_source):
-        new_publish_endpoint = E.new_Endpoint()
-        E.Endpoint_str_set(new_publish_endpoint, 'udp://'+str(sub_source))
-        Subscriber.__init__(self, new_publish_endpoint)
+    def __init__(self, sub_sources):
+        """One DISH socket (and thread) for every subscription source"""
+        Subscriber.__init__(self, None)
+        for sub_source in sub_sources:
+            self.add_source('udp://'+str(sub_source), label=sub_source)
 
 class alicantoClient(Client):
     def __init__(self, end_dest):
         new_endpoint_dest = E.new_Endpoint()
         E.Endpoint_str_set(new_endpoint_dest, 'tcp://'+str(end_dest))
-        Client.__init__(self, new_endpoint_dest)
-    
+        Client.__init__(self, new_endpoint_dest, timeout=10)
+
     def send(self, message):
         """ Send message to Provider
-        """
-        reply = None
-        with timeout(10):
-            self.connect()
-
-            #try:
-
-            # send update
-            self._Client__socket.send_string(message+'\0') # must include null byte
-            # get response
-            msg = self._Client__socket.recv_string()
-            reply = msg.split('=')
-            status = reply[0]
-            data = reply[1]
-
-            if status == self._Client__kACK:
-                logger.info(f"I: ACK -- {data}")
-                #self.reply_handler(data)
-            else:
-                logger.error(f"I: ERR -- {msg}")
-
-            #finally:
-            #    logger.debug(f"DEBUG: Closing socket and context...")
-            #    self._Client__socket.close()
-            #    self._Client__context.term()
-            #    logger.debug(f"DEBUG: ... Closed socket and context")
 
+        The request goes through the shared connection pool, so the socket
+        is reused between requests and rebuilt if a request times out.
+        """
         try:
-            self._Client__socket.close()
-            self._Client__context.term()
-        except: 
-            pass
+            msg = self.request(message)
+        except TimeoutError as err:
+            logger.error(f"I: TIMEOUT -- {err}")
+            return None
+
+        reply = msg.split('=')
+        status = reply[0]
+        data = reply[1]
+
+        if status == self._Client__kACK:
+            logger.info(f"I: ACK -- {data}")
+            #self.reply_handler(data)
+        else:
+            logger.error(f"I: ERR -- {msg}")
 
         return reply
-        
+
 class alicanto():
     def __init__(self, config, debug=False, exit_handler=None):
 
@@ -124,6 +87,10 @@ class alicanto():
         self.parser = Parser()
         # Set of all tags 
         self.tags = dict()
+        # Set of subscription tags
+        self.subscriptions = set()
+        # Destination=>client map, clients are reused for every request
+        self.clients = dict()
 
         ##############  Get counts from json  ######################
         cfg = None
@@ -176,6 +143,7 @@ class alicanto():
                 sub_info = None
             logger.info(f"Registered subscription ---> sub_name: {sub_name} ---> sub_type: {sub_type} ---> sub_info: {sub_info}")
             self.tags.update({sub_name : 0 })
+            self.subscriptions.add(sub_name)
             self.types[sub_name] = sub_type
             if sub_info:
                 logger.info(f"********** LOGIC **********")
@@ -189,14 +157,20 @@ class alicanto():
         for tag in self.tags:
             self.state[tag] = False if self.get_type(tag) == 'bool' else 0
         
+        # Subscribed values are parsed once by the cache, and only the
+        #   configured subscription tags are kept
+        self.cache = SubscriberCache(tag for tag in self.tags if tag in self.subscriptions)
+        self.cache.on_change(self._subscription_changed)
+
         for sub_source in self.sub_sources:
-            logger.info(f"Launching Subscriber Thread ---> subscription: udp://{sub_source}")
-            subber = alicantoSubscriber(sub_source)
-            subber.subscription_handler = self._subscription_handler
-            self.__sub_thread = threading.Thread(target=subber.run)
-            self.__sub_thread.setName(sub_source)
-            self.__sub_thread.daemon = True
-            self.__sub_thread.start()
+            logger.info(f"Subscribing ---> subscription: udp://{sub_source}")
+        logger.info(f"Launching Subscriber Thread ---> {len(self.sub_sources)} subscriptions")
+        subber = alicantoSubscriber(self.sub_sources)
+        self.cache.attach(subber, by_source=True)
+        self.__sub_thread = threading.Thread(target=subber.run)
+        self.__sub_thread.name = 'alicanto-subscriber'
+        self.__sub_thread.daemon = True
+        self.__sub_thread.start()
          
 
     def run(self):
@@ -218,7 +192,7 @@ class alicanto():
 
             logger.info("Reading initial value from client now...")
             try: 
-                client = alicantoClient(end_dest)
+                client = self.get_client(end_dest)
             except:
                 logger.error(f"\tError Initializing Client: {client}")
                 continue
@@ -312,7 +286,7 @@ class alicanto():
                 # Send update
                 logger.info(f"Sending value update...")
                 try:
-                    client = alicantoClient(end_dest)
+                    client = self.get_client(end_dest)
                 except:
                     logger.error(f"\tError Initializing Client: {client}")
                     continue
@@ -351,6 +325,11 @@ class alicanto():
             logger.info(f"{tag:<30} --- {self.get_tag(tag):}")
         logger.info("============================================")
 
+    def get_client(self, end_dest):
+        if end_dest not in self.clients:
+            self.clients[end_dest] = alicantoClient(end_dest)
+        return self.clients[end_dest]
+
     def get_type(self, tag):
         return self.types[tag]
 
@@ -366,54 +345,36 @@ class alicanto():
             if value is not None:
                 self.state[tag] = value
 
-    def _subscription_handler(self, message):
-        """Receive Subscription message
-        This method gets called by the Subscriber base class in its run()
-        method when a message from a publisher is received.
-
-        Ex message: "point1.value:10.50,point2.value:1.00,"
+    def _subscription_changed(self, full_tag, value, previous):
+        """Receive a changed subscription value
+        This method gets called by the subscription cache when a subscribed
+        point ("<source>/<tag>") changes value.
 
         Args:
-            message (str): published zmq message as a string
+            full_tag (str): subscription key
+            value: new value, already converted to bool/float by the cache
+            previous: previous value, None for the first value received
         """
-        points = message.split(',')
-        points = points[:-1] # remove last element since it might be empty
-        sub_source = threading.current_thread().name
-        
-        for point in points:
-            if not point or len(point) <= 1:
-                continue 
-
+        if self.types[full_tag] == 'bool':
+            if isinstance(value, str):
+                # the cache only converts lowercase true/false
+                value = value.lower()
+                if value not in ('true', 'false'):
+                    return
+                value = value == 'true'
+            value = bool(value)
+            if self.get_tag(full_tag) != value:
+                self.set_tag(full_tag, value)
+                logger.debug(f"UPDATE NOW: {full_tag} = {value}")
+        else:
             try:
-                tag = point.split(':')[0]
-                full_tag = sub_source + '/' + tag
-                value = point.split(':')[1]
-            except:
-                continue
-            
-            if full_tag not in self.tags:
-                continue
-
-            if self.types[full_tag] == 'bool':
-                if value.lower() == 'false' or value == '0':
-                    value = False
-                    field = 'status'
-                elif value.lower() == 'true' or value == '1':
-                    value = True
-                    field = 'status'
-            else:
                 value = float(value)
-                field = 'value'
-
-            if field == 'value':
-                if not math.isclose(float(self.get_tag(full_tag)), value):  
-                    self.set_tag(full_tag, value)
-                    logger.debug(f"UPDATE NOW: {full_tag} = {value}")
-            elif field == 'status':
-                if self.get_tag(full_tag) != value:  
-                    self.set_tag(full_tag, value)
-                    logger.debug(f"UPDATE NOW: {full_tag} = {value}")
-            
+            except ValueError:
+                return
+            if not math.isclose(float(self.get_tag(full_tag)), value):
+                self.set_tag(full_tag, value)
+                logger.debug(f"UPDATE NOW: {full_tag} = {value}")
+
     def ctrl_exit_handler(self, signal, frame):
         logger.info("SIGINT or CTRL-C detected. Exiting gracefully")
         sys.exit()
@@ -0,0 +1,376 @@
+"""Command line benchmarks.
+
+provider: start a synthetic ElectricPowerService with N tags on local
+endpoints, drive it with M concurrent clients and S subscribers, and report
+request throughput and latency percentiles, publish cycle time and dropped
+fragments. Each tag count is measured in its own process.
+
+compression: compare the datagrams, bytes and CPU time needed to publish a
+large PyPower-like text message as plain text, as fragments and as
+zlib-compressed fragments (with and without the tag name dictionary).
+
+Both print a table by default, or JSON with --json so results can be
+tracked across versions.
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+import pybennu.distributed.codec as codec
+import pybennu.distributed.metrics as metrics
+
+
+def synthetic_message(buses: int, seed: int = 0) -> str:
+    """A text message shaped like a PyPower case publish."""
+    rng = random.Random(seed)
+    values: Dict[str, object] = {}
+    for i in range(1, buses + 1):
+        values['bus-{}.voltage'.format(i)] = round(rng.uniform(0.95, 1.05), 6)
+        values['bus-{}.angle'.format(i)] = round(rng.uniform(-30, 30), 6)
+        values['bus-{}.base_kv'.format(i)] = 138.0
+        values['load-{}_bus-{}.mw'.format(i, i)] = round(rng.uniform(0, 100), 4)
+        values['load-{}_bus-{}.mvar'.format(i, i)] = round(rng.uniform(-20, 20), 4)
+        values['load-{}_bus-{}.active'.format(i, i)] = True
+        values['branch-{}_bus-{}-bus-{}.current'.format(i, i, i % buses + 1)] = round(rng.uniform(0, 2), 6)
+        values['branch-{}_bus-{}-bus-{}.active'.format(i, i, i % buses + 1)] = True
+    return codec.encode_text(values)
+
+
+def _time(func: Callable[[], object], repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - start) / repeat
+
+
+def _print_table(rows: List[Dict[str, Any]], columns: List[str]) -> None:
+    cells = [[_format(row.get(column, '')) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in cells])
+              for i, column in enumerate(columns)]
+    print('  '.join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in cells:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, float):
+        return '{:.4g}'.format(value)
+    return str(value)
+
+
+def compression(args: argparse.Namespace) -> Dict[str, Any]:
+    msg = synthetic_message(args.buses)
+    data = msg.encode('utf-8')
+    dictionary = codec.build_dictionary(codec.parse_text(msg))
+    encoder = codec.FragmentEncoder(args.mtu)
+    rows: List[Dict[str, Any]] = []
+
+    def report(mode: str, frames: List[bytes], encode: float, decode: float) -> None:
+        size = sum(len(frame) for frame in frames)
+        rows.append({'mode': mode, 'datagrams': len(frames), 'bytes': size,
+                     'ratio': size / len(data), 'encode_ms': encode * 1e3,
+                     'decode_ms': decode * 1e3})
+
+    def text():
+        return [bytes(frame) for frame in codec.text_fragments(data, args.mtu)]
+
+    report('text', text(), _time(text, args.repeat),
+           _time(lambda: codec.parse_text(msg), args.repeat))
+
+    def fragments(payload=data, flags=0):
+        return [bytes(frame) for frame in encoder.frames(payload, flags)]
+
+    def reassemble(frames):
+        assembler = codec.FragmentAssembler()
+        for frame in frames:
+            result = assembler.add(frame)
+        return result
+
+    frames = fragments()
+    report('fragments', frames, _time(fragments, args.repeat),
+           _time(lambda: reassemble(frames), args.repeat))
+
+    decompressor = codec.Decompressor()
+    decompressor.add_dictionary(codec.DICTIONARY_ID.pack(codec.dictionary_id(dictionary)) + dictionary)
+    for name, zdict in (('zlib', None), ('zlib+dict', dictionary)):
+        for level in args.levels:
+            def encode():
+                payload = codec.compress(data, zdict, level)
+                return fragments(payload, codec.FLAG_COMPRESSED)
+
+            def decode():
+                _, payload = reassemble(frames)
+                return decompressor.decompress(payload)
+
+            frames = encode()
+            if decode() != data:
+                raise RuntimeError("{} level {} round trip failed".format(name, level))
+            report('{} -{}'.format(name, level), frames,
+                   _time(encode, args.repeat), _time(decode, args.repeat))
+
+    result = {'tags': msg.count(','), 'bytes': len(data), 'mtu': args.mtu,
+              'dictionary_bytes': len(dictionary), 'modes': rows}
+    if not args.json:
+        print("message: {tags} tags, {bytes} bytes, mtu {mtu}, "
+              "dictionary {dictionary_bytes} bytes".format(**result))
+        _print_table(rows, ['mode', 'datagrams', 'bytes', 'ratio', 'encode_ms', 'decode_ms'])
+    return result
+
+
+def provider(args: argparse.Namespace) -> Dict[str, Any]:
+    # imported here so the compression benchmark runs without ZMQ
+    from pybennu.executables.pybennu_test_ep_server import ElectricPowerService
+    from pybennu.distributed.client import ConnectionPool
+    from pybennu.distributed.subscriber import Subscriber
+
+    class SyntheticPowerService(ElectricPowerService):
+        """ ElectricPowerService with synthetic tags and a configurable
+        publish rate. """
+
+        def __init__(self, server_endpoint, publish_endpoint, tags, rate):
+            ElectricPowerService.__init__(self, server_endpoint, publish_endpoint, False)
+            self.mPS = {}
+            for i in range((tags + 3) // 4):
+                self.mPS['bus-{}.active'.format(i)] = "true"
+                self.mPS['bus-{}.voltage'.format(i)] = "1.0"
+                self.mPS['bus-{}.gen_mw'.format(i)] = "10.2"
+                self.mPS['bus-{}.number'.format(i)] = str(i)
+            self.rate = rate
+
+        def periodic_publish(self):
+            while True:
+                msg = ''.join([k + ':' + v + ',' for k, v in list(self.mPS.items())])
+                self.publish(msg)
+                time.sleep(1.0 / self.rate)
+
+    def measure(index: int, tags: int) -> Dict[str, Any]:
+        registry = metrics.get_registry()
+        server_endpoint = 'tcp://127.0.0.1:{}'.format(args.port + index)
+        if args.publish_endpoint.startswith('shm://'):
+            publish_endpoint = '{}-{}'.format(args.publish_endpoint, index)
+        else:
+            publish_endpoint = '{}:{}'.format(args.publish_endpoint, args.publish_port + index)
+
+        service = SyntheticPowerService(server_endpoint, publish_endpoint, tags, args.publish_rate)
+        service.set_server_workers(args.workers)
+        service.publisher.binary = args.publish_mode == 'binary'
+        service.publisher.fragment = args.publish_mode == 'fragments'
+        service.publisher.compress = args.publish_mode == 'compressed'
+
+        received = [0] * args.subscribers
+        subscribers = []
+        for i in range(args.subscribers):
+            subscriber = Subscriber(publish_endpoint)
+
+            def count(message, i=i):
+                received[i] += 1
+            subscriber.subscription_handler = count
+            subscriber.values_handler = count
+            threading.Thread(target=subscriber.run, daemon=True).start()
+            subscribers.append(subscriber)
+
+        registry.reset()
+        threading.Thread(target=service.run, daemon=True).start()
+        time.sleep(args.warmup)
+
+        names = list(service.mPS)
+        results = metrics.Metrics()
+        stop = threading.Event()
+
+        def client(seed):
+            rng = random.Random(seed)
+            pool = ConnectionPool(timeout=args.timeout)
+            while not stop.is_set():
+                choice = rng.random()
+                if choice < args.query_ratio:
+                    verb, message = 'QUERY', 'QUERY='
+                elif choice < args.query_ratio + args.write_ratio:
+                    verb, message = 'WRITE', 'WRITE={}:{:.4f}'.format(
+                        rng.choice(names), rng.uniform(0.9, 1.1))
+                else:
+                    verb, message = 'READ', 'READ=' + rng.choice(names)
+                start = time.perf_counter()
+                try:
+                    reply = pool.request(server_endpoint, message)
+                except TimeoutError:
+                    results.count('timeouts.' + verb)
+                    continue
+                results.observe(verb, time.perf_counter() - start)
+                if not reply.startswith('ACK'):
+                    results.count('errors.' + verb)
+            pool.close()
+
+        clients = [threading.Thread(target=client, args=(seed,), daemon=True)
+                   for seed in range(args.clients)]
+        start = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        client_stats = results.snapshot()
+        requests = {}
+        for verb in ('QUERY', 'READ', 'WRITE'):
+            count = client_stats.get(verb + '.count', 0)
+            requests[verb] = {
+                'count': count,
+                'per_second': count / elapsed,
+                'p50_ms': client_stats.get(verb + '.p50', 0.0) * 1e3,
+                'p95_ms': client_stats.get(verb + '.p95', 0.0) * 1e3,
+                'p99_ms': client_stats.get(verb + '.p99', 0.0) * 1e3,
+                'max_ms': client_stats.get(verb + '.max', 0.0) * 1e3,
+                'errors': client_stats.get('errors.' + verb, 0),
+                'timeouts': client_stats.get('timeouts.' + verb, 0),
+            }
+
+        provider_stats = registry.snapshot('publish.*')
+        dropped = {}
+        for subscriber in subscribers:
+            for name, value in subscriber.counters().items():
+                dropped[name] = dropped.get(name, 0) + value
+        return {
+            'tags': len(names),
+            'seconds': elapsed,
+            'requests': requests,
+            'total_per_second': sum(r['count'] for r in requests.values()) / elapsed,
+            'publish': {
+                'messages': provider_stats.get('publish.messages', 0),
+                'datagrams': provider_stats.get('publish.datagrams', 0),
+                'bytes': provider_stats.get('publish.bytes', 0),
+                'cycle_p50_ms': provider_stats.get('publish.duration.p50', 0.0) * 1e3,
+                'cycle_p99_ms': provider_stats.get('publish.duration.p99', 0.0) * 1e3,
+                'cycle_max_ms': provider_stats.get('publish.duration.max', 0.0) * 1e3,
+            },
+            'subscribers': {
+                'received': received,
+                'fragments_lost': dropped.get('fragment_lost', 0),
+                'incomplete': dropped.get('fragment_incomplete', 0),
+                'shm_overruns': dropped.get('shm_overruns', 0),
+            },
+        }
+
+    # every tag count runs in a child process: providers and subscribers
+    # can't be stopped, and the ones left running by an earlier run would
+    # skew the request and publish metrics of the next one
+    processes = multiprocessing.get_context('fork')
+    runs = []
+    for index, tags in enumerate(args.tags):
+        queue = processes.SimpleQueue()
+
+        def target(index=index, tags=tags, queue=queue):
+            try:
+                queue.put(measure(index, tags))
+            except Exception as err:
+                queue.put(RuntimeError('{} tags run failed: {}'.format(tags, err)))
+
+        child = processes.Process(target=target)
+        child.start()
+        run = queue.get()
+        child.join()
+        if isinstance(run, Exception):
+            raise run
+        runs.append(run)
+
+    result = {'clients': args.clients, 'subscribers': args.subscribers,
+              'workers': args.workers, 'publish_mode': args.publish_mode,
+              'publish_rate': args.publish_rate, 'runs': runs}
+    if not args.json:
+        for run in runs:
+            print("{} tags, {} clients, {} workers: {:.0f} requests/s".format(
+                run['tags'], args.clients, args.workers, run['total_per_second']))
+            _print_table([dict(verb=verb, **stats) for verb, stats in run['requests'].items()],
+                         ['verb', 'count', 'per_second', 'p50_ms', 'p95_ms', 'p99_ms',
+                          'max_ms', 'errors', 'timeouts'])
+            print("publish: " + ', '.join('{} {}'.format(name, _format(value))
+                                          for name, value in run['publish'].items()))
+            print("subscribers: " + ', '.join('{} {}'.format(name, value)
+                                              for name, value in run['subscribers'].items()))
+            print()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="pybennu benchmarks")
+    parser.add_argument('--json', action='store_true',
+                        help="print the results as JSON")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_provider = commands.add_parser(
+        'provider', help="measure provider request throughput and publish time")
+    parser_provider.add_argument(
+        '--tags', type=int, nargs='+', default=[100, 1000, 10000],
+        help="synthetic tag counts, one run each (default: 100 1000 10000)")
+    parser_provider.add_argument(
+        '--clients', type=int, default=4,
+        help="concurrent clients (default: 4)")
+    parser_provider.add_argument(
+        '--subscribers', type=int, default=1,
+        help="subscribers (default: 1)")
+    parser_provider.add_argument(
+        '--workers', type=int, default=0,
+        help="provider server workers, 0 for a single REP loop (default: 0)")
+    parser_provider.add_argument(
+        '--duration', type=float, default=5.0,
+        help="seconds to run each tag count for (default: 5)")
+    parser_provider.add_argument(
+        '--warmup', type=float, default=0.5,
+        help="seconds to wait for the provider to start (default: 0.5)")
+    parser_provider.add_argument(
+        '--query-ratio', type=float, default=0.01,
+        help="fraction of requests that are QUERY (default: 0.01)")
+    parser_provider.add_argument(
+        '--write-ratio', type=float, default=0.1,
+        help="fraction of requests that are WRITE, the rest are READ (default: 0.1)")
+    parser_provider.add_argument(
+        '--timeout', type=float, default=5.0,
+        help="request timeout in seconds (default: 5)")
+    parser_provider.add_argument(
+        '--publish-rate', type=float, default=10.0,
+        help="provider publishes per second (default: 10)")
+    parser_provider.add_argument(
+        '--publish-mode', default='text',
+        choices=['text', 'fragments', 'binary', 'compressed'],
+        help="publish mode (default: text)")
+    parser_provider.add_argument(
+        '--port', type=int, default=15555,
+        help="first server port, one per tag count (default: 15555)")
+    parser_provider.add_argument(
+        '--publish-endpoint', default='udp://239.0.0.1',
+        help="publish address without the port, or shm://<name> (default: udp://239.0.0.1)")
+    parser_provider.add_argument(
+        '--publish-port', type=int, default=45000,
+        help="first publish port, one per tag count (default: 45000)")
+    parser_provider.set_defaults(func=provider)
+
+    parser_compression = commands.add_parser(
+        'compression', help="compare publish encodings of a large text message")
+    parser_compression.add_argument(
+        '--buses', type=int, default=2000,
+        help="number of buses in the synthetic case (default: 2000)")
+    parser_compression.add_argument(
+        '--mtu', type=int, default=1400,
+        help="datagram payload size (default: 1400)")
+    parser_compression.add_argument(
+        '--levels', type=int, nargs='+', default=[1, 6, 9],
+        help="zlib compression levels to compare (default: 1 6 9)")
+    parser_compression.add_argument(
+        '--repeat', type=int, default=20,
+        help="encode/decode repetitions to average (default: 20)")
+    parser_compression.set_defaults(func=compression)
+
+    args = parser.parse_args()
+    result = args.func(args)
+    if args.json:
+        print(json.dumps(dict(command=args.command, **result), indent=2))
+
+
+if __name__ == '__main__':
+    main()
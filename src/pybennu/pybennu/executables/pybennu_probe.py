@@ -37,6 +37,10 @@ def main() -> None:
         '-t', '--tag',
         help="Full tag name, e.g. 'bus101.active', 'br1.closed' or 'pv_power.value'"
     )
+    parser.add_argument(
+        '--timeout', type=float, default=None,
+        help="Seconds to wait for a reply before giving up (default: wait forever)"
+    )
     value_group = parser.add_mutually_exclusive_group()
     value_group.add_argument(
         '-v', '--value',
@@ -64,7 +68,7 @@ def main() -> None:
     # print(E.Endpoint_hash(endpoint))
     # 15fd2f305feef8d
 
-    probe = client.Client(endpoint)
+    probe = client.Client(endpoint, timeout=args.timeout)
     probe.reply_handler = handler
 
     msg = ""
@@ -85,7 +89,11 @@ def main() -> None:
         sys.exit(1)
 
     print(f"Sending message: {msg}")
-    probe.send(msg)
+    try:
+        probe.send(msg)
+    except TimeoutError as err:
+        print(f"ERROR: {err}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -6,9 +6,12 @@ import sys
 import signal
 import time
 
-from configparser import ConfigParser, NoOptionError
+from configparser import ConfigParser, NoOptionError, SectionProxy
 
 import pybennu.distributed.swig._Endpoint as E
+import pybennu.distributed.transport as transport
+from pybennu.distributed.provider import Provider
+from pybennu.distributed.scheduler import PublishScheduler
 from pybennu.providers.utils.daemon import Daemon
 from pybennu.settings import PybennuSettings, load_settings_yaml
 
@@ -64,6 +67,8 @@ class ServerDaemon(Daemon):
                       "configuration file\n")
                 sys.exit(-1)
 
+            self._configure_transport(config['power-solver-service'])
+
             #########################################
             ################ Dummy ##################
             #########################################
@@ -103,11 +108,35 @@ class ServerDaemon(Daemon):
                           "configuration file: 'server-endpoint,"
                           "'publish-endpoint', 'case-file'\n")
                     sys.exit(-1)
+                cache_size = config.getint('power-solver-service',
+                                           'solution-cache', fallback=32)
+                contingency_workers = config.getint('power-solver-service',
+                                                    'contingency-workers', fallback=0)
+                solve_mode = config.get('power-solver-service', 'solve-mode',
+                                        fallback='ac').strip().lower()
+                if solve_mode not in ('ac', 'dc', 'ac-dc'):
+                    print(f"\nERROR: invalid 'solve-mode' {solve_mode!r}, "
+                          "must be one of: ac, dc, ac-dc\n")
+                    sys.exit(-1)
 
                 from pybennu.providers.power.solvers.python_power import PyPower
                 self.solver = PyPower(
-                    server_endpoint, publish_endpoint, case_file, debug
+                    server_endpoint, publish_endpoint, case_file, debug, cache_size,
+                    contingency_workers, solve_mode
                 )
+                profiles = config.get('power-solver-service', 'profiles', fallback='').strip()
+                if profiles:
+                    try:
+                        self.solver.enable_timeseries(
+                            [path.strip() for path in profiles.split(',') if path.strip()],
+                            speed=config.getfloat('power-solver-service',
+                                                  'profile-speed', fallback=1.0),
+                            loop=config.getboolean('power-solver-service',
+                                                   'profile-loop', fallback=False),
+                        )
+                    except (OSError, ValueError, KeyError) as err:
+                        print(f"\nERROR: invalid 'profiles': {err}\n")
+                        sys.exit(-1)
 
             #########################################
             ############## PowerWorld ###############
@@ -246,6 +275,7 @@ class ServerDaemon(Daemon):
 
                 config_path = Path(config.get('power-solver-service', 'config-file').strip())
                 settings = load_settings_yaml(config_path)  # type: PybennuSettings
+                transport.configure_from_settings(settings.transport)
 
                 E.Endpoint_str_set(server_endpoint, settings.server_endpoint)
                 E.Endpoint_str_set(publish_endpoint, settings.publish_endpoint)
@@ -279,6 +309,7 @@ class ServerDaemon(Daemon):
 
                 config_path = Path(config.get('power-solver-service', 'config-file').strip())
                 settings = load_settings_yaml(config_path) # type: PybennuSettings
+                transport.configure_from_settings(settings.transport)
 
                 E.Endpoint_str_set(server_endpoint, settings.server_endpoint)
                 E.Endpoint_str_set(publish_endpoint, settings.publish_endpoint)
@@ -293,6 +324,7 @@ class ServerDaemon(Daemon):
 
                 config_path = Path(config.get('power-solver-service', 'config-file').strip())
                 settings = load_settings_yaml(config_path)  # type: PybennuSettings
+                transport.configure_from_settings(settings.transport)
 
                 E.Endpoint_str_set(server_endpoint, settings.server_endpoint)
                 E.Endpoint_str_set(publish_endpoint, settings.publish_endpoint)
@@ -373,12 +405,120 @@ class ServerDaemon(Daemon):
                     server_endpoint, publish_endpoint, debug
                 )
 
+            if isinstance(self.solver, Provider):
+                self._configure_provider(config['power-solver-service'])
+
         self.running = True
         self._solver_run()
 
         while self.running:
             time.sleep(1)
 
+    def _configure_transport(self, section: SectionProxy) -> None:
+        """Apply the optional ZMQ socket settings, before any socket is created."""
+        options = {}
+        for key in ('io-threads', 'sndhwm', 'rcvhwm', 'linger', 'sndbuf', 'rcvbuf',
+                    'tcp-keepalive', 'tcp-keepalive-idle', 'tcp-keepalive-intvl',
+                    'tcp-keepalive-cnt'):
+            if key in section:
+                try:
+                    options[key.replace('-', '_')] = section.getint(key)
+                except ValueError:
+                    print(f"\nERROR: '{key}' must be an integer\n")
+                    sys.exit(-1)
+        transport.configure(**options)
+
+    def _configure_provider(self, section: SectionProxy) -> None:
+        """Apply the optional publish/server settings common to all providers."""
+        self.solver.set_server_workers(section.getint('server-workers', fallback=0))
+
+        stats_interval = section.getfloat('stats-interval', fallback=0.0)
+        if stats_interval > 0:
+            self.solver.metrics.start_dump(stats_interval)
+
+        publish_mode = section.get('publish-mode', fallback='text').strip().lower()
+        if publish_mode not in ('text', 'binary'):
+            print(f"\nERROR: invalid 'publish-mode' {publish_mode!r}, "
+                  "must be one of: text, binary\n")
+            sys.exit(-1)
+        self.solver.publisher.binary = publish_mode == 'binary'
+        self.solver.publisher.schema_interval = section.getfloat(
+            'schema-interval', fallback=self.solver.publisher.schema_interval)
+        self.solver.publisher.fragment = section.getboolean('publish-fragments', fallback=False)
+        self.solver.publish_version = section.getboolean('publish-version', fallback=False)
+        self.solver.publisher.compress = section.getboolean('publish-compression', fallback=False)
+        self.solver.publisher.compression_level = section.getint(
+            'compression-level', fallback=self.solver.publisher.compression_level)
+
+        if section.getboolean('write-batching', fallback=False):
+            self.solver.enable_write_batching(
+                window=section.getfloat('write-window', fallback=0.01),
+                max_delay=section.getfloat('write-max-delay', fallback=0.1),
+            )
+
+        if section.getboolean('delta-publish', fallback=False):
+            delta = self.solver.enable_delta_publish(
+                keyframe_interval=section.getfloat('keyframe-interval', fallback=10.0),
+                absolute=section.getfloat('deadband-absolute', fallback=0.0),
+                relative=section.getfloat('deadband-relative', fallback=0.0),
+            )
+            # comma-separated list of <tag pattern>:<absolute>:<relative>
+            for entry in section.get('deadbands', fallback='').split(','):
+                if not entry.strip():
+                    continue
+                try:
+                    pattern, absolute, relative = entry.strip().split(':')
+                    delta.set_deadband(pattern, float(absolute), float(relative))
+                except ValueError:
+                    print(f"\nERROR: invalid 'deadbands' entry {entry.strip()!r}, "
+                          "expected <tag pattern>:<absolute>:<relative>\n")
+                    sys.exit(-1)
+
+        if section.getboolean('publish-scheduler', fallback=False):
+            self._configure_scheduler(section)
+
+        if section.getboolean('change-publish', fallback=False):
+            try:
+                self.solver.enable_change_publish(
+                    window=section.getfloat('change-window', fallback=0.01),
+                    min_interval=section.getfloat('change-min-interval', fallback=0.1),
+                )
+            except NotImplementedError as err:
+                print(f"\nERROR: 'change-publish' is not supported: {err}\n")
+                sys.exit(-1)
+
+    def _configure_scheduler(self, section: SectionProxy) -> None:
+        """Publish tags in rate classes instead of the solver's fixed period."""
+        try:
+            scheduler = self.solver.enable_publish_scheduler(
+                default_rate=self._parse_rate(section.get('publish-rate', fallback='1')),
+                change_interval=section.getfloat('change-interval', fallback=0.1),
+                keyframe_interval=section.getfloat('keyframe-interval', fallback=10.0),
+            )
+            # comma-separated list of <class name>:<rate in Hz | change>
+            for entry in section.get('publish-classes', fallback='').split(','):
+                if entry.strip():
+                    name, rate = entry.strip().split(':')
+                    scheduler.add_class(name.strip(), self._parse_rate(rate))
+            # comma-separated list of <tag pattern>:<class name>
+            for entry in section.get('publish-assign', fallback='').split(','):
+                if entry.strip():
+                    pattern, name = entry.strip().rsplit(':', 1)
+                    scheduler.assign(pattern.strip(), name.strip())
+        except NotImplementedError as err:
+            print(f"\nERROR: 'publish-scheduler' is not supported: {err}\n")
+            sys.exit(-1)
+        except (ValueError, KeyError) as err:
+            print(f"\nERROR: invalid publish scheduler settings: {err}\n")
+            sys.exit(-1)
+
+    @staticmethod
+    def _parse_rate(rate: str) -> float:
+        rate = rate.strip().lower()
+        if rate == 'change':
+            return PublishScheduler.ON_CHANGE
+        return float(rate)
+
     def handle_exit(self, signum, stack) -> None:
         print("\nStopping power solver service...\n")
         self.running = False
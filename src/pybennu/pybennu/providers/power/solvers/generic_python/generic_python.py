@@ -14,6 +14,7 @@ import threading
 import argparse
 import importlib
 from configparser import ConfigParser
+import pybennu.distributed.codec as codec
 from pybennu.distributed.provider import Provider
 from pybennu.providers.power.solvers.generic_python.base_simulation import BaseSimulation
 
@@ -162,6 +163,10 @@ class GenericPython(Provider):
 
         return msg
 
+    def snapshot(self) -> dict:
+        """Current value of every tag, used for scheduled publishing."""
+        return codec.parse_text(self._pack_data())
+
     def periodic_publish(self) -> None:
         """Loop that calls `self.publish` every second."""
 
@@ -259,6 +259,7 @@ class OPALRT(Provider):
             # basically a split-brain/partial-read. Using a lock prevents that from happening.
             with self.__current_values_lock:
                 self.current_values.update(mb_vals)
+                self.state_changed()
 
             # Save data to Elasticsearch
             if self.es:
@@ -531,6 +532,9 @@ class OPALRT(Provider):
                             self.current_values[f"{pmu.name}_ANALOG_{i+1}.real"] = analog_value
                             self.current_values[f"{pmu.name}_ANALOG_{i+1}.angle"] = analog_value
 
+                    # values from the same PMU frame share a state version
+                    self.state_changed(sim_time=frame["time"])
+
                     # TODO: "digital" fields
 
                 # Create CSV writer if it doesn't exist
@@ -682,13 +686,14 @@ class OPALRT(Provider):
         while True:
             # mutex to prevent threads from writing while we're reading
             with self.__current_values_lock:
+                version = self.version()
                 tags = [
                     f"{tag}:{self._serialize_value(value)}"
                     for tag, value in self.current_values.items()
                 ]
 
             msg = "Write={" + ",".join(tags) + "}"
-            self.publish(msg)
+            self.publish(msg, version)
 
             # If publish_rate is not positive (0), don't sleep and go as fast as possible
             # Otherwise (if it's non-zero), log the points, and sleep like usual
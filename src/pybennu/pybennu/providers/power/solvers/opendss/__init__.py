@@ -16,6 +16,7 @@ FUNCTIONS
     def query(self)
     def read(self, tag)
     def write(self, tags)
+    def snapshot(self)
     def periodic_publish(self)
     def __pack_message(self)
     def __create(self)
@@ -23,8 +24,12 @@ FUNCTIONS
     def __solve(self, first='false')
     def __run_command(self, text)
     def __initialize_phases(self)
-    def __get_voltcurpow_1_terminal(self, phases)
-    def __get_voltcurpow_2_terminal(self, phases)
+    def __map_conductors(self, element, prefix)
+    def __index_conductors(self, node_names)
+    def __read_pd_elements(self)
+    def __index_pd_elements(self, names)
+    def __read_conductors(self, element)
+    def __refresh_enabled(self)
     def __compile_circuit(self, filename=None)
     def __save_and_clear_circuit(self)
     def __gen_rand_num(self)
@@ -125,9 +130,14 @@ FUNCTIONS
     __update()
 
         Reads circuit elements from OpenDSS and updates the internal
-        representation of the system under test. Blocked by the mutex lock if
-        a publish message is currently being built in the
-        `pack_message` function.
+        representation of the system under test. Voltages are read for the
+        whole circuit at once, and currents and powers per element class
+        where OpenDSS provides bulk getters. The PDElements bulk getters are
+        not available in the pinned OpenDSSDirect.py 0.6.1, so with it only
+        the voltages are read in bulk and every element's currents and powers
+        are still read one at a time. Blocked by the mutex lock if a
+        publish message is currently being built in the `pack_message`
+        function.
 
         Args: none
 
@@ -173,30 +183,56 @@ FUNCTIONS
 
         Returns: none
 
-    __get_voltcurpow_1_terminal(phases)
+    __map_conductors(element, prefix)
 
-        Get the voltage, current, and power data for the currently active
-        element. This function is for single terminal elements only.
+        Record the circuit node, position in the element's currents and
+        powers, and data class fields of each conductor of the currently
+        active element.
 
         Args:
-            * The base64-encoded phases associated with the current element
+            * The element's data class
+            * The qualifier added to the element's name during create
 
-        Returns:
-            * A list of the voltage, current, and power (magnitude and angle)
+        Returns: none
 
-    __get_voltcurpow_2_terminal(phases)
+    __index_conductors(node_names)
 
-        Get the voltage, current, and power data for the currently active
-        element. This function is for two terminal elements only.
+        Build the index maps used to scatter the circuit-wide voltages and
+        the per element currents and powers into the data classes.
 
         Args:
-            * The base64-encoded phases associated with the current element
+            * The names of all nodes in the circuit, in the order of the
+              circuit-wide voltage arrays
+
+        Returns: none
+
+    __read_pd_elements()
+
+        Read the currents and powers of all power delivery elements using the
+        PDElements bulk getters, if available.
+
+        Args: none
 
         Returns:
-            * A list of the voltage, current, and power (magnitude and angle)
-              for terminal 1
-            * A list of the voltage, current, and power (magnitude and angle)
-              for terminal 2
+            * The names of the elements read
+
+    __index_pd_elements(names)
+
+        Map the rows of the PDElements bulk arrays to the elements.
+
+        Args:
+            * The names of all power delivery elements, in bulk array order
+
+        Returns: none
+
+    __read_conductors(element)
+
+        Read the currents and powers of the currently active element.
+
+        Args:
+            * The element's data class
+
+        Returns: none
 
 
 NOTES
@@ -217,14 +253,46 @@ import base64, copy, json, os, random, shutil, tempfile, threading, time
 from datetime import datetime
 from timeit   import default_timer as timer
 
+import numpy               as np
 import opendssdirect       as dss
 import opendssdirect.utils as dss_utils
 
+import pybennu.distributed.codec as codec
 from pybennu.distributed.provider import Provider
 from pybennu.providers.power      import PowerSolverError
 
 import pybennu.providers.power.solvers.opendss.data as models
 
+PHASES = ('p1', 'p2', 'p3', 'pn')
+
+# Fields holding the voltage magnitude and angle, current magnitude and angle,
+# and real and reactive power of each conductor of an element, per terminal.
+# Transformer power is defined as the power calculated on winding 1.
+ONE_TERMINAL = [('voltage_mag_{}', 'voltage_ang_{}', 'current_mag_{}',
+                 'current_ang_{}', 'real_power_{}', 'reactive_power_{}')]
+
+BRANCH_TERMINALS = [('voltage_mag_src_{}', 'voltage_ang_src_{}', 'current_mag_src_{}',
+                     'current_ang_src_{}', 'real_power_src_{}', 'reactive_power_src_{}'),
+                    ('voltage_mag_dst_{}', 'voltage_ang_dst_{}', 'current_mag_dst_{}',
+                     'current_ang_dst_{}', 'real_power_dst_{}', 'reactive_power_dst_{}')]
+
+TRANSFORMER_TERMINALS = [('voltage_mag_wdg1_{}', 'voltage_ang_wdg1_{}', 'current_mag_wdg1_{}',
+                          'current_ang_wdg1_{}', 'real_power_{}', 'reactive_power_{}'),
+                         ('voltage_mag_wdg2_{}', 'voltage_ang_wdg2_{}', 'current_mag_wdg2_{}',
+                          'current_ang_wdg2_{}', None, None)]
+
+# Element types updated after each solve, keyed by the qualifier added to
+# their names during create: data class, OpenDSS class, fields per terminal
+# and the factor applied to their powers (inverter powers are in W, not kW).
+ELEMENT_TYPES = {
+    'generator':   (models.GeneratorData,   'generator',   ONE_TERMINAL,          1),
+    'load':        (models.LoadData,        'load',        ONE_TERMINAL,          1),
+    'shunt':       (models.ShuntData,       'capacitor',   ONE_TERMINAL,          1),
+    'branch':      (models.BranchData,      'line',        BRANCH_TERMINALS,      1),
+    'transformer': (models.TransformerData, 'transformer', TRANSFORMER_TERMINALS, 1),
+    'inverter':    (models.InverterData,    'pvsystem',    ONE_TERMINAL,          1000),
+}
+
 class OpenDSS(Provider):
     """OpenDSS-based implementation of an electric power distribution system"""
 
@@ -282,12 +350,22 @@ class OpenDSS(Provider):
             self.__time_offset = int(now.timestamp() - noon.timestamp())
             self.__solve_count = 0
 
+        # set when the circuit gets recompiled, since a recompiled circuit
+        # may not have kept the enabled state of its elements
+        self.__recompiled = False
+
         # compile the provided circuit
         self.__compile_circuit(filename)
 
         # used to map circuit elements to their names
         self.elements = {}
 
+        # conductors of each element and the index maps built from them, used
+        # to update the elements from the bulk reads after each solve
+        self.__conductors = {}
+        self.__node_names = None
+        self.__pd_names = None
+
         # initialze the system under test using data from OpenDSS
         self.__create()
 
@@ -512,6 +590,10 @@ class OpenDSS(Provider):
             print('ERROR: processing write command - {}'.format(msg))
             return 'ERR={}'.format(msg)
 
+    def snapshot(self):
+        """Current value of every tag, used for scheduled publishing."""
+        return codec.parse_text(self.__pack_message())
+
     def periodic_publish(self):
         """Loop that calls `self._publish_data` every two seconds."""
 
@@ -1108,6 +1190,11 @@ class OpenDSS(Provider):
 
             self.elements[inverter.name] = inverter
 
+        # elements of each type, in the order they are updated
+        self.__types = {prefix: [element for element in self.elements.values()
+                                 if isinstance(element, model)]
+                        for prefix, (model, dss_class, terminals, scale) in ELEMENT_TYPES.items()}
+
         # we want to execute the very first solve without performing an update,
         # so first is set to 'true'. this is because we first need to
         # initialize the phases before we can do an update. the inverter updates
@@ -1116,7 +1203,12 @@ class OpenDSS(Provider):
 
     def __update(self):
         """Reads circuit elements from OpenDSS and updates the internal
-        representation of the system under test."""
+        representation of the system under test.
+
+        Voltages are read once for the whole circuit and currents and powers
+        once per element class where OpenDSS provides bulk getters. The
+        resulting arrays are then scattered into the elements using the index
+        maps built by `__index_conductors`."""
 
         if self.__debug: print('Updating system under test')
 
@@ -1125,411 +1217,106 @@ class OpenDSS(Provider):
         # from the internal representation of the system under test. This lock
         # is also used in the pack_message function.
         with self.__lock:
-            # BUSES
-            print('Updating buses...')
-            for name in dss.Circuit.AllBusNames():
-                if name:
-                    bus = self.elements['bus_{}'.format(name)]
-
-                    assert bus
-
-                    dss.Circuit.SetActiveBus(name)
-                    voltages = dss.Bus.puVmagAngle()
-
-                    # Each bus will either be single phase or
-                    # three phase. Thus, the first two indexes of the
-                    # `voltages` variable should always be set.
-                    bus.voltage_mag_p1 = voltages[0]
-                    bus.voltage_ang_p1 = voltages[1]
-
-                    # If this bus is single phase, trying to read
-                    # from `voltages` at index 2 will result in an
-                    # `IndexError`. If that happens, just continue on.
-                    try:
-                        bus.voltage_mag_p2 = voltages[2]
-                        bus.voltage_ang_p2 = voltages[3]
-                        bus.voltage_mag_p3 = voltages[4]
-                        bus.voltage_ang_p3 = voltages[5]
-                    except IndexError:
-                        pass
+            if self.__recompiled:
+                self.__refresh_enabled()
 
-                    if self.__debug: print(bus)
+            # elements that were disabled during the initial solve have no
+            # node order to map until they have been enabled
+            for prefix, (model, dss_class, terminals, scale) in ELEMENT_TYPES.items():
+                unmapped = [element for element in self.__types[prefix]
+                            if element.active and element.name not in self.__conductors]
 
-            # GENERATORS
-            print('Updating generators...')
-            # set the active class to 'Generator'
-            dss.Circuit.SetActiveClass('generator')
+                if unmapped:
+                    dss.Circuit.SetActiveClass(dss_class)
 
-            for name in dss.Generators.AllNames():
-                # set the current generator as the active element
-                dss.Circuit.SetActiveElement(name)
-
-                gen = self.elements['generator_{}'.format(name)]
-
-                assert gen
-
-                # determine if currently active circuit element (in this
-                # case, the currently active generator) is enabled
-                # (1 = enabled, 0 = disabled)
-                enabled = dss.CktElement.Enabled()
-                gen.active = enabled == 1
-
-                gen.active_power_output = dss.Generators.kW()
-
-                voltcurpow = self.__get_voltcurpow_1_terminal(gen.phases)
-
-                if 'p1' in voltcurpow:
-                    gen.voltage_mag_p1 = round(voltcurpow['p1'][0], 3)
-                    gen.voltage_ang_p1 = round(voltcurpow['p1'][1], 3)
-                    gen.current_mag_p1 = round(voltcurpow['p1'][2], 3)
-                    gen.current_ang_p1 = round(voltcurpow['p1'][3], 3)
-                    gen.real_power_p1 = round(voltcurpow['p1'][4], 3)
-                    gen.reactive_power_p1 = round(voltcurpow['p1'][5], 3)
-                if 'p2' in voltcurpow:
-                    gen.voltage_mag_p2 = round(voltcurpow['p2'][0], 3)
-                    gen.voltage_ang_p2 = round(voltcurpow['p2'][1], 3)
-                    gen.current_mag_p2 = round(voltcurpow['p2'][2], 3)
-                    gen.current_ang_p2 = round(voltcurpow['p2'][3], 3)
-                    gen.real_power_p2 = round(voltcurpow['p2'][4], 3)
-                    gen.reactive_power_p2 = round(voltcurpow['p2'][5], 3)
-                if 'p3' in voltcurpow:
-                    gen.voltage_mag_p3 = round(voltcurpow['p3'][0], 3)
-                    gen.voltage_ang_p3 = round(voltcurpow['p3'][1], 3)
-                    gen.current_mag_p3 = round(voltcurpow['p3'][2], 3)
-                    gen.current_ang_p3 = round(voltcurpow['p3'][3], 3)
-                    gen.real_power_p3 = round(voltcurpow['p3'][4], 3)
-                    gen.reactive_power_p3 = round(voltcurpow['p3'][5], 3)
-                if 'pn' in voltcurpow:
-                    gen.voltage_mag_pn = round(voltcurpow['pn'][0], 3)
-                    gen.voltage_ang_pn = round(voltcurpow['pn'][1], 3)
-                    gen.current_mag_pn = round(voltcurpow['pn'][2], 3)
-                    gen.current_ang_pn = round(voltcurpow['pn'][3], 3)
-                    gen.real_power_pn = round(voltcurpow['pn'][4], 3)
-                    gen.reactive_power_pn = round(voltcurpow['pn'][5], 3)
-
-                if self.__debug: print(gen)
-
-            # LOADS
-            print('Updating loads...')
-            # set the active class to 'Load'
-            dss.Circuit.SetActiveClass('load')
-
-            for name in dss.Loads.AllNames():
-                # set the current load as the active element
-                dss.Circuit.SetActiveElement(name)
+                for element in unmapped:
+                    dss.Circuit.SetActiveElement(element.name[len(prefix) + 1:])
+                    self.__map_conductors(element, prefix)
 
-                load = self.elements['load_{}'.format(name)]
-
-                assert load
-
-                # determine if currently active circuit element (in this
-                # case, the currently active load) is enabled
-                # (1 = enabled, 0 = disabled)
-                enabled = dss.CktElement.Enabled()
-                load.active = enabled == 1
-
-                voltcurpow = self.__get_voltcurpow_1_terminal(load.phases)
-
-                if 'p1' in voltcurpow:
-                    load.voltage_mag_p1 = round(voltcurpow['p1'][0], 3)
-                    load.voltage_ang_p1 = round(voltcurpow['p1'][1], 3)
-                    load.current_mag_p1 = round(voltcurpow['p1'][2], 3)
-                    load.current_ang_p1 = round(voltcurpow['p1'][3], 3)
-                    load.real_power_p1 = round(voltcurpow['p1'][4], 3)
-                    load.reactive_power_p1 = round(voltcurpow['p1'][5], 3)
-                if 'p2' in voltcurpow:
-                    load.voltage_mag_p2 = round(voltcurpow['p2'][0], 3)
-                    load.voltage_ang_p2 = round(voltcurpow['p2'][1], 3)
-                    load.current_mag_p2 = round(voltcurpow['p2'][2], 3)
-                    load.current_ang_p2 = round(voltcurpow['p2'][3], 3)
-                    load.real_power_p2 = round(voltcurpow['p2'][4], 3)
-                    load.reactive_power_p2 = round(voltcurpow['p2'][5], 3)
-                if 'p3' in voltcurpow:
-                    load.voltage_mag_p3 = round(voltcurpow['p3'][0], 3)
-                    load.voltage_ang_p3 = round(voltcurpow['p3'][1], 3)
-                    load.current_mag_p3 = round(voltcurpow['p3'][2], 3)
-                    load.current_ang_p3 = round(voltcurpow['p3'][3], 3)
-                    load.real_power_p3 = round(voltcurpow['p3'][4], 3)
-                    load.reactive_power_p3 = round(voltcurpow['p3'][5], 3)
-                if 'pn' in voltcurpow:
-                    load.voltage_mag_pn = round(voltcurpow['pn'][0], 3)
-                    load.voltage_ang_pn = round(voltcurpow['pn'][1], 3)
-                    load.current_mag_pn = round(voltcurpow['pn'][2], 3)
-                    load.current_ang_pn = round(voltcurpow['pn'][3], 3)
-                    load.real_power_pn = round(voltcurpow['pn'][4], 3)
-                    load.reactive_power_pn = round(voltcurpow['pn'][5], 3)
-
-                if self.__debug: print(load)
-
-            # SHUNTS
-            print('Updating shunts...')
-            # set the active class to 'Capacitor'
-            dss.Circuit.SetActiveClass('capacitor')
-
-            for name in dss.Capacitors.AllNames():
-                # set the current capacitor as the active element
-                dss.Circuit.SetActiveElement(name)
+            # the node names only change if the circuit itself changes, e.g.
+            # when it gets recompiled from the saved circuit
+            node_names = dss.Circuit.AllNodeNames()
+            if node_names != self.__node_names:
+                self.__index_conductors(node_names)
 
-                shunt = self.elements['shunt_{}'.format(name)]
-
-                assert shunt
-
-                # Determine if currently active circuit element (in this
-                # case, the currently active shunt) is enabled
-                # (1 = enabled, 0 = disabled)
-                enabled = dss.CktElement.Enabled()
-                shunt.active = enabled == 1
-
-                voltcurpow = self.__get_voltcurpow_1_terminal(shunt.phases)
-
-                if 'p1' in voltcurpow:
-                    shunt.voltage_mag_p1 = round(voltcurpow['p1'][0], 3)
-                    shunt.voltage_ang_p1 = round(voltcurpow['p1'][1], 3)
-                    shunt.current_mag_p1 = round(voltcurpow['p1'][2], 3)
-                    shunt.current_ang_p1 = round(voltcurpow['p1'][3], 3)
-                    shunt.real_power_p1 = round(voltcurpow['p1'][4], 3)
-                    shunt.reactive_power_p1 = round(voltcurpow['p1'][5], 3)
-                if 'p2' in voltcurpow:
-                    shunt.voltage_mag_p2 = round(voltcurpow['p2'][0], 3)
-                    shunt.voltage_ang_p2 = round(voltcurpow['p2'][1], 3)
-                    shunt.current_mag_p2 = round(voltcurpow['p2'][2], 3)
-                    shunt.current_ang_p2 = round(voltcurpow['p2'][3], 3)
-                    shunt.real_power_p2 = round(voltcurpow['p2'][4], 3)
-                    shunt.reactive_power_p2 = round(voltcurpow['p2'][5], 3)
-                if 'p3' in voltcurpow:
-                    shunt.voltage_mag_p3 = round(voltcurpow['p3'][0], 3)
-                    shunt.voltage_ang_p3 = round(voltcurpow['p3'][1], 3)
-                    shunt.current_mag_p3 = round(voltcurpow['p3'][2], 3)
-                    shunt.current_ang_p3 = round(voltcurpow['p3'][3], 3)
-                    shunt.real_power_p3 = round(voltcurpow['p3'][4], 3)
-                    shunt.reactive_power_p3 = round(voltcurpow['p3'][5], 3)
-                if 'pn' in voltcurpow:
-                    shunt.voltage_mag_pn = round(voltcurpow['pn'][0], 3)
-                    shunt.voltage_ang_pn = round(voltcurpow['pn'][1], 3)
-                    shunt.current_mag_pn = round(voltcurpow['pn'][2], 3)
-                    shunt.current_ang_pn = round(voltcurpow['pn'][3], 3)
-                    shunt.real_power_pn = round(voltcurpow['pn'][4], 3)
-                    shunt.reactive_power_pn = round(voltcurpow['pn'][5], 3)
-
-                if self.__debug: print(shunt)
-
-            # BRANCHES
-            print('Updating branches...')
-            # set the active class to 'Line'
-            dss.Circuit.SetActiveClass('line')
-
-            for name in dss.Lines.AllNames():
-                # set the current line as the active element
-                dss.Circuit.SetActiveElement(name)
+            # complex voltage of every node in the circuit, followed by ground
+            volts = np.asarray(dss.Circuit.AllBusVolts(), dtype=float)
+            volts = np.append(volts[0::2] + 1j * volts[1::2], 0.0)
+            angles = np.degrees(np.angle(volts))
 
-                branch = self.elements['branch_{}'.format(name)]
-
-                assert branch
-
-                # determine if currently active circuit element (in this
-                # case, the currently active branch) is enabled
-                # (1 = enabled, 0 = disabled)
-                enabled = dss.CktElement.Enabled()
-                branch.active = enabled == 1
-
-                # for now, I'm assuming OpenDSS assigns phase numbers based
-                # based on the source bus, e.g., consider a single phase
-                # branch that starts at bus 1, phase 1 and ends at bus 2,
-                # phase 3, then the branch phase that will hold the voltage,
-                # current, and power output will be considered phase 1, not
-                # phase 3.
-                voltcurpow_src, voltcurpow_dst = self.__get_voltcurpow_2_terminal(branch.phases)
-
-                if 'p1' in voltcurpow_src:
-                    branch.voltage_mag_src_p1 = round(voltcurpow_src['p1'][0], 3)
-                    branch.voltage_ang_src_p1 = round(voltcurpow_src['p1'][1], 3)
-                    branch.current_mag_src_p1 = round(voltcurpow_src['p1'][2], 3)
-                    branch.current_ang_src_p1 = round(voltcurpow_src['p1'][3], 3)
-                    branch.real_power_src_p1 = round(voltcurpow_src['p1'][4], 3)
-                    branch.reactive_power_src_p1 = round(voltcurpow_src['p1'][5], 3)
-                    branch.voltage_mag_dst_p1 = round(voltcurpow_dst['p1'][0], 3)
-                    branch.voltage_ang_dst_p1 = round(voltcurpow_dst['p1'][1], 3)
-                    branch.current_mag_dst_p1 = round(voltcurpow_dst['p1'][2], 3)
-                    branch.current_ang_dst_p1 = round(voltcurpow_dst['p1'][3], 3)
-                    branch.real_power_dst_p1 = round(voltcurpow_dst['p1'][4], 3)
-                    branch.reactive_power_dst_p1 = round(voltcurpow_dst['p1'][5], 3)
-                if 'p2' in voltcurpow_src:
-                    branch.voltage_mag_src_p2 = round(voltcurpow_src['p2'][0], 3)
-                    branch.voltage_ang_src_p2 = round(voltcurpow_src['p2'][1], 3)
-                    branch.current_mag_src_p2 = round(voltcurpow_src['p2'][2], 3)
-                    branch.current_ang_src_p2 = round(voltcurpow_src['p2'][3], 3)
-                    branch.real_power_src_p2 = round(voltcurpow_src['p2'][4], 3)
-                    branch.reactive_power_src_p2 = round(voltcurpow_src['p2'][5], 3)
-                    branch.voltage_mag_dst_p2 = round(voltcurpow_dst['p2'][0], 3)
-                    branch.voltage_ang_dst_p2 = round(voltcurpow_dst['p2'][1], 3)
-                    branch.current_mag_dst_p2 = round(voltcurpow_dst['p2'][2], 3)
-                    branch.current_ang_dst_p2 = round(voltcurpow_dst['p2'][3], 3)
-                    branch.real_power_dst_p2 = round(voltcurpow_dst['p2'][4], 3)
-                    branch.reactive_power_dst_p2 = round(voltcurpow_dst['p2'][5], 3)
-                if 'p3' in voltcurpow_src:
-                    branch.voltage_mag_src_p3 = round(voltcurpow_src['p3'][0], 3)
-                    branch.voltage_ang_src_p3 = round(voltcurpow_src['p3'][1], 3)
-                    branch.current_mag_src_p3 = round(voltcurpow_src['p3'][2], 3)
-                    branch.current_ang_src_p3 = round(voltcurpow_src['p3'][3], 3)
-                    branch.real_power_src_p3 = round(voltcurpow_src['p3'][4], 3)
-                    branch.reactive_power_src_p3 = round(voltcurpow_src['p3'][5], 3)
-                    branch.voltage_mag_dst_p3 = round(voltcurpow_dst['p3'][0], 3)
-                    branch.voltage_ang_dst_p3 = round(voltcurpow_dst['p3'][1], 3)
-                    branch.current_mag_dst_p3 = round(voltcurpow_dst['p3'][2], 3)
-                    branch.current_ang_dst_p3 = round(voltcurpow_dst['p3'][3], 3)
-                    branch.real_power_dst_p3 = round(voltcurpow_dst['p3'][4], 3)
-                    branch.reactive_power_dst_p3 = round(voltcurpow_dst['p3'][5], 3)
-                if 'pn' in voltcurpow_src:
-                    branch.voltage_mag_src_pn = round(voltcurpow_src['pn'][0], 3)
-                    branch.voltage_ang_src_pn = round(voltcurpow_src['pn'][1], 3)
-                    branch.current_mag_src_pn = round(voltcurpow_src['pn'][2], 3)
-                    branch.current_ang_src_pn = round(voltcurpow_src['pn'][3], 3)
-                    branch.real_power_pn = round(voltcurpow_src['pn'][4], 3)
-                    branch.reactive_power_pn = round(voltcurpow_src['pn'][5], 3)
-                    branch.voltage_mag_dst_pn = round(voltcurpow_dst['pn'][0], 3)
-                    branch.voltage_ang_dst_pn = round(voltcurpow_dst['pn'][1], 3)
-                    branch.current_mag_dst_pn = round(voltcurpow_dst['pn'][2], 3)
-                    branch.current_ang_dst_pn = round(voltcurpow_dst['pn'][3], 3)
-                    branch.real_power_dst_pn = round(voltcurpow_dst['pn'][4], 3)
-                    branch.reactive_power_dst_pn = round(voltcurpow_dst['pn'][5], 3)
-
-                if self.__debug: print(branch)
-
-            # TRANSFORMERS
-            print('Updating transformers...')
-            # set the active class to 'Transformer'
-            dss.Circuit.SetActiveClass('transformer')
-
-            for name in dss.Transformers.AllNames():
-                # set the current transformer as the active element
-                dss.Circuit.SetActiveElement(name)
-
-                transformer = self.elements['transformer_{}'.format(name)]
-
-                assert transformer
-
-                # determine if currently active circuit element (in this
-                # case, the currently active transformer) is enabled
-                # (1 = enabled, 0 = disabled)
-                enabled = dss.CktElement.Enabled()
-                transformer.active = enabled == 1
-
-                # set the active winding to 1
-                dss.Transformers.Wdg(1)
-                transformer.tap_setting_wdg1 = dss.Transformers.Tap()
-                # set the active winding to 2
-                dss.Transformers.Wdg(2)
-                transformer.tap_setting_wdg2 = dss.Transformers.Tap()
-
-                # note that I'm using the same 2 terminal voltcurpow method
-                # here because I'm not yet supporting 3-winding transformers.
-                # the transformer data class already includes data points for
-                # all three windings, but I'm not yet populating the data.
-                # I'll add support when we encounter a case with 3 windings.
-                # I'm also defining the real and reactive power for each phase
-                # as the real and reactive power calculated on winding 1 of
-                # the transformer. assumption is that the power seen between
-                # winding 1 and winding 2 will be practically identical
-
-                voltcurpow_wdg1, voltcurpow_wdg2 = self.__get_voltcurpow_2_terminal(transformer.phases)
-
-                if 'p1' in voltcurpow_wdg1:
-                    transformer.voltage_mag_wdg1_p1 = round(voltcurpow_wdg1['p1'][0], 3)
-                    transformer.voltage_ang_wdg1_p1 = round(voltcurpow_wdg1['p1'][1], 3)
-                    transformer.current_mag_wdg1_p1 = round(voltcurpow_wdg1['p1'][2], 3)
-                    transformer.current_ang_wdg1_p1 = round(voltcurpow_wdg1['p1'][3], 3)
-                    transformer.real_power_p1 = round(voltcurpow_wdg1['p1'][4], 3)
-                    transformer.reactive_power_p1 = round(voltcurpow_wdg1['p1'][5], 3)
-                    transformer.voltage_mag_wdg2_p1 = round(voltcurpow_wdg2['p1'][0], 3)
-                    transformer.voltage_ang_wdg2_p1 = round(voltcurpow_wdg2['p1'][1], 3)
-                    transformer.current_mag_wdg2_p1 = round(voltcurpow_wdg2['p1'][2], 3)
-                    transformer.current_ang_wdg2_p1 = round(voltcurpow_wdg2['p1'][3], 3)
-                if 'p2' in voltcurpow_wdg1:
-                    transformer.voltage_mag_wdg1_p2 = round(voltcurpow_wdg1['p2'][0], 3)
-                    transformer.voltage_ang_wdg1_p2 = round(voltcurpow_wdg1['p2'][1], 3)
-                    transformer.current_mag_wdg1_p2 = round(voltcurpow_wdg1['p2'][2], 3)
-                    transformer.current_ang_wdg1_p2 = round(voltcurpow_wdg1['p2'][3], 3)
-                    transformer.real_power_p2 = round(voltcurpow_wdg1['p2'][4], 3)
-                    transformer.reactive_power_p2 = round(voltcurpow_wdg1['p2'][5], 3)
-                    transformer.voltage_mag_wdg2_p2 = round(voltcurpow_wdg2['p2'][0], 3)
-                    transformer.voltage_ang_wdg2_p2 = round(voltcurpow_wdg2['p2'][1], 3)
-                    transformer.current_mag_wdg2_p2 = round(voltcurpow_wdg2['p2'][2], 3)
-                    transformer.current_ang_wdg2_p2 = round(voltcurpow_wdg2['p2'][3], 3)
-                if 'p3' in voltcurpow_wdg1:
-                    transformer.voltage_mag_wdg1_p3 = round(voltcurpow_wdg1['p3'][0], 3)
-                    transformer.voltage_ang_wdg1_p3 = round(voltcurpow_wdg1['p3'][1], 3)
-                    transformer.current_mag_wdg1_p3 = round(voltcurpow_wdg1['p3'][2], 3)
-                    transformer.current_ang_wdg1_p3 = round(voltcurpow_wdg1['p3'][3], 3)
-                    transformer.real_power_p3 = round(voltcurpow_wdg1['p3'][4], 3)
-                    transformer.reactive_power_p3 = round(voltcurpow_wdg1['p3'][5], 3)
-                    transformer.voltage_mag_wdg2_p3 = round(voltcurpow_wdg2['p3'][0], 3)
-                    transformer.voltage_ang_wdg2_p3 = round(voltcurpow_wdg2['p3'][1], 3)
-                    transformer.current_mag_wdg2_p3 = round(voltcurpow_wdg2['p3'][2], 3)
-                    transformer.current_ang_wdg2_p3 = round(voltcurpow_wdg2['p3'][3], 3)
-                if 'pn' in voltcurpow_wdg1:
-                    transformer.voltage_mag_wdg1_pn = round(voltcurpow_wdg1['pn'][0], 3)
-                    transformer.voltage_ang_wdg1_pn = round(voltcurpow_wdg1['pn'][1], 3)
-                    transformer.current_mag_wdg1_pn = round(voltcurpow_wdg1['pn'][2], 3)
-                    transformer.current_ang_wdg1_pn = round(voltcurpow_wdg1['pn'][3], 3)
-                    transformer.real_power_pn = round(voltcurpow_wdg1['pn'][4], 3)
-                    transformer.reactive_power_pn = round(voltcurpow_wdg1['pn'][5], 3)
-                    transformer.voltage_mag_wdg2_pn = round(voltcurpow_wdg2['pn'][0], 3)
-                    transformer.voltage_ang_wdg2_pn = round(voltcurpow_wdg2['pn'][1], 3)
-                    transformer.current_mag_wdg2_pn = round(voltcurpow_wdg2['pn'][2], 3)
-                    transformer.current_ang_wdg2_pn = round(voltcurpow_wdg2['pn'][3], 3)
-
-                if self.__debug: print(transformer)
+            # BUSES
+            print('Updating buses...')
+            magnitudes = np.asarray(dss.Circuit.AllBusMagPu(), dtype=float)
+
+            for (bus, mag_field, ang_field), mag, ang in zip(self.__bus_fields,
+                    magnitudes[self.__bus_nodes].tolist(), angles[self.__bus_nodes].tolist()):
+                setattr(bus, mag_field, mag)
+                setattr(bus, ang_field, ang)
+
+            # ELEMENTS
+            print('Updating elements...\n')
+            self.__values[:] = 0.0
+            read = self.__read_pd_elements()
+
+            for prefix, (model, dss_class, terminals, scale) in ELEMENT_TYPES.items():
+                # set the active class for this element type
+                dss.Circuit.SetActiveClass(dss_class)
+
+                for element in self.__types[prefix]:
+                    # elements not covered by the bulk getters are read one at
+                    # a time, and so are transformer taps since there is no
+                    # bulk getter for them
+                    pending = element.active and element.name not in read
+                    if not pending and prefix != 'transformer':
+                        continue
+
+                    # set the current element as the active element
+                    dss.Circuit.SetActiveElement(element.name[len(prefix) + 1:])
+
+                    if pending:
+                        self.__read_conductors(element)
+
+                    if prefix == 'generator':
+                        element.active_power_output = dss.Generators.kW()
+                    elif prefix == 'transformer':
+                        # set the active winding to 1
+                        dss.Transformers.Wdg(1)
+                        element.tap_setting_wdg1 = dss.Transformers.Tap()
+                        # set the active winding to 2
+                        dss.Transformers.Wdg(2)
+                        element.tap_setting_wdg2 = dss.Transformers.Tap()
+
+            # if an element is disabled, you can't query for voltage, current,
+            # or power through OpenDSS, so then assume all is 0
+            active = np.array([element.active for element in self.__mapped], dtype=bool)
+            nodes = self.__slot_nodes
+            rows = self.__slot_rows
+
+            slots = np.column_stack([
+                np.abs(volts[nodes]),
+                angles[nodes],
+                self.__values[rows, 0],
+                self.__values[rows, 1],
+                self.__values[rows, 2] * self.__slot_scales,
+                self.__values[rows, 3] * self.__slot_scales,
+            ])
+            slots = np.where(active[self.__slot_owners, None], np.round(slots, 3), 0.0)
+
+            for (element, fields), values in zip(self.__slot_fields, slots.tolist()):
+                for field, value in zip(fields, values):
+                    if field:
+                        setattr(element, field, value)
 
             # INVERTERS
-            print('Updating inverters...\n')
-            # set the active class to 'PVsystem'
-            dss.Circuit.SetActiveClass('pvsystem')
-
-            for name in dss.PVsystems.AllNames():
-                # set the current inverter as the active element
-                dss.Circuit.SetActiveElement(name)
+            inverters = self.__types['inverter']
 
-                inverter = self.elements['inverter_{}'.format(name)]
-
-                assert inverter
-
-                # determine if currently active circuit element (in this
-                # case, the currently active generator) is enabled
-                # (1 = enabled, 0 = disabled)
-                enabled = dss.CktElement.Enabled()
-                inverter.active = enabled
-
-                voltcurpow = self.__get_voltcurpow_1_terminal(inverter.phases)
-
-                if 'p1' in voltcurpow:
-                    inverter.voltage_mag_p1 = round(voltcurpow['p1'][0], 3)
-                    inverter.voltage_ang_p1 = round(voltcurpow['p1'][1], 3)
-                    inverter.current_mag_p1 = round(voltcurpow['p1'][2], 3)
-                    inverter.current_ang_p1 = round(voltcurpow['p1'][3], 3)
-                    inverter.real_power_p1 = round((voltcurpow['p1'][4])*1000, 3)
-                    inverter.reactive_power_p1 = round((voltcurpow['p1'][5])*1000, 3)
-                if 'p2' in voltcurpow:
-                    inverter.voltage_mag_p2 = round(voltcurpow['p2'][0], 3)
-                    inverter.voltage_ang_p2 = round(voltcurpow['p2'][1], 3)
-                    inverter.current_mag_p2 = round(voltcurpow['p2'][2], 3)
-                    inverter.current_ang_p2 = round(voltcurpow['p2'][3], 3)
-                    inverter.real_power_p2 = round((voltcurpow['p2'][4])*1000, 3)
-                    inverter.reactive_power_p2 = round((voltcurpow['p2'][5])*1000, 3)
-                if 'p3' in voltcurpow:
-                    inverter.voltage_mag_p3 = round(voltcurpow['p3'][0], 3)
-                    inverter.voltage_ang_p3 = round(voltcurpow['p3'][1], 3)
-                    inverter.current_mag_p3 = round(voltcurpow['p3'][2], 3)
-                    inverter.current_ang_p3 = round(voltcurpow['p3'][3], 3)
-                    inverter.real_power_p3 = round((voltcurpow['p3'][4])*1000, 3)
-                    inverter.reactive_power_p3 = round((voltcurpow['p3'][5])*1000, 3)
-                if 'pn' in voltcurpow:
-                    inverter.voltage_mag_pn = round(voltcurpow['pn'][0], 3)
-                    inverter.voltage_ang_pn = round(voltcurpow['pn'][1], 3)
-                    inverter.current_mag_pn = round(voltcurpow['pn'][2], 3)
-                    inverter.current_ang_pn = round(voltcurpow['pn'][3], 3)
-                    inverter.real_power_pn = round((voltcurpow['pn'][4])*1000, 3)
-                    inverter.reactive_power_pn = round((voltcurpow['pn'][5])*1000, 3)
+            # read every XY curve once rather than once per inverter
+            curves = {}
+            if inverters:
+                for xy_name in dss_utils.Iterator(dss.XYCurves, 'Name'):
+                    curves[xy_name()] = (dss.XYCurves.XArray(), dss.XYCurves.YArray())
 
+            for inverter in inverters:
                 inverter.current_mag_total = inverter.current_mag_p1 + \
                                              inverter.current_mag_p2 + \
                                              inverter.current_mag_p3
@@ -1542,30 +1329,17 @@ class OpenDSS(Provider):
                                                 inverter.reactive_power_p2 + \
                                                 inverter.reactive_power_p3
 
-                # TODO: need to figure out a better way of
-                # selecting the XYCurve associated with the
-                # current inverter other than looping through
-                # all of them and matching on the name
-                for xy_name in dss_utils.Iterator(dss.XYCurves, 'Name'):
-                    # check for the volt/var curve name
-                    # associated with this inverter
-                    if xy_name() == inverter.volt_var_curve_name:
-                        volt_points = dss.XYCurves.XArray()
-                        inverter.curve_volt_pt_1 = volt_points[0]
-                        inverter.curve_volt_pt_2 = volt_points[1]
-                        inverter.curve_volt_pt_3 = volt_points[2]
-                        inverter.curve_volt_pt_4 = volt_points[3]
-                        inverter.curve_volt_pt_5 = volt_points[4]
-                        inverter.curve_volt_pt_6 = volt_points[5]
-                        var_points = dss.XYCurves.YArray()
-                        inverter.curve_var_pt_1 = var_points[0]
-                        inverter.curve_var_pt_2 = var_points[1]
-                        inverter.curve_var_pt_3 = var_points[2]
-                        inverter.curve_var_pt_4 = var_points[3]
-                        inverter.curve_var_pt_5 = var_points[4]
-                        inverter.curve_var_pt_6 = var_points[5]
-
-                if self.__debug: print(inverter)
+                # check for the volt/var curve associated with this inverter
+                if inverter.volt_var_curve_name in curves:
+                    volt_points, var_points = curves[inverter.volt_var_curve_name]
+
+                    for point in range(6):
+                        setattr(inverter, 'curve_volt_pt_{}'.format(point + 1), volt_points[point])
+                        setattr(inverter, 'curve_var_pt_{}'.format(point + 1), var_points[point])
+
+            if self.__debug:
+                for element in self.elements.values():
+                    print(element)
 
     def __solve(self, first='false'):
         """Triggers a solve in OpenDSS and checks for any errors. It then
@@ -1616,6 +1390,7 @@ class OpenDSS(Provider):
             self.__initialize_phases()
         else:
             self.__update()
+            self.state_changed()
 
         self.__save_and_clear_circuit()
 
@@ -1648,6 +1423,7 @@ class OpenDSS(Provider):
 
         print('Compiling {}'.format(filename))
         self.__run_command('Compile {}'.format(filename))
+        self.__recompiled = True
 
         end = timer()
         print('Compiling circuit took {} seconds'.format(end - start))
@@ -1681,6 +1457,9 @@ class OpenDSS(Provider):
 
         print('Initializing element phases.')
 
+        # the enabled state is read along with the phases
+        self.__recompiled = False
+
         # GENERATORS
         # set the active class to 'Generator'
         dss.Circuit.SetActiveClass('generator')
@@ -1697,10 +1476,16 @@ class OpenDSS(Provider):
             # store the data class
             phases = dict.fromkeys(['p1', 'p2', 'p3', 'pn'], False)
 
+            # elements are only enabled or disabled by write commands from
+            # here on, so whether they are enabled is read just once
+            gen.active = dss.CktElement.Enabled() == 1
+
             # if the element is enabled, then we can use 'NodeOrder()' to
             # get phase information, if not, try to infer it from it's bus
             # information
             if dss.CktElement.Enabled():
+                self.__map_conductors(gen, 'generator')
+
                 element_phases = dss.CktElement.NodeOrder()
             else:
                 element_phases = list(map(int, dss.Properties.Value('2').split('.')[1:]))
@@ -1731,10 +1516,16 @@ class OpenDSS(Provider):
             # store in the data class
             phases = dict.fromkeys(['p1', 'p2', 'p3', 'pn'], False)
 
+            # elements are only enabled or disabled by write commands from
+            # here on, so whether they are enabled is read just once
+            load.active = dss.CktElement.Enabled() == 1
+
             # if the element is enabled, then we can use 'NodeOrder()' to
             # get phase information, if not, try to infer it from it's bus
             # information
             if dss.CktElement.Enabled():
+                self.__map_conductors(load, 'load')
+
                 element_phases = dss.CktElement.NodeOrder()
             else:
                 element_phases = list(map(int, dss.Properties.Value('2').split('.')[1:]))
@@ -1765,10 +1556,16 @@ class OpenDSS(Provider):
             # store in the data class
             phases = dict.fromkeys(['p1', 'p2', 'p3', 'pn'], False)
 
+            # elements are only enabled or disabled by write commands from
+            # here on, so whether they are enabled is read just once
+            shunt.active = dss.CktElement.Enabled() == 1
+
             # if the element is enabled, then we can use 'NodeOrder()' to
             # get phase information, if not, try to infer it from it's bus
             # information
             if dss.CktElement.Enabled():
+                self.__map_conductors(shunt, 'shunt')
+
                 element_phases = dss.CktElement.NodeOrder()
             else:
                 element_phases = list(map(int, dss.Properties.Value('1').split('.')[1:]))
@@ -1811,7 +1608,13 @@ class OpenDSS(Provider):
             # get phase information, if not, try to infer it from it's bus
             # information
             num_conductors = dss.CktElement.NumConductors()
+            # elements are only enabled or disabled by write commands from
+            # here on, so whether they are enabled is read just once
+            branch.active = dss.CktElement.Enabled() == 1
+
             if dss.CktElement.Enabled():
+                self.__map_conductors(branch, 'branch')
+
                 element_phases = dss.CktElement.NodeOrder()[:num_conductors]
             else:
                 element_phases = list(map(int, dss.Properties.Value('1').split('.')[1:]))
@@ -1845,6 +1648,10 @@ class OpenDSS(Provider):
                                     'wdg3_p1', 'wdg3_p2', 'wdg3_p3', 'wdg3_pn'],
                                    False)
 
+            # elements are only enabled or disabled by write commands from
+            # here on, so whether they are enabled is read just once
+            transformer.active = dss.CktElement.Enabled() == 1
+
             # here I'm trying to extract the phases per winding. This only
             # works when the NodeOrder() method returns the same number of
             # conductors for each winding. It seems that even if you don't
@@ -1854,6 +1661,8 @@ class OpenDSS(Provider):
             # then we can use 'NodeOrder()' to get the phase info, if not,
             # try to infer the phases from the buses it's connected to.
             if dss.CktElement.Enabled():
+                self.__map_conductors(transformer, 'transformer')
+
                 phase_order = dss.CktElement.NodeOrder()
                 num_conductors = dss.CktElement.NumConductors()
                 phases_by_winding = [phase_order[i:i+num_conductors] for i in \
@@ -1895,10 +1704,16 @@ class OpenDSS(Provider):
             # store in the data class
             phases = dict.fromkeys(['p1', 'p2', 'p3', 'pn'], False)
 
+            # elements are only enabled or disabled by write commands from
+            # here on, so whether they are enabled is read just once
+            inverter.active = dss.CktElement.Enabled() == 1
+
             # if the element is enabled, then we can use 'NodeOrder()' to
             # get phase information, if not, try to infer it from it's bus
             # information
             if dss.CktElement.Enabled():
+                self.__map_conductors(inverter, 'inverter')
+
                 element_phases = dss.CktElement.NodeOrder()
             else:
                 element_phases = list(map(int, dss.Properties.Value('2').split('.')[1:]))
@@ -1923,100 +1738,193 @@ class OpenDSS(Provider):
         # only happens during initial startup
         self.__update()
 
-    def __get_voltcurpow_1_terminal(self, phases):
-        """Method to get the voltage, current, and power of the currently active
-        circuit element, per phase.  This method is for devices with just one
-        terminal, such as generators and loads."""
-
-        # if the current element is disabled, you can't query for voltage,
-        # current, or power through OpenDSS, so then assume all is 0
-        if dss.CktElement.Enabled():
-            phase_order = [str(i) for i in dss.CktElement.NodeOrder()]
-
-            voltages = dss.CktElement.VoltagesMagAng()
-            currents = dss.CktElement.CurrentsMagAng()
-            powers = dss.CktElement.Powers()
-
-            # grouping all voltages and currents per phase (mag,ang)
-            voltages_by_phase = [voltages[x:x+2] for x in range(0, len(voltages), 2)]
-            currents_by_phase = [currents[x:x+2] for x in range(0, len(currents), 2)]
-            # mapping voltages and currents to phase numbers
-            voltages_per_phase = dict(zip(phase_order, voltages_by_phase))
-            currents_per_phase = dict(zip(phase_order, currents_by_phase))
-            # do the same with powers
-            powers_by_phase = [powers[x:x+2] for x in range(0, len(powers), 2)]
-            powers_per_phase = dict(zip(phase_order, powers_by_phase))
-
-            # combine voltages, currents, and powers
-            voltcurpow = {k:voltages_per_phase[k] + currents_per_phase[k] +
-                          powers_per_phase[k] for k in voltages_per_phase}
-            voltcurpow = {'p' + i.replace('0', 'n'): voltcurpow[i] for i in voltcurpow.keys()}
-        else:
-            voltcurpow = {}
-            element_phases = json.loads(base64.b64decode(phases).decode())
-            for phase, value in element_phases.items():
-                if value:
-                    voltcurpow[phase] = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-
-        return voltcurpow
-
-    def __get_voltcurpow_2_terminal(self, phases):
-        """Method to get the voltage, current, and power of the currently
-        active circuit element, per phase and per terminal. This method is
-        for devices with two terminals, such as branches and transformers."""
-
-        # if the current element is disabled, you can't query for voltage,
-        # current, or power through OpenDSS, so then assume all is 0
-        if dss.CktElement.Enabled():
-            phase_order = [str(i) for i in dss.CktElement.NodeOrder()]
-            num_conductors = dss.CktElement.NumConductors()
+    def __map_conductors(self, element, prefix):
+        """Records, for each conductor of the currently active element, the
+        circuit node it is connected to, its position in the element's
+        currents and powers, and the fields its values are stored in. Used by
+        `__index_conductors` to build the index maps of `__update`."""
 
-            voltages = dss.CktElement.VoltagesMagAng()
-            currents = dss.CktElement.CurrentsMagAng()
-            powers = dss.CktElement.Powers()
-
-            # grouping all voltages per phase (mag,ang)
-            voltages_by_phase = [voltages[x:x+2] for x in range(0, len(voltages), 2)]
-            # split voltages up by terminal
-            voltages_by_phase_src = voltages_by_phase[:num_conductors]
-            voltages_by_phase_dst = voltages_by_phase[-num_conductors:]
-            # mapping voltages to phase numbers for each terminal
-            voltages_per_phase_src = dict(zip(phase_order[:num_conductors], voltages_by_phase_src))
-            voltages_per_phase_dst = dict(zip(phase_order[-num_conductors:], voltages_by_phase_dst))
-            # grouping all currents per phase (mag,ang)
-            currents_by_phase = [currents[x:x+2] for x in range(0, len(currents), 2)]
-            # split currents up by terminal
-            currents_by_phase_src = currents_by_phase[:num_conductors]
-            currents_by_phase_dst = currents_by_phase[-num_conductors:]
-            # mapping currents to phase numbers for each terminal
-            currents_per_phase_src = dict(zip(phase_order[:num_conductors], currents_by_phase_src))
-            currents_per_phase_dst = dict(zip(phase_order[-num_conductors:], currents_by_phase_dst))
-            # grouping all powers per phase (mag,ang)
-            powers_by_phase = [powers[x:x+2] for x in range(0, len(powers), 2)]
-            # split powers up by terminal
-            powers_by_phase_src = powers_by_phase[:num_conductors]
-            powers_by_phase_dst = powers_by_phase[-num_conductors:]
-            # mapping powers to phase numbers for each terminal
-            powers_per_phase_src = dict(zip(phase_order[:num_conductors], powers_by_phase_src))
-            powers_per_phase_dst = dict(zip(phase_order[-num_conductors:], powers_by_phase_dst))
-
-            # combine voltages, currents, and power for each terminal
-            voltcurpow_src = {k:voltages_per_phase_src[k] + currents_per_phase_src[k] +
-                              powers_per_phase_src[k] for k in voltages_per_phase_src}
-            voltcurpow_src = {'p' + i.replace('0', 'n'): voltcurpow_src[i] for i in voltcurpow_src.keys()}
-            voltcurpow_dst = {k:voltages_per_phase_dst[k] + currents_per_phase_dst[k] +
-                              powers_per_phase_dst[k] for k in voltages_per_phase_dst}
-            voltcurpow_dst = {'p' + i.replace('0', 'n'): voltcurpow_dst[i] for i in voltcurpow_dst.keys()}
-        else:
-            voltcurpow_src = {}
-            voltcurpow_dst = {}
-            element_phases = json.loads(base64.b64decode(phases).decode())
-            for phase, value in element_phases.items():
-                if value:
-                    voltcurpow_src[phase] = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-                    voltcurpow_dst[phase] = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-
-        return voltcurpow_src, voltcurpow_dst
+        model, dss_class, terminals, scale = ELEMENT_TYPES[prefix]
+
+        num_conductors = dss.CktElement.NumConductors()
+        buses = [bus.split('.')[0].lower() for bus in dss.CktElement.BusNames()]
+        node_order = dss.CktElement.NodeOrder()
+
+        conductors = []
+        for position, node in enumerate(node_order[:num_conductors * len(terminals)]):
+            terminal, conductor = divmod(position, num_conductors)
+
+            # for now, I'm assuming OpenDSS assigns phase numbers based on the
+            # first terminal, e.g., consider a single phase branch that starts
+            # at bus 1, phase 1 and ends at bus 2, phase 3, then the branch
+            # phase that will hold the voltage, current, and power output of
+            # both terminals will be considered phase 1, not phase 3.
+            phase = node_order[conductor]
+            phase = 'pn' if phase == 0 else 'p{}'.format(phase)
+
+            if phase not in PHASES:
+                continue
+
+            # node 0 is ground, which isn't part of the circuit's node list
+            node_name = '{}.{}'.format(buses[terminal], node) if node else None
+            fields = [field.format(phase) if field else None for field in terminals[terminal]]
+
+            conductors.append((node_name, position, fields))
+
+        self.__conductors[element.name] = (element, len(node_order), scale, conductors)
+
+        # force the index maps to be rebuilt on the next update
+        self.__node_names = None
+
+    def __index_conductors(self, node_names):
+        """Builds the index maps used by `__update` to scatter the circuit-wide
+        voltage arrays, and the per element currents and powers, into the
+        internal representation of the system under test."""
+
+        index = {name.lower(): i for i, name in enumerate(node_names)}
+        ground = len(node_names)
+
+        # each bus holds the voltages of its first three nodes, in order
+        bus_nodes = []
+        self.__bus_fields = []
+        positions = {}
+
+        for i, name in enumerate(node_names):
+            bus = self.elements.get('bus_{}'.format(name.rsplit('.', 1)[0]))
+            if not bus:
+                continue
+
+            position = positions.get(bus.name, 0) + 1
+            positions[bus.name] = position
+
+            if position <= 3:
+                bus_nodes.append(i)
+                self.__bus_fields.append((bus,
+                                          'voltage_mag_p{}'.format(position),
+                                          'voltage_ang_p{}'.format(position)))
+
+        self.__bus_nodes = np.array(bus_nodes, dtype=int)
+
+        # each mapped element gets one row per conductor in self.__values,
+        # and each of its conductors with a phase one slot
+        slot_nodes, slot_rows, slot_scales, slot_owners = [], [], [], []
+        self.__slot_fields = []
+        self.__mapped = []
+        self.__rows = {}
+        total = 0
+
+        for element, count, scale, conductors in self.__conductors.values():
+            self.__rows[element.name] = (total, count)
+
+            for node_name, position, fields in conductors:
+                slot_nodes.append(index.get(node_name, ground))
+                slot_rows.append(total + position)
+                slot_scales.append(scale)
+                slot_owners.append(len(self.__mapped))
+                self.__slot_fields.append((element, fields))
+
+            self.__mapped.append(element)
+            total += count
+
+        self.__slot_nodes = np.array(slot_nodes, dtype=int)
+        self.__slot_rows = np.array(slot_rows, dtype=int)
+        self.__slot_scales = np.array(slot_scales, dtype=float)
+        self.__slot_owners = np.array(slot_owners, dtype=int)
+
+        # current magnitude and angle, real and reactive power per conductor
+        self.__values = np.zeros((total, 4))
+
+        self.__node_names = node_names
+        self.__pd_names = None
+
+    def __read_pd_elements(self):
+        """Reads the currents and powers of all power delivery elements (lines,
+        capacitors and transformers) into self.__values using the bulk getters
+        of the PDElements interface, if the installed version of
+        OpenDSSDirect.py provides them (the pinned 0.6.1 does not, newer
+        versions do). Returns the names of the elements read."""
+
+        if not hasattr(dss.PDElements, 'AllCurrentsMagAng'):
+            return set()
+
+        names = dss.PDElements.AllNames()
+        if names != self.__pd_names:
+            self.__index_pd_elements(names)
+
+        currents = np.reshape(dss.PDElements.AllCurrentsMagAng(), (-1, 2))
+        powers = np.reshape(dss.PDElements.AllPowers(), (-1, 2))
+
+        # the bulk arrays only line up with the element names if they include
+        # every conductor of every element, otherwise read them one at a time
+        if len(currents) != self.__pd_count or len(powers) != self.__pd_count:
+            return set()
+
+        self.__values[self.__pd_rows, :2] = currents[self.__pd_take]
+        self.__values[self.__pd_rows, 2:] = powers[self.__pd_take]
+
+        return self.__pd_read
+
+    def __index_pd_elements(self, names):
+        """Maps the rows of the PDElements bulk arrays to the rows of
+        self.__values."""
+
+        counts = np.asarray(dss.PDElements.AllNumTerminals(), dtype=int) * \
+                 np.asarray(dss.PDElements.AllNumConductors(), dtype=int)
+        offsets = np.cumsum(counts) - counts
+
+        prefixes = {dss_class: prefix for prefix, (model, dss_class, terminals, scale)
+                    in ELEMENT_TYPES.items()}
+
+        rows, take = [], []
+        self.__pd_read = set()
+
+        for name, offset, count in zip(names, offsets.tolist(), counts.tolist()):
+            # bulk names are qualified with their class, e.g. 'Line.650632'
+            dss_class, _, name = name.lower().partition('.')
+            element_name = '{}_{}'.format(prefixes.get(dss_class), name)
+
+            if element_name not in self.__rows:
+                continue
+
+            first, num_rows = self.__rows[element_name]
+            if num_rows != count:
+                continue
+
+            rows.extend(range(first, first + count))
+            take.extend(range(offset, offset + count))
+            self.__pd_read.add(element_name)
+
+        self.__pd_rows = np.array(rows, dtype=int)
+        self.__pd_take = np.array(take, dtype=int)
+        self.__pd_count = int(counts.sum())
+        self.__pd_names = names
+
+    def __read_conductors(self, element):
+        """Reads the currents and powers of the currently active element into
+        self.__values."""
+
+        first, count = self.__rows[element.name]
+
+        currents = np.reshape(dss.CktElement.CurrentsMagAng(), (-1, 2))[:count]
+        powers = np.reshape(dss.CktElement.Powers(), (-1, 2))[:count]
+
+        self.__values[first:first + len(currents), :2] = currents
+        self.__values[first:first + len(powers), 2:] = powers
+
+    def __refresh_enabled(self):
+        """Re-reads the enabled state of every element after the circuit was
+        recompiled. Otherwise it only changes through write commands, which
+        already track it."""
+
+        for prefix, (model, dss_class, terminals, scale) in ELEMENT_TYPES.items():
+            if self.__types[prefix]:
+                dss.Circuit.SetActiveClass(dss_class)
+
+            for element in self.__types[prefix]:
+                dss.Circuit.SetActiveElement(element.name[len(prefix) + 1:])
+                element.active = dss.CktElement.Enabled() == 1
+
+        self.__recompiled = False
 
     def __gen_rand_num(self):
         """Generate a random number between 0.99 and 1.01. Used to add noise to
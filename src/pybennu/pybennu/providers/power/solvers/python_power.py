@@ -5,250 +5,71 @@ environments.  The PyPowerSolver class inherits from the Provider
 class which abstracts away the communication interface code that all
 providers require.
 """
-import copy
 import sys
 import time
-import random
 import threading
 import argparse
+from types import MappingProxyType
 from configparser import ConfigParser
-from pypower.api import ppoption, runpf, loadcase
-from pybennu.distributed.provider import Provider
+from pypower.api import loadcase
+import pybennu.distributed.codec as codec
+from pybennu.distributed.provider import Provider, merge_reads
+from pybennu.providers.power.solvers import python_power_contingency as contingency
+from pybennu.providers.power.solvers.python_power_engine import SolutionCache, SolveEngine
+from pybennu.providers.power.solvers.python_power_state import CaseState
+from pybennu.providers.power.solvers.python_power_timeseries import Profile, TimeSeries
 
 class PyPower(Provider):
-    """PyPower-based implementation of a grid simulation interface."""
+    """PyPower-based implementation of a grid simulation interface.
 
-    def __init__(self, server_endpoint, publish_endpoint, case_filename, debug=False):
+    Besides the common verbs, 'CONTINGENCY=[branch|gen|<glob pattern>]'
+    solves the single outages of the current system in parallel (see
+    python_power_contingency) and replies with each outage's convergence,
+    violations and solve time.
+
+    The system can also be driven by load and generation profiles (see
+    enable_timeseries()).
+    """
+
+    commands = ('CONTINGENCY',)
+
+    def __init__(self, server_endpoint, publish_endpoint, case_filename, debug=False,
+                 cache_size=32, contingency_workers=0, solve_mode='ac'):
         Provider.__init__(self, server_endpoint, publish_endpoint)
+        # __lock guards the case arrays while tags are written or rebound to
+        # a new solution. __solve_lock is held from a write through the solve
+        # and bind, so writes from requests and from the time series are
+        # solved one at a time, each on a stable case. READ requests don't
+        # take either: they are served from __values, an immutable snapshot
+        # of every tag swapped in whole once a write is solved.
         self.__lock = threading.Lock()
+        self.__solve_lock = threading.RLock()
+        self.__values = MappingProxyType({})
 
         self.debug = debug
         
         #self.system is a case file format dictionary of the case file
         self.system = loadcase(case_filename)
 
-        self.elements = {'bus':{},'load':{},'shunt':{},'gen':{},'branch':{}}
-        # keep a dictionary for each device type so that there is correlation between
-        # device name e.g. 'load-1_bus-1' and which index idx in self.system['bus'][idx]
-        # gets the row associated with the device
-        self.busidx = {}
-        self.genidx = {}
-        self.branchidx = {}
-
-        # use this bus to track when pypower solve fails to converge
-        self.elements['bus']['bus-alert'] = {}
-        self.elements['bus']['bus-alert']['active'] = False
+        # tags are read and written directly from/to the case arrays, with
+        # device name -> row maps built once (see CaseState). bus-alert.active
+        # tracks when the pypower solve fails to converge.
+        self.state = CaseState(self.system)
+        self.__query_reply = 'ACK=' + ','.join(self.state.tags()) + ','
+        # 'ac', 'dc' (MW flows only, for very large cases) or 'ac-dc' (DC
+        # when the AC power flow does not converge), see SolveEngine
+        self.engine = SolveEngine(solve_mode)
+        # converged solutions of recently seen control states, so toggling
+        # back to a previous state restores it instead of solving it again
+        self.cache = SolutionCache(cache_size)
+        # worker processes are started on the first CONTINGENCY request
+        self.contingency = contingency.ContingencyAnalysis(contingency_workers, mode=solve_mode)
+        self.timeseries = None
 
         self.create()
 
-    def _pcf_to_dict(self):
-        """Update PyPower's internal dictionary representation based on PyPower's internal pypower case dictionary"""
-        for idx,data in enumerate(self.system['bus']):
-            bus_name = 'bus-' + str(int(data[0])) # the pti format bus number seems to be stored as a float
-            
-            if data[1] != 3:
-                bus_slack = False
-            else:
-                bus_slack = True
-
-            if data[1] == 4:
-                bus_active = False
-            else:
-                bus_active = True
-
-
-            bus_voltage = data[7]
-
-            bus_angle = data[8]
-            bus_base_kv = data[9]
-            bus_load_mw = data[2]
-            bus_load_mvar = data[3]
-            bus_shunt_mvar = data[5]
-            # initialize these to 0 and adjust when looking through generator PTI data
-            bus_gen_mw = 0.0
-            bus_gen_mvar = 0.0
-            
-            self.busidx[bus_name] = idx
-            self.elements['bus'][bus_name] = {}
-            self.elements['bus'][bus_name]['voltage'] = bus_voltage
-            self.elements['bus'][bus_name]['angle'] = bus_angle
-            self.elements['bus'][bus_name]['gen_mw'] = bus_gen_mw
-            self.elements['bus'][bus_name]['gen_mvar'] = bus_gen_mvar
-            self.elements['bus'][bus_name]['load_mw'] = bus_load_mw
-            self.elements['bus'][bus_name]['load_mvar'] = bus_load_mvar
-            self.elements['bus'][bus_name]['shunt_mvar'] = bus_shunt_mvar
-            self.elements['bus'][bus_name]['base_kv'] = bus_base_kv
-            self.elements['bus'][bus_name]['active'] = bus_active
-            self.elements['bus'][bus_name]['slack'] = bus_slack
-
-            if data[2] != 0 or data[3] != 0:
-                load_name = 'load-1_' + bus_name
-                load_mw = data[2]
-                load_mvar = data[3]
-                load_bus = int(data[0])
-                load_active = True
-                self.elements['load'][load_name] = {}
-                self.elements['load'][load_name]['bus'] = load_bus
-                self.elements['load'][load_name]['mw'] = load_mw
-                self.elements['load'][load_name]['mvar'] = load_mvar
-                self.elements['load'][load_name]['active'] = load_active
-
-
-            if data[5] != 0:
-                shunt_name = 'shunt-1_' + bus_name
-                shunt_actual_mvar = data[5]
-                shunt_nominal_mvar = data[5]
-                shunt_bus = int(data[0])
-                shunt_active = True
-                self.elements['shunt'][shunt_name] = {}
-                self.elements['shunt'][shunt_name]['bus'] = shunt_bus
-                self.elements['shunt'][shunt_name]['actual_mvar'] = shunt_actual_mvar
-                self.elements['shunt'][shunt_name]['nominal_mvar'] = shunt_nominal_mvar
-                self.elements['shunt'][shunt_name]['active'] = shunt_active
-
-        
-        g = {} # keep track of multiple generators with bus numbers as keys
-        #pass thru once to initialize
-        for data in self.system['gen']:
-            g[int(data[0])] = 0
-        for idx,data in enumerate(self.system['gen']):
-            bus_name = 'bus-' + str(int(data[0]))
-            g[int(data[0])] += 1
-
-            gen_name = 'generator-' + str(g[int(data[0])]) + '_' + bus_name
-            gen_bus = int(data[0])
-
-            if data[7] <= 0:
-                gen_active = False
-            else:
-                gen_active = True
-
-            gen_voltage = data[5]
-            gen_mw = data[1]
-            gen_mvar = data[2]
-            gen_mvar_max = data[3]
-            gen_mvar_min = data[4]
-            gen_mw_max = data[8]
-            gen_mw_min = data[9]
-            
-            self.genidx[gen_name] = idx
-            self.elements['gen'][gen_name] = {}
-            self.elements['gen'][gen_name]['mw'] = gen_mw
-            self.elements['gen'][gen_name]['mvar'] = gen_mvar
-            self.elements['gen'][gen_name]['mw_max'] = gen_mw_max
-            self.elements['gen'][gen_name]['mw_min'] = gen_mw_min
-            self.elements['gen'][gen_name]['mvar_max'] = gen_mvar_max
-            self.elements['gen'][gen_name]['mvar_min'] = gen_mvar_min
-            self.elements['gen'][gen_name]['voltage'] = gen_voltage
-            self.elements['gen'][gen_name]['active'] = gen_active
-
-            for bus in self.elements['bus']:
-                if bus_name == bus:
-                    self.elements['bus'][bus]['gen_mw'] += data[1]
-                    self.elements['bus'][bus]['gen_mvar'] += data[2]
-                    break
-
-
-            
-        b = {} #keep track of multiple branches with from,to bus numbers as keys e.g. b = {(0,1):0,(0,2):0}
-        for data in self.system['branch']:
-            b[int(data[0]),int(data[1])] = 0
-        for idx,data in enumerate(self.system['branch']):
-            b[int(data[0]),int(data[1])] += 1
-            
-            # branch-#_from-to
-            branch_name = 'branch-' + str(b[int(data[0]),int(data[1])]) + '_' + str(int(data[0])) + '-' + str(int(data[1]))
-
-            if data[10] == 0:
-                branch_active = False
-            else:
-                branch_active = True
-
-            branch_source = int(data[0])
-            branch_target = int(data[1])
-            branch_resistance = data[2]
-            branch_reactance = data[3]
-            branch_charging = data[4]
-            branch_mva_max = data[5]
-            branch_mva_max = data[6]
-            branch_mva_max = data[7]
-            branch_turns_ratio = data[8]
-            branch_phase_angle = data[9]
-            
-            # 'current', 'source_mw', 'target_mw' not found in case file format
-
-            self.branchidx[branch_name] = idx
-            self.elements['branch'][branch_name] = {}
-            self.elements['branch'][branch_name]['source'] = branch_source
-            self.elements['branch'][branch_name]['target'] = branch_target
-            self.elements['branch'][branch_name]['resistance'] = branch_resistance
-            self.elements['branch'][branch_name]['reactance'] = branch_reactance
-            self.elements['branch'][branch_name]['charging'] = branch_charging
-            self.elements['branch'][branch_name]['mva_max'] = branch_mva_max
-            self.elements['branch'][branch_name]['turns_ratio'] = branch_turns_ratio
-            self.elements['branch'][branch_name]['phase_angle'] = branch_phase_angle
-            self.elements['branch'][branch_name]['active'] = branch_active
-
-    def _dict_to_pcf(self):
-        """Make updates to the local pypower case format dictionary based on the local internal dictionary, elements.
-        This method is used during write command handler method to update the pcf dictionary before running a power flow on it in __solve
-        """
-        for bus in self.elements['bus']:
-            if bus != 'bus-alert':
-                index = self.busidx[bus]
-                data = self.system['bus'][index]
-                if self.elements['bus'][bus]['active']:
-                    if self.elements['bus'][bus]['slack']:
-                        data[1] = 3
-                    else:
-                        data[1] = 1
-                else:
-                    data[1] = 4
-
-                data[2] = self.elements['bus'][bus]['load_mw']
-                data[3] = self.elements['bus'][bus]['load_mvar']
-                data[5] = self.elements['bus'][bus]['shunt_mvar']
-                data[7] = self.elements['bus'][bus]['voltage']
-                data[8] = self.elements['bus'][bus]['angle']
-                data[9] = self.elements['bus'][bus]['base_kv']
-
-        for gen in self.elements['gen']:
-            index = self.genidx[gen]
-            data = self.system['gen'][index]
-            data[1] = self.elements['gen'][gen]['mw']
-            data[2] = self.elements['gen'][gen]['mvar']
-            data[3] = self.elements['gen'][gen]['mvar_max']
-            data[4] = self.elements['gen'][gen]['mvar_min']
-            data[5] = self.elements['gen'][gen]['voltage']
-            data[8] = self.elements['gen'][gen]['mw_max']
-            data[9] = self.elements['gen'][gen]['mw_min']
-            if self.elements['gen'][gen]['active']:
-                data[7] = 1
-            else:
-                data[7] = 0
-
-        for branch in self.elements['branch']:
-            index = self.branchidx[branch]
-            data = self.system['branch'][index]
-            data[2] = self.elements['branch'][branch]['resistance']
-            data[3] = self.elements['branch'][branch]['reactance']
-            data[4] = self.elements['branch'][branch]['charging']
-            data[5] = self.elements['branch'][branch]['mva_max']
-            data[6] = self.elements['branch'][branch]['mva_max']
-            data[7] = self.elements['branch'][branch]['mva_max']
-            data[8] = self.elements['branch'][branch]['turns_ratio']
-            data[9] = self.elements['branch'][branch]['phase_angle']
-            if self.elements['branch'][branch]['active']:
-                data[10] = 1
-            else:
-                data[10] = 0
-
-
-
     def create(self):
         """Initialize the power system under study."""
-        with self.__lock:
-            self._pcf_to_dict()
         self.__solve()
         return
     
@@ -260,14 +81,7 @@ class PyPower(Provider):
 
         if self.debug:
             print('Processing query')
-        tags = ''
-        with self.__lock:
-            for dev_type in self.elements:
-                for dev_name,fields in self.elements[dev_type].items():
-                    for field,value in fields.items():
-                        tags += dev_name + '.' + field + ','
-        msg = 'ACK={}'.format(tags)
-        return msg
+        return self.__query_reply
 
     def read(self, tag):
         """Implements the read command interface for receiving the PyPower
@@ -277,15 +91,19 @@ class PyPower(Provider):
 
         if self.debug:
             print('Processing read request')
+        return self.__read(self.__values, tag)
+
+    def read_many(self, tags):
+        """Reads several tags from the same solved state."""
+        values = self.__values
+        return merge_reads(tags, [self.__read(values, tag) for tag in tags])
+
+    def __read(self, values, tag):
+        tag = tag.strip('\x00')
         try:
-            element, field = tag.strip('\x00').split('.')
-            devtype, id_ = element.split('-', 1)
-            if devtype == "generator":
-                devtype = "gen"
-            with self.__lock:
-                value = self.elements[devtype][element][field]
-            reply = element + '.' + field + ':' +str(value).lower()
-            msg = 'ACK={}'.format(reply) if str(value) else 'ERR={}'.format("No data found.")
+            msg = 'ACK={}:{}'.format(tag, codec.format_value(values[tag]))
+        except KeyError:
+            msg = 'ERR=Tag not found: {}'.format(tag)
         except Exception as err:
             msg = 'ERR={}'.format(err)
         return msg
@@ -299,36 +117,91 @@ class PyPower(Provider):
         if self.debug:
             print('Processing write command')
 
-        try:
-            for tag, value in tags.items():
-                if self.debug:
-                    print('PyPower.write ---- received write command for: '
-                        + tag + ' with value ' + value + ' -> ', end='')
+        with self.__solve_lock:
+            try:
+                with self.__lock:
+                    for tag, value in tags.items():
+                        if self.debug:
+                            print('PyPower.write ---- received write command for: '
+                                + tag + ' with value ' + value)
+                        self.state.set(tag.strip('\x00'), value)
+            except KeyError as err:
+                self.__refresh()
+                return 'ERR=Tag not found: {}'.format(err.args[0])
+            except ValueError as err:
+                self.__refresh()
+                return 'ERR={}'.format(err)
 
-                element, field = tag.strip('\x00').split('.')
-                devtype, _ = element.split('-', 1)
-                devtype = 'gen' if 'gen' in devtype else devtype
+            try:
+                self.__solve()
+                msg = 'ACK=Success processing PyPower write command'
+            except Exception as err:
+                print("ERROR: Provider failed to process write message with exception: %s" % str(err))
+                msg = 'ERR=Provider failed to process write message with exception: {} on line {}'.format(err,sys.exc_info()[-1].tb_lineno)
 
-                if value in ['true', 'false']:
-                    if field in ['slack','active']:
-                        val = True if value == 'true' else False
-                    else:
-                        return 'ERR=Invalid value for tag: {}'.format(tag)
-                else:
-                    val = float(value)
+        return msg
 
-                with self.__lock:
-                    self.elements[devtype][element][field] = val
-                    self._dict_to_pcf()
+    def validate_write(self, tags):
+        """Checks the tags and values of a batched write before it is
+        acknowledged, with the replies write() would give."""
+        try:
+            for tag, value in tags.items():
+                self.state.check(tag.strip('\x00'), value)
+        except KeyError as err:
+            return 'ERR=Tag not found: {}'.format(err.args[0])
+        except ValueError as err:
+            return 'ERR={}'.format(err)
+        return None
+
+    def enable_timeseries(self, profiles, speed=1.0, loop=False):
+        """Step the system through load/generation profiles (files read with
+        Profile.load()) once the provider runs, speed times faster than real
+        time (0 = as fast as possible), optionally looping."""
+        profile = Profile.combine([Profile.load(path) for path in profiles])
+        self.timeseries = TimeSeries(self, profile, speed, loop)
+        return self.timeseries
+
+    def apply(self, write, values, sim_time=None):
+        """Write a time series step with a CaseState.writer() function and
+        solve, with sim_time as the simulation time of the new state."""
+        with self.__solve_lock:
+            with self.__lock:
+                write(values)
+            self.__solve(sim_time)
 
-            self.__solve()
+    def run(self):
+        if self.timeseries:
+            self.timeseries.start()
+        Provider.run(self)
 
-            msg = 'ACK=Success processing PyPower write command'
+    def command(self, verb, payload):
+        """Implements the CONTINGENCY command, N-1 analysis of the current
+        system (all outages, 'branch', 'gen' or a glob pattern of device
+        names), replying with '<outage>.<field>:<value>,...'. The outages
+        are solved on a copy of the system, so writes and reads go on while
+        the analysis runs."""
+
+        if self.debug:
+            print('Processing contingency request')
+        with self.__lock:
+            if self.state.alert:
+                return 'ERR=The current power system is not solved'
+            system = dict(self.system)
+            for name in contingency.ARRAYS:
+                system[name] = system[name].copy()
+        try:
+            selected = contingency.select(system, self.state, payload)
+            if not selected:
+                return 'ERR=No outages match {}'.format(payload)
+            results = self.contingency.run(system, selected, self.state)
         except Exception as err:
-            print("ERROR: Provider failed to process write message with exception: %s" % str(err))
-            msg = 'ERR=Provider failed to process write message with exception: {} on line {}'.format(err,sys.exc_info()[-1].tb_lineno)
+            return 'ERR=Contingency analysis failed: {}'.format(err)
+        return 'ACK=' + contingency.format_results(results)
 
-        return msg
+    def snapshot(self):
+        """Current (noisy) value of every tag, used for scheduled publishing."""
+        with self.__lock:
+            return self.state.values(noise=True)
 
     def periodic_publish(self):
         """Loop that calls `self.publish` every second."""
@@ -341,68 +214,54 @@ class PyPower(Provider):
                 print("provider periodic_publish error: {}".format(e))
             time.sleep(1)
 
-    def _add_noise(self,value):
-        """Generate a random number between 0.99 and 1.01. Used to add noise to the system."""
-        if value == 0.0:
-            rand_num = random.uniform(-0.1,0.1)
-        else:
-            rand_num = value * random.uniform(0.99, 1.01)
-        return rand_num
-
     def _pack_data(self):
-        """Pack system data into a string"""
-        # Creating temp system to add noise to the steady state
-        # power system data. Doing this so that the self.elements
-        # is preserved.
-
+        """Pack system data into a string, with noise added to the steady
+        state measurements."""
         with self.__lock:
-            temp_elem = copy.deepcopy(self.elements)
-        
-        for dev_name,fields in temp_elem['bus'].items():
-            for field,value in fields.items():
-                if field not in ['base_kv','active','slack']:
-                    temp_elem['bus'][dev_name][field] = self._add_noise(temp_elem['bus'][dev_name][field])
-        for dev_name,fields in temp_elem['load'].items():
-            for field,value in fields.items():
-                if field not in ['bus','active']:
-                    temp_elem['load'][dev_name][field] = self._add_noise(temp_elem['load'][dev_name][field])
-
-        for dev_name,fields in temp_elem['shunt'].items():
-            for field,value in fields.items():
-                if field not in ['bus','active']:
-                    temp_elem['shunt'][dev_name][field] = self._add_noise(temp_elem['shunt'][dev_name][field])
-
-        for dev_name,fields in temp_elem['gen'].items():
-            for field,value in fields.items():
-                if field not in ['mw_max','mw_min','mvar_max','mvar_min','active']:
-                    temp_elem['gen'][dev_name][field] = self._add_noise(temp_elem['gen'][dev_name][field])
-        msg = ''
-        for dev_type in temp_elem:
-            for dev_name,fields in temp_elem[dev_type].items():
-                for field,value in fields.items():
-                    msg += '{}.{}:{},'.format(dev_name, field, str(value).lower())
-        return msg
-
+            return self.state.format(noise=True)
 
-    def __solve(self, **kwargs):
-        options = ppoption(**kwargs)
-        options['OUT_ALL'] = 1
-        #options['PF_MAX_IT'] = 20
-        #enforce q lims seems to cause index error for 300 bus case
-        #options['ENFORCE_Q_LIMS'] = 1
-        try:
-            results, success = runpf(self.system, options)
-            if not success:
+    def __solve(self, sim_time=None):
+        # quiet, warm-started solve with cached admittance matrices, solve
+        # times and iteration counts are recorded in the metrics (solve.*)
+        with self.__solve_lock:
+            try:
+                key = self.cache.key(self.system)
+                results = self.cache.get(key)
+                if results is not None:
+                    with self.__lock:
+                        self.system = results
+                        self.state.bind(results)
+                        self.state.alert = False
+                    self.__refresh()
+                    if self.debug:
+                        print('PyPower restored a cached solution')
+                    self.state_changed(sim_time)
+                    return
+
+                results, success = self.engine.solve(self.system)
+                if not success:
+                    print('Failed to solve for new power system')
+                    self.state.alert = True
+                    self.__refresh()
+                    return
+                with self.__lock:
+                    self.system = results
+                    self.state.bind(results)
+                    self.state.alert = False
+                    self.cache.put(key, results)
+                self.__refresh()
+                if self.debug:
+                    print('PyPower solved ({}) in {} iterations, {:.3f} s'.format(
+                        self.engine.method, self.engine.iterations, self.engine.duration))
+                self.state_changed(sim_time)
+            except Exception as err:
                 print('Failed to solve for new power system')
-                self.elements['bus']['bus-alert']['active'] = True
-                return
-            #sys.stdout.flush()
-            with self.__lock:
-                self.system = results
-                self._pcf_to_dict()
-                self.elements['bus']['bus-alert']['active'] = False
-        except Exception as err:
-            print('Failed to solve for new power system')
-            print('Error: ' + str(err))
-            self.elements['bus']['bus-alert']['active'] = True
+                print('Error: ' + str(err))
+                self.state.alert = True
+                self.__refresh()
         return
+
+    def __refresh(self):
+        # swap in a new snapshot for READ requests, never modified afterwards
+        with self.__lock:
+            self.__values = MappingProxyType(self.state.values())
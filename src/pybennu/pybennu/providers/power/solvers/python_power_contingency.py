@@ -0,0 +1,327 @@
+"""N-1 contingency analysis for the PyPower provider.
+
+This module defines the ContingencyAnalysis class, which solves the power
+flow of a case with each in-service branch or generator taken out of
+service in turn and reports, for each outage, whether the power flow
+converged, the voltage and thermal limit violations and the solve time.
+
+Outages are solved in parallel by a pool of worker processes. The base case
+arrays are written once per analysis to files in /dev/shm (or the temporary
+directory) that the workers memory-map, so only outage indices and small
+result dictionaries go through the pool's pipes and the analysis scales
+with the number of cores.
+
+It can be run from the command line on a case file:
+
+    pybennu-contingency case118.py --workers 16
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fnmatch import fnmatchcase
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pypower.api import loadcase
+from pypower.idx_brch import BR_STATUS, F_BUS, PF, PT, QF, QT, RATE_A, T_BUS
+from pypower.idx_bus import BUS_I, BUS_TYPE, NONE, VM, VMAX, VMIN
+from pypower.idx_gen import GEN_STATUS
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import pybennu.distributed.metrics as metrics
+from pybennu.providers.power.solvers.python_power_engine import AC, MODES, SolveEngine
+from pybennu.providers.power.solvers.python_power_state import CaseState
+
+BRANCH = 'branch'
+GEN = 'gen'
+ARRAYS = ('bus', 'gen', 'branch')
+
+Outage = Tuple[str, int]
+
+
+def outages(ppc: Dict[str, Any], kinds: Sequence[str] = (BRANCH, GEN)) -> List[Outage]:
+    """The single outages of a case: its in-service branches and generators."""
+    result: List[Outage] = []
+    if BRANCH in kinds:
+        result.extend((BRANCH, int(i)) for i in np.flatnonzero(ppc['branch'][:, BR_STATUS] != 0))
+    if GEN in kinds:
+        result.extend((GEN, int(i)) for i in np.flatnonzero(ppc['gen'][:, GEN_STATUS] > 0))
+    return result
+
+
+class ContingencyAnalysis:
+    """Solves the single outages of a case with a pool of worker processes.
+
+    The pool is started on first use and kept for later analyses. Workers
+    are started with the forkserver method where it is available, so they
+    don't inherit the threads of the provider.
+    """
+
+    def __init__(self, workers: int = 0, **options: Any) -> None:
+        """
+        Args:
+            workers: number of worker processes (0 = one per CPU)
+            options: PyPower options for the outage solves, e.g. PF_TOL
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.options = options
+        self.metrics = metrics.get_registry()
+        self.__pool: Optional[ProcessPoolExecutor] = None
+
+    def run(self, ppc: Dict[str, Any], selected: Optional[List[Outage]] = None,
+            names: Optional[CaseState] = None) -> List[Dict[str, Any]]:
+        """Solve the outages of a (solved) case, which is not modified.
+
+        Args:
+            ppc: base case, its voltages are the initial guess of the solves
+            selected: outages to solve, defaults to all of them (see outages())
+            names: device names of the case, built from the case if not given
+
+        Returns:
+            One dictionary per outage, in order, with the outage name, kind,
+            converged, islanded, iterations, solve_time, min_voltage,
+            max_loading (of the branch ratings), voltage_violations and
+            overloads (names of the buses and branches out of limits).
+        """
+        if selected is None:
+            selected = outages(ppc)
+        if names is None:
+            names = CaseState(ppc)
+        if not selected:
+            return []
+
+        start = time.perf_counter()
+        directory = tempfile.mkdtemp(prefix='pybennu-contingency-',
+                                     dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        try:
+            for name in ARRAYS:
+                np.save(os.path.join(directory, name + '.npy'),
+                        np.ascontiguousarray(ppc[name], dtype=float))
+            # outages only count as islanding if they split the case further
+            base = (directory, float(ppc['baseMVA']), _components(ppc), self.options)
+
+            # a few chunks per worker balances the load without sending
+            # every outage through the pool separately
+            size = max(1, math.ceil(len(selected) / (self.workers * 4)))
+            chunks = [selected[i:i + size] for i in range(0, len(selected), size)]
+            pool = self.__executor()
+            results = [result for chunk in pool.map(_solve_chunk, [base] * len(chunks), chunks)
+                       for result in chunk]
+        except BrokenProcessPool:
+            # a worker died, start a new pool for the next analysis
+            self.close()
+            raise
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        bus_names = names.tables['bus'].names
+        branch_names = names.tables['branch'].names
+        for result in results:
+            result['name'] = names.tables[result['kind']].names[result['index']]
+            result['voltage_violations'] = [bus_names[i] for i in result['voltage_violations']]
+            result['overloads'] = [branch_names[i] for i in result['overloads']]
+
+        self.metrics.count("contingency.runs")
+        self.metrics.count("contingency.outages", len(results))
+        self.metrics.count("contingency.failures",
+                           sum(1 for result in results if not result['converged']))
+        self.metrics.observe("contingency.duration", time.perf_counter() - start)
+        return results
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    def __executor(self) -> ProcessPoolExecutor:
+        if self.__pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+            self.__pool = ProcessPoolExecutor(self.workers, mp_context=context)
+        return self.__pool
+
+
+def select(ppc: Dict[str, Any], names: CaseState, pattern: str = '') -> List[Outage]:
+    """Outages selected by a request payload: 'branch', 'gen', a glob
+    pattern of device names (e.g. 'branch-*_1-*') or '' for all of them."""
+    pattern = pattern.strip()
+    if pattern in ('', BRANCH, GEN):
+        return outages(ppc, (pattern,) if pattern else (BRANCH, GEN))
+    return [(kind, index) for kind, index in outages(ppc)
+            if fnmatchcase(names.tables[kind].names[index], pattern)]
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """'<outage>.<field>:<value>,...' summary of contingency results."""
+    pairs = []
+    for result in results:
+        name = result['name']
+        pairs.append('{}.converged:{}'.format(name, 'true' if result['converged'] else 'false'))
+        pairs.append('{}.islanded:{}'.format(name, 'true' if result['islanded'] else 'false'))
+        pairs.append('{}.iterations:{}'.format(name, result['iterations']))
+        pairs.append('{}.solve_time:{:.6f}'.format(name, result['solve_time']))
+        pairs.append('{}.min_voltage:{:.6f}'.format(name, result['min_voltage']))
+        pairs.append('{}.max_loading:{:.6f}'.format(name, result['max_loading']))
+        pairs.append('{}.voltage_violations:{}'.format(name, len(result['voltage_violations'])))
+        pairs.append('{}.overloads:{}'.format(name, len(result['overloads'])))
+    return ','.join(pairs)
+
+
+# ===== worker processes =====
+
+# base case of the current analysis in this worker: (directory, case,
+# connected components), and the engine solving its outages: (options, engine)
+_base: Tuple[Optional[str], Optional[Dict[str, Any]], int] = (None, None, 0)
+_engine: Tuple[Optional[Dict[str, Any]], Optional[SolveEngine]] = (None, None)
+
+
+def _solve_chunk(base: Tuple[str, float, int, Dict[str, Any]],
+                 chunk: List[Outage]) -> List[Dict[str, Any]]:
+    global _base, _engine
+    directory, baseMVA, components, options = base
+    if _base[0] != directory:
+        case = {'version': '2', 'baseMVA': baseMVA}
+        for name in ARRAYS:
+            case[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+        _base = (directory, case, components)
+    if _engine[1] is None or _engine[0] != options:
+        _engine = (options, SolveEngine(**options))
+    return [_solve(_base[1], _base[2], _engine[1], kind, index) for kind, index in chunk]
+
+
+def _solve(base: Dict[str, Any], components: int, engine: SolveEngine,
+           kind: str, index: int) -> Dict[str, Any]:
+    ppc = dict(base)
+    ppc[kind] = np.array(base[kind])
+    if kind == BRANCH:
+        ppc[kind][index, BR_STATUS] = 0
+    else:
+        ppc[kind][index, GEN_STATUS] = 0
+    result = {'kind': kind, 'index': index, 'converged': False, 'islanded': False,
+              'iterations': 0, 'solve_time': 0.0, 'min_voltage': float('nan'),
+              'max_loading': float('nan'), 'voltage_violations': [], 'overloads': []}
+
+    if kind == BRANCH and _islanded(ppc, components):
+        result['islanded'] = True
+        return result
+    # every outage starts from the base case solution, so its result
+    # doesn't depend on which outages the worker solved before
+    engine.clear_warm_start()
+    try:
+        results, success = engine.solve(ppc)
+    except Exception:
+        # e.g. no generator left to take the slack
+        return result
+    result['iterations'] = engine.iterations
+    result['solve_time'] = engine.duration
+    if not success:
+        return result
+    result['converged'] = True
+
+    bus, branch = results['bus'], results['branch']
+    live = np.flatnonzero(bus[:, BUS_TYPE] != NONE)
+    vm = bus[live, VM]
+    result['min_voltage'] = float(vm.min())
+    out = (vm < bus[live, VMIN]) | (vm > bus[live, VMAX])
+    result['voltage_violations'] = live[out].tolist()
+
+    rated = np.flatnonzero((branch[:, BR_STATUS] != 0) & (branch[:, RATE_A] > 0))
+    flow = np.maximum(np.hypot(branch[rated, PF], branch[rated, QF]),
+                      np.hypot(branch[rated, PT], branch[rated, QT]))
+    loading = flow / branch[rated, RATE_A]
+    result['max_loading'] = float(loading.max()) if len(loading) else 0.0
+    result['overloads'] = rated[loading > 1].tolist()
+    return result
+
+
+def _islanded(ppc: Dict[str, Any], components: int) -> bool:
+    """True if the in-service branches of a case split its live buses into
+    more than the base case's components."""
+    return _components(ppc) > components
+
+
+def _components(ppc: Dict[str, Any]) -> int:
+    """Number of islands the in-service branches of a case connect its
+    live buses into."""
+    bus, branch = ppc['bus'], ppc['branch']
+    live = bus[:, BUS_TYPE] != NONE
+    row = {int(number): i for i, number in enumerate(bus[live, BUS_I])}
+    on = branch[branch[:, BR_STATUS] != 0]
+    ends = [(row[int(f)], row[int(t)]) for f, t in on[:, [F_BUS, T_BUS]]
+            if int(f) in row and int(t) in row]
+    if not ends:
+        return len(row)
+    f, t = np.array(ends).T
+    graph = coo_matrix((np.ones(len(f)), (f, t)), shape=(len(row), len(row)))
+    count, _ = connected_components(graph, directed=False)
+    return count
+
+
+# ===== command line =====
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="N-1 contingency analysis of a PyPower case")
+    parser.add_argument('case', help='PyPower case file')
+    parser.add_argument('--outages', default='',
+                        help="'branch', 'gen' or a glob pattern of device names (default: all)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--violations', action='store_true',
+                        help='only list outages that failed or have violations')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--mode', choices=MODES, default=AC,
+                        help='power flow formulation (default: ac)')
+    args = parser.parse_args()
+
+    ppc = loadcase(args.case)
+    engine = SolveEngine(args.mode)
+    ppc, success = engine.solve(ppc)
+    if not success:
+        print('ERROR: the base case did not converge')
+        raise SystemExit(1)
+    names = CaseState(ppc)
+
+    analysis = ContingencyAnalysis(args.workers, mode=args.mode)
+    start = time.perf_counter()
+    selected = select(ppc, names, args.outages)
+    try:
+        results = analysis.run(ppc, selected, names)
+    finally:
+        analysis.close()
+    elapsed = time.perf_counter() - start
+
+    if args.violations:
+        results = [result for result in results if not result['converged']
+                   or result['voltage_violations'] or result['overloads']]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    columns = ['name', 'converged', 'iterations', 'solve_time', 'min_voltage', 'max_loading',
+               'violations']
+    rows = [[result['name'],
+             'islanded' if result['islanded'] else 'yes' if result['converged'] else 'no',
+             str(result['iterations']), '{:.4f}'.format(result['solve_time']),
+             '{:.4f}'.format(result['min_voltage']), '{:.3f}'.format(result['max_loading']),
+             ' '.join(result['voltage_violations'] + result['overloads'])]
+            for result in results]
+    widths = [max([len(column)] + [len(row[i]) for row in rows]) for i, column in enumerate(columns)]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip())
+    for row in rows:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+    print('{} outages solved by {} workers in {:.2f} s'.format(
+        len(selected), analysis.workers, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+"""Power flow engine for the PyPower provider.
+
+This module defines the SolveEngine class, a quiet replacement for PyPower's
+runpf() that keeps state between solves:
+
+- the admittance matrices (Ybus, Yf, Yt) are cached and only rebuilt when
+  the topology or branch parameters change. A change of bus shunts only
+  updates the Ybus diagonal.
+- Newton-Raphson starts from the previous solution (with the current
+  generator voltage setpoints) as long as the topology is unchanged.
+- nothing is printed, solve times, iteration counts and cache use are
+  recorded in the pybennu metrics registry (solve.*).
+
+Besides the AC power flow, the engine can solve DC power flows (MW flows
+and angles only, with a cached factorization of the B matrix that is only
+redone when the topology changes), or fall back to a DC power flow when the
+AC one does not converge.
+
+It also defines the SolutionCache class, an LRU cache of converged solutions
+keyed by the controllable state of a case, so toggling breakers or setpoints
+back to a state that was already solved doesn't solve it again.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from pypower.api import ppoption
+from pypower.bustypes import bustypes
+from pypower.idx_brch import (BR_B, BR_R, BR_STATUS, BR_X, F_BUS, PF, PT, QF, QT, SHIFT,
+                              T_BUS, TAP)
+from pypower.idx_bus import BS, BUS_I, BUS_TYPE, GS, NONE, PD, QD, REF, VA, VM
+from pypower.idx_gen import GEN_BUS, GEN_STATUS, PG, QG, VG
+from pypower.makeBdc import makeBdc
+from pypower.makeSbus import makeSbus
+from pypower.makeYbus import makeYbus
+from pypower.newtonpf import newtonpf
+from pypower.pfsoln import pfsoln
+from scipy.sparse import diags
+from scipy.sparse.linalg import splu
+
+import pybennu.distributed.metrics as metrics
+
+AC = 'ac'
+DC = 'dc'
+AC_DC = 'ac-dc'
+MODES = (AC, DC, AC_DC)
+
+
+class SolveEngine:
+    """AC (Newton-Raphson) power flow with cached admittance matrices and
+    warm starts, or DC power flow with a cached factorization. One engine
+    should be used per case.
+
+    Modes:
+        ac: AC power flow
+        dc: DC power flow, bus voltage magnitudes are 1 and reactive
+            flows 0
+        ac-dc: AC power flow, falling back to a DC power flow when it
+            does not converge (counted in solve.dc_fallbacks)
+    """
+
+    def __init__(self, mode: str = AC, **options: Any) -> None:
+        """
+        Args:
+            mode: 'ac', 'dc' or 'ac-dc'
+            options: PyPower options (see pypower.ppoption), e.g. PF_TOL.
+
+        Raises:
+            ValueError: unknown mode
+        """
+        if mode not in MODES:
+            raise ValueError("invalid solve mode {!r}, must be one of: {}".format(
+                mode, ', '.join(MODES)))
+        self.mode = mode
+        self.ppopt = ppoption(VERBOSE=0, OUT_ALL=0, **options)
+        self.metrics = metrics.get_registry()
+        self.method = AC         # formulation of the last solve, 'ac' or 'dc'
+        self.iterations = 0      # Newton-Raphson iterations of the last solve
+        self.duration = 0.0      # seconds taken by the last solve
+        self.__topology: Optional[str] = None
+        self.__ybus = None
+        self.__shunts: Optional[np.ndarray] = None
+        self.__voltages: Optional[np.ndarray] = None
+        self.__dc: Optional[Tuple[Any, ...]] = None
+
+    def reset(self) -> None:
+        """Drop the cached matrices and solution, e.g. after loading a new case."""
+        self.__topology = None
+        self.__ybus = None
+        self.__shunts = None
+        self.__voltages = None
+        self.__dc = None
+
+    def clear_warm_start(self) -> None:
+        """Start the next AC solve from the case's voltages rather than the
+        previous solution, keeping the cached matrices."""
+        self.__voltages = None
+
+    def solve(self, ppc: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Run a power flow on a case (which is not modified).
+
+        Returns:
+            The solved case, in the same format as runpf() results, and
+            whether the power flow converged.
+        """
+        start = time.perf_counter()
+        if self.mode == DC:
+            results, success = self.__solve_dc(ppc)
+        else:
+            results, success = self.__solve(ppc)
+            if not success and self.mode == AC_DC:
+                self.metrics.count("solve.dc_fallbacks")
+                self.metrics.count("solve.iterations", self.iterations)
+                results, success = self.__solve_dc(ppc)
+        self.duration = results['et'] = time.perf_counter() - start
+
+        self.metrics.count("solve.count")
+        self.metrics.count("solve.iterations", self.iterations)
+        self.metrics.observe("solve.duration", self.duration)
+        if not success:
+            self.metrics.count("solve.failures")
+        return results, success
+
+    def __solve(self, ppc: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        self.method = AC
+        ppc, order = _internal(ppc)
+        baseMVA, bus, gen, branch = ppc['baseMVA'], ppc['bus'], ppc['gen'], ppc['branch']
+        ref, pv, pq = bustypes(bus, gen)
+
+        Ybus, Yf, Yt, same_topology = self.__admittances(baseMVA, bus, branch)
+
+        # initial guess: the previous solution if the topology didn't change
+        if same_topology and self.__voltages is not None:
+            V0 = self.__voltages.copy()
+        else:
+            V0 = bus[:, VM] * np.exp(1j * np.pi / 180 * bus[:, VA])
+        on = np.flatnonzero(gen[:, GEN_STATUS] > 0)
+        gbus = gen[on, GEN_BUS].astype(int)
+        controlled = ~np.isin(gbus, pq)   # in-service gens at voltage-controlled buses
+        gbus, gon = gbus[controlled], on[controlled]
+        V0[gbus] = gen[gon, VG] / np.abs(V0[gbus]) * V0[gbus]
+
+        Sbus = makeSbus(baseMVA, bus, gen)
+        V, success, self.iterations = newtonpf(Ybus, Sbus, V0, ref, pv, pq, self.ppopt)
+        self.__voltages = V if success else None
+
+        bus, gen, branch = pfsoln(baseMVA, bus, gen, branch, Ybus, Yf, Yt, V, ref, pv, pq)
+        return _external(order, bus, gen, branch, success), bool(success)
+
+    def __solve_dc(self, ppc: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """DC power flow, as runpf() with PF_DC, with the factorization of
+        B[pvpq, pvpq] reused until the topology or bus types change."""
+        self.method = DC
+        self.iterations = 0
+        # the next AC solve starts from the case's voltages
+        self.__voltages = None
+        ppc, order = _internal(ppc)
+        baseMVA, bus, gen, branch = ppc['baseMVA'], ppc['bus'], ppc['gen'], ppc['branch']
+        ref, pv, pq = bustypes(bus, gen)
+        pvpq = np.r_[pv, pq]
+
+        key = _topology_key(bus, branch) + np.asarray(ref, dtype=np.int64).tobytes().hex()
+        if self.__dc is None or self.__dc[0] != key:
+            self.metrics.count("solve.b_factorizations")
+            B, Bf, Pbusinj, Pfinj = makeBdc(baseMVA, bus, branch)
+            B = B.tocsr()
+            try:
+                lu = splu(B[pvpq, :][:, pvpq].tocsc())
+            except RuntimeError:
+                # singular, e.g. part of the network has no reference bus
+                self.__dc = None
+                return _external(order, bus, gen, branch, False), False
+            self.__dc = (key, B, Bf, Pbusinj, Pfinj, lu, B[pvpq, :][:, ref])
+        else:
+            self.metrics.count("solve.b_hits")
+        _, B, Bf, Pbusinj, Pfinj, lu, Bref = self.__dc
+
+        Va0 = bus[:, VA] * (np.pi / 180)
+        Pbus = makeSbus(baseMVA, bus, gen).real - Pbusinj - bus[:, GS] / baseMVA
+        Va = Va0.copy()
+        Va[pvpq] = lu.solve(Pbus[pvpq] - Bref @ Va0[ref])
+
+        branch[:, [QF, QT]] = 0
+        branch[:, PF] = (Bf @ Va + Pfinj) * baseMVA
+        branch[:, PT] = -branch[:, PF]
+        bus[:, VM] = 1
+        bus[:, VA] = Va * (180 / np.pi)
+        # the first in-service generator at each reference bus takes the slack
+        on = np.flatnonzero(gen[:, GEN_STATUS] > 0)
+        gbus = gen[on, GEN_BUS].astype(int)
+        refgen = np.array([on[np.flatnonzero(gbus == r)[0]] for r in ref], dtype=int)
+        gen[refgen, PG] += (B[ref, :] @ Va - Pbus[ref]) * baseMVA
+        return _external(order, bus, gen, branch, True), True
+
+    def __admittances(self, baseMVA: float, bus: np.ndarray, branch: np.ndarray):
+        """Cached Ybus, Yf and Yt of an internally indexed case, and whether
+        the topology is the same as in the previous solve."""
+        key = _topology_key(bus, branch)
+        shunts = bus[:, GS] + 1j * bus[:, BS]
+
+        if key != self.__topology:
+            self.metrics.count("solve.ybus_builds")
+            Ybus, Yf, Yt = makeYbus(baseMVA, bus, branch)
+            self.__topology = key
+            self.__ybus = (Ybus, Yf, Yt)
+            self.__shunts = shunts
+            return Ybus, Yf, Yt, False
+
+        Ybus, Yf, Yt = self.__ybus
+        if not np.array_equal(shunts, self.__shunts):
+            # only the shunt admittances on the diagonal changed
+            self.metrics.count("solve.ybus_updates")
+            Ybus = (Ybus + diags((shunts - self.__shunts) / baseMVA)).tocsr()
+            self.__ybus = (Ybus, Yf, Yt)
+            self.__shunts = shunts
+        else:
+            self.metrics.count("solve.ybus_hits")
+        return Ybus, Yf, Yt, True
+
+
+def _topology_key(bus: np.ndarray, branch: np.ndarray) -> str:
+    """Hash of the topology and branch parameters of an internally indexed
+    case. Out of service branches and isolated buses are removed by
+    _internal(), so the remaining branch parameters describe the whole
+    topology."""
+    return hashlib.blake2b(
+        np.ascontiguousarray(branch[:, [F_BUS, T_BUS, BR_R, BR_X, BR_B, TAP, SHIFT]]).tobytes()
+        + np.int64(bus.shape[0]).tobytes(), digest_size=16).hexdigest()
+
+
+def _internal(ppc: Dict[str, Any]) -> Tuple[Dict[str, Any], Tuple[Any, ...]]:
+    """Case with only its connected, in-service devices and consecutive bus
+    numbers, like ext2int() gives, and the row maps to convert results back
+    with _external(). Only the bus, gen and branch arrays are converted
+    (ext2int() copies every field and maps bus numbers with a dense array
+    as large as the largest bus number, which is most of the time of a DC
+    solve on large cases)."""
+    bus, gen, branch = (np.asarray(ppc[name], dtype=float) for name in ('bus', 'gen', 'branch'))
+    if branch.shape[1] < QT + 1:
+        branch = np.c_[branch, np.zeros((branch.shape[0], QT + 1 - branch.shape[1]))]
+
+    numbers = bus[:, BUS_I].astype(np.int64)
+    rows = np.argsort(numbers, kind='stable')
+    ordered = numbers[rows]
+
+    def row_of(ids: np.ndarray) -> np.ndarray:
+        ids = ids.astype(np.int64)
+        found = np.minimum(np.searchsorted(ordered, ids), len(ordered) - 1)
+        if not np.array_equal(ordered[found], ids):
+            raise ValueError('unknown bus number {}'.format(int(ids[ordered[found] != ids][0])))
+        return rows[found]
+
+    bus_on = np.flatnonzero(bus[:, BUS_TYPE] != NONE)
+    internal = np.full(len(bus), -1, dtype=np.int64)
+    internal[bus_on] = np.arange(len(bus_on))
+    gen_bus = internal[row_of(gen[:, GEN_BUS])]
+    from_bus = internal[row_of(branch[:, F_BUS])]
+    to_bus = internal[row_of(branch[:, T_BUS])]
+    gen_on = np.flatnonzero((gen[:, GEN_STATUS] > 0) & (gen_bus >= 0))
+    branch_on = np.flatnonzero((branch[:, BR_STATUS] != 0) & (from_bus >= 0) & (to_bus >= 0))
+    # generators in order of increasing bus number, as ext2int() orders them
+    gen_on = gen_on[np.argsort(gen_bus[gen_on])]
+
+    ibus = bus[bus_on]
+    ibus[:, BUS_I] = np.arange(len(bus_on))
+    igen = gen[gen_on]
+    igen[:, GEN_BUS] = gen_bus[gen_on]
+    ibranch = branch[branch_on]
+    ibranch[:, F_BUS] = from_bus[branch_on]
+    ibranch[:, T_BUS] = to_bus[branch_on]
+
+    case = {'baseMVA': ppc['baseMVA'], 'bus': ibus, 'gen': igen, 'branch': ibranch}
+    return case, (ppc, bus, gen, branch, bus_on, gen_on, branch_on)
+
+
+def _external(order: Tuple[Any, ...], bus: np.ndarray, gen: np.ndarray, branch: np.ndarray,
+              success: bool) -> Dict[str, Any]:
+    """Solved case in the original numbering, as runpf() returns it:
+    disconnected and out of service devices keep their values, except
+    for the generation and flows that are zeroed."""
+    ppc, ext_bus, ext_gen, ext_branch, bus_on, gen_on, branch_on = order
+    results = dict(ppc)
+    results.pop('order', None)
+
+    results['bus'] = ext = ext_bus.copy()
+    ext[bus_on] = bus
+    ext[bus_on, BUS_I] = ext_bus[bus_on, BUS_I]
+
+    results['gen'] = ext = ext_gen.copy()
+    ext[gen_on] = gen
+    ext[gen_on, GEN_BUS] = ext_gen[gen_on, GEN_BUS]
+    off = np.ones(len(ext), dtype=bool)
+    off[gen_on] = False
+    ext[np.ix_(off, [PG, QG])] = 0
+
+    results['branch'] = ext = ext_branch.copy()
+    ext[branch_on] = branch
+    ext[branch_on, F_BUS] = ext_branch[branch_on, F_BUS]
+    ext[branch_on, T_BUS] = ext_branch[branch_on, T_BUS]
+    off = np.ones(len(ext), dtype=bool)
+    off[branch_on] = False
+    ext[np.ix_(off, [PF, QF, PT, QT])] = 0
+
+    results['success'] = success
+    return results
+
+
+class SolutionCache:
+    """LRU cache of converged solutions, keyed by the controllable state of
+    a case: bus types, loads and shunts, generator statuses and setpoints,
+    and branch statuses and parameters. Values the solve overwrites (bus
+    voltages, reactive generation, slack generation and flows) are not part
+    of the key.
+    """
+
+    BUS_COLUMNS = [BUS_I, BUS_TYPE, PD, QD, GS, BS]
+    GEN_COLUMNS = [GEN_BUS, GEN_STATUS, VG]
+    BRANCH_COLUMNS = [F_BUS, T_BUS, BR_R, BR_X, BR_B, TAP, SHIFT, BR_STATUS]
+
+    def __init__(self, capacity: int = 32) -> None:
+        """
+        Args:
+            capacity: number of solutions kept (0 disables the cache)
+        """
+        self.capacity = capacity
+        self.metrics = metrics.get_registry()
+        self.__entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def key(self, ppc: Dict[str, Any]) -> str:
+        """Compact hash of the controllable state of a case."""
+        bus, gen, branch = ppc['bus'], ppc['gen'], ppc['branch']
+        # the slack generation is a result of the solve
+        slack = np.isin(gen[:, GEN_BUS], bus[bus[:, BUS_TYPE] == REF, BUS_I])
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(bus[:, self.BUS_COLUMNS]).tobytes())
+        digest.update(np.ascontiguousarray(gen[:, self.GEN_COLUMNS]).tobytes())
+        digest.update(np.where(slack, 0.0, gen[:, PG]).tobytes())
+        digest.update(np.ascontiguousarray(branch[:, self.BRANCH_COLUMNS]).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Copy of the solution cached for a key, None if there is none."""
+        if self.capacity <= 0:
+            return None
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.metrics.count("solve.cache_misses")
+            return None
+        self.__entries.move_to_end(key)
+        self.metrics.count("solve.cache_hits")
+        return _copy(entry)
+
+    def put(self, key: str, results: Dict[str, Any]) -> None:
+        """Cache a copy of a converged solution, evicting the least recently
+        used one when full."""
+        if self.capacity <= 0:
+            return
+        self.__entries[key] = _copy(results)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.capacity:
+            self.__entries.popitem(last=False)
+            self.metrics.count("solve.cache_evictions")
+
+    def clear(self) -> None:
+        """Drop every cached solution."""
+        self.__entries.clear()
+
+
+def _copy(ppc: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a case, with its own bus, gen and branch arrays (the arrays
+    the provider writes to)."""
+    ppc = dict(ppc)
+    for name in ('bus', 'gen', 'branch'):
+        ppc[name] = ppc[name].copy()
+    return ppc
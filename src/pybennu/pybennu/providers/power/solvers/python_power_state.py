@@ -0,0 +1,404 @@
+"""Array-backed state of a PyPower case.
+
+This module defines the CaseState class, used by the PyPower provider to
+read, write and publish its tags directly from the case's bus, gen and
+branch arrays instead of mirroring them in nested dictionaries.
+
+Tags are resolved to a (field, row) pair with maps built once from the
+case, and published values are formatted a column at a time. Fixed lists
+of tags (e.g. the columns of a load profile) can be read and written with
+one array operation per field (see reader() and writer()). After a solve
+the state is re-bound to the result arrays, which keep the same row order,
+so nothing has to be rebuilt.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from pypower.idx_brch import BR_B, BR_R, BR_STATUS, BR_X, F_BUS, RATE_A, RATE_B, RATE_C, SHIFT, T_BUS, TAP
+from pypower.idx_bus import BASE_KV, BS, BUS_I, BUS_TYPE, NONE, PD, PQ, QD, REF, VA, VM
+from pypower.idx_gen import GEN_BUS, GEN_STATUS, PG, PMAX, PMIN, QG, QMAX, QMIN, VG
+
+BOOL = 'bool'
+INT = 'int'
+FLOAT = 'float'
+
+ALERT_TAG = 'bus-alert.active'
+
+
+class _Field:
+    """A tag field of a device type, backed by a (possibly derived) column."""
+
+    __slots__ = ('kind', 'get', 'set', 'noise', 'vector')
+
+    def __init__(self, kind: str, get: Callable[[Any], Any],
+                 set: Optional[Callable[[Any, Any], None]] = None, noise: bool = False,
+                 vector: bool = True) -> None:
+        self.kind = kind
+        self.get = get        # get(rows) -> value(s) of a row index, slice or index array
+        self.set = set        # set(rows, values), None for read-only fields
+        self.noise = noise    # noise is added to published values
+        self.vector = vector  # set() accepts index and value arrays
+
+
+class _Table:
+    """Device names of one type and their fields."""
+
+    def __init__(self, names: List[str]) -> None:
+        self.names = names
+        self.fields: Dict[str, _Field] = {}
+
+
+class CaseState:
+    """
+    Tags of a PyPower case (ppc) dictionary.
+
+    Device names follow the PyPower provider's historical naming:
+    bus-<number>, load-1_bus-<number>, shunt-1_bus-<number>,
+    generator-<n>_bus-<number> and branch-<n>_<from>-<to>. Loads and shunts
+    are the buses with a non-zero demand or shunt susceptance in the case.
+
+    Setting a load or shunt inactive zeroes its injection in the case and
+    restores it when set active again. Bus gen_mw and gen_mvar (sums of the
+    bus's generators) and device bus numbers are read-only.
+    """
+
+    def __init__(self, ppc: Dict[str, Any]) -> None:
+        self.alert = False
+        self.__rng = np.random.default_rng()
+        self.bind(ppc)
+
+        bus = self.bus
+        numbers = bus[:, BUS_I].astype(int)
+        self.__bus_row = {int(number): row for row, number in enumerate(numbers)}
+        self.__initial_type = bus[:, BUS_TYPE].copy()
+        self.__slack = bus[:, BUS_TYPE] == REF
+        self.__gen_bus = np.array([self.__bus_row[int(number)] for number in self.gen[:, GEN_BUS]],
+                                  dtype=int)
+
+        self.__load_rows = np.flatnonzero((bus[:, PD] != 0) | (bus[:, QD] != 0))
+        self.__load_mw = bus[self.__load_rows, PD].copy()
+        self.__load_mvar = bus[self.__load_rows, QD].copy()
+        self.__load_active = np.ones(len(self.__load_rows), dtype=bool)
+        self.__load_of_bus = np.full(len(bus), -1, dtype=int)
+        self.__load_of_bus[self.__load_rows] = np.arange(len(self.__load_rows))
+
+        self.__shunt_rows = np.flatnonzero(bus[:, BS] != 0)
+        self.__shunt_nominal = bus[self.__shunt_rows, BS].copy()
+        self.__shunt_active = np.ones(len(self.__shunt_rows), dtype=bool)
+
+        self.tables = {
+            'bus': self.__bus_table(['bus-{}'.format(n) for n in numbers]),
+            'load': self.__load_table(['load-1_bus-{}'.format(numbers[row]) for row in self.__load_rows]),
+            'shunt': self.__shunt_table(['shunt-1_bus-{}'.format(numbers[row]) for row in self.__shunt_rows]),
+            'gen': self.__gen_table(self.__numbered('generator-{}_bus-{}', self.gen[:, GEN_BUS])),
+            'branch': self.__branch_table(self.__numbered(
+                'branch-{}_{}-{}', self.branch[:, F_BUS], self.branch[:, T_BUS])),
+        }
+
+        self.__tags: Dict[str, Tuple[_Field, int]] = {}
+        self.__prefixes: Dict[Tuple[str, str], List[str]] = {}
+        tags = [ALERT_TAG]
+        for table_name, table in self.tables.items():
+            for field_name, field in table.fields.items():
+                prefixes = []
+                for row, name in enumerate(table.names):
+                    tag = name + '.' + field_name
+                    self.__tags[tag] = (field, row)
+                    prefixes.append(tag + ':')
+                self.__prefixes[table_name, field_name] = prefixes
+            for name in table.names:
+                tags.extend(name + '.' + field_name for field_name in table.fields)
+        self.__tag_list = tags
+
+    def bind(self, ppc: Dict[str, Any]) -> None:
+        """Use the arrays of a case with the same devices, e.g. solve results."""
+        self.bus = ppc['bus']
+        self.gen = ppc['gen']
+        self.branch = ppc['branch']
+
+    # ===== tag access =====
+
+    def tags(self) -> List[str]:
+        """All tag names, grouped by device."""
+        return self.__tag_list
+
+    def get(self, tag: str) -> Any:
+        """Current value of a tag.
+
+        Raises:
+            KeyError: unknown tag
+        """
+        if tag == ALERT_TAG:
+            return self.alert
+        field, row = self.__tags[tag]
+        return _scalar(field.kind, field.get(row))
+
+    def set(self, tag: str, raw: str) -> None:
+        """Write a text value ('true', 'false' or a number) to a tag.
+
+        Raises:
+            KeyError: unknown tag
+            ValueError: the tag is read-only or the value is invalid for it
+        """
+        field, row, value = self.__parse(tag, raw)
+        field.set(row, value)
+
+    def check(self, tag: str, raw: str) -> None:
+        """Raise the error set() would for a write, without writing."""
+        self.__parse(tag, raw)
+
+    def __parse(self, tag: str, raw: str) -> Tuple[_Field, int, Any]:
+        if tag == ALERT_TAG:
+            raise ValueError('Tag is read-only: {}'.format(tag))
+        field, row = self.__tags[tag]
+        if field.set is None:
+            raise ValueError('Tag is read-only: {}'.format(tag))
+        if raw in ('true', 'false'):
+            if field.kind != BOOL:
+                raise ValueError('Invalid value for tag: {}'.format(tag))
+            value: Any = raw == 'true'
+        else:
+            value = float(raw)
+            if field.kind == BOOL:
+                value = bool(value)
+        return field, row, value
+
+    def reader(self, tags: List[str]) -> Callable[[], np.ndarray]:
+        """Function returning the current values of a fixed list of tags as
+        an array (in tag order), reading each field's rows at once.
+
+        Raises:
+            KeyError: unknown tag
+        """
+        groups = self.__group(tags)
+        count = len(tags)
+
+        def read() -> np.ndarray:
+            values = np.empty(count)
+            for field, rows, positions in groups:
+                values[positions] = field.get(rows)
+            return values
+        return read
+
+    def writer(self, tags: List[str]) -> Callable[[np.ndarray], None]:
+        """Function writing an array of values (in tag order) to a fixed list
+        of tags, writing each field's rows at once.
+
+        Raises:
+            KeyError: unknown tag
+            ValueError: a tag is read-only
+        """
+        groups = self.__group(tags)
+        for tag in tags:
+            if self.__tags[tag][0].set is None:
+                raise ValueError('Tag is read-only: {}'.format(tag))
+
+        def write(values: np.ndarray) -> None:
+            for field, rows, positions in groups:
+                if field.vector:
+                    field.set(rows, values[positions])
+                else:
+                    for row, value in zip(rows.tolist(), values[positions].tolist()):
+                        field.set(row, value)
+        return write
+
+    def __group(self, tags: List[str]) -> List[Tuple[_Field, np.ndarray, np.ndarray]]:
+        """Tags grouped by field: (field, rows, positions in the tag list)."""
+        groups: Dict[int, Tuple[_Field, List[int], List[int]]] = {}
+        for position, tag in enumerate(tags):
+            field, row = self.__tags[tag]
+            group = groups.setdefault(id(field), (field, [], []))
+            group[1].append(row)
+            group[2].append(position)
+        return [(field, np.array(rows, dtype=int), np.array(positions, dtype=int))
+                for field, rows, positions in groups.values()]
+
+    def values(self, noise: bool = False) -> Dict[str, Any]:
+        """Current value of every tag, optionally with noise added."""
+        values: Dict[str, Any] = {ALERT_TAG: self.alert}
+        for prefixes, field, column in self.__columns(noise):
+            values.update(zip((prefix[:-1] for prefix in prefixes),
+                              (_scalar(field.kind, value) for value in column)))
+        return values
+
+    def format(self, noise: bool = False) -> str:
+        """Current value of every tag as a text publish message."""
+        parts = ['{}:{},'.format(ALERT_TAG, 'true' if self.alert else 'false')]
+        for prefixes, field, column in self.__columns(noise):
+            if field.kind == BOOL:
+                strings = ['true' if value else 'false' for value in column]
+            elif field.kind == INT:
+                strings = [str(int(value)) for value in column]
+            else:
+                strings = [str(value) for value in column]
+            parts.extend([prefix + value + ',' for prefix, value in zip(prefixes, strings)])
+        return ''.join(parts)
+
+    def __columns(self, noise: bool):
+        everything = slice(None)
+        for (table_name, field_name), prefixes in self.__prefixes.items():
+            if not prefixes:
+                continue
+            field = self.tables[table_name].fields[field_name]
+            column = np.asarray(field.get(everything))
+            if noise and field.noise:
+                column = self.__noisy(column)
+            yield prefixes, field, column.tolist()
+
+    def __noisy(self, column: np.ndarray) -> np.ndarray:
+        noisy = column * self.__rng.uniform(0.99, 1.01, len(column))
+        zero = column == 0
+        noisy[zero] = self.__rng.uniform(-0.1, 0.1, int(np.count_nonzero(zero)))
+        return noisy
+
+    # ===== tables =====
+
+    @staticmethod
+    def __numbered(template: str, *columns: np.ndarray) -> List[str]:
+        """Names numbered per bus (or bus pair), in row order."""
+        counts: Dict[Tuple[int, ...], int] = {}
+        names = []
+        for key in zip(*(column.astype(int).tolist() for column in columns)):
+            counts[key] = counts.get(key, 0) + 1
+            names.append(template.format(counts[key], *key))
+        return names
+
+    def __column(self, array: str, col: int, rows: Optional[np.ndarray] = None) -> Callable[[Any], Any]:
+        if rows is None:
+            return lambda r: getattr(self, array)[r, col]
+        return lambda r: getattr(self, array)[rows[r], col]
+
+    def __setter(self, array: str, *cols: int) -> Callable[[int, Any], None]:
+        def set(row: int, value: Any) -> None:
+            data = getattr(self, array)
+            for col in cols:
+                data[row, col] = value
+        return set
+
+    def __bus_table(self, names: List[str]) -> _Table:
+        table = _Table(names)
+        f = table.fields
+        f['voltage'] = _Field(FLOAT, self.__column('bus', VM), self.__setter('bus', VM), noise=True)
+        f['angle'] = _Field(FLOAT, self.__column('bus', VA), self.__setter('bus', VA), noise=True)
+        f['gen_mw'] = _Field(FLOAT, lambda r: self.__bus_generation(PG)[r], noise=True)
+        f['gen_mvar'] = _Field(FLOAT, lambda r: self.__bus_generation(QG)[r], noise=True)
+        f['load_mw'] = _Field(FLOAT, self.__column('bus', PD), self.__set_bus_load(PD), noise=True)
+        f['load_mvar'] = _Field(FLOAT, self.__column('bus', QD), self.__set_bus_load(QD), noise=True)
+        f['shunt_mvar'] = _Field(FLOAT, self.__column('bus', BS), self.__setter('bus', BS), noise=True)
+        f['base_kv'] = _Field(FLOAT, self.__column('bus', BASE_KV), self.__setter('bus', BASE_KV))
+        f['active'] = _Field(BOOL, lambda r: self.bus[r, BUS_TYPE] != NONE, self.__set_bus_active,
+                             vector=False)
+        f['slack'] = _Field(BOOL, lambda r: self.__slack[r], self.__set_bus_slack, vector=False)
+        return table
+
+    def __bus_generation(self, col: int) -> np.ndarray:
+        return np.bincount(self.__gen_bus, weights=self.gen[:, col], minlength=len(self.bus))
+
+    def __bus_type(self, row: int, active: bool, slack: bool) -> float:
+        if not active:
+            return NONE
+        if slack:
+            return REF
+        # keep PV buses PV, buses that started out slack or isolated become PQ
+        original = self.__initial_type[row]
+        return PQ if original in (REF, NONE) else original
+
+    def __set_bus_active(self, row: int, value: bool) -> None:
+        self.bus[row, BUS_TYPE] = self.__bus_type(row, value, self.__slack[row])
+
+    def __set_bus_slack(self, row: int, value: bool) -> None:
+        self.__slack[row] = value
+        self.bus[row, BUS_TYPE] = self.__bus_type(row, self.bus[row, BUS_TYPE] != NONE, value)
+
+    def __set_bus_load(self, col: int) -> Callable[[Any, Any], None]:
+        def set(rows: Any, values: Any) -> None:
+            rows = np.atleast_1d(rows)
+            values = np.broadcast_to(values, rows.shape)
+            loads = self.__load_of_bus[rows]
+            direct = loads < 0
+            self.bus[rows[direct], col] = values[direct]
+            self.__set_load(col, loads[~direct], values[~direct])
+        return set
+
+    def __set_load(self, col: int, loads: Any, values: Any) -> None:
+        nominal = self.__load_mw if col == PD else self.__load_mvar
+        nominal[loads] = values
+        self.bus[self.__load_rows[loads], col] = np.where(self.__load_active[loads], values, 0.0)
+
+    def __load_table(self, names: List[str]) -> _Table:
+        rows = self.__load_rows
+        table = _Table(names)
+        f = table.fields
+        f['bus'] = _Field(INT, self.__column('bus', BUS_I, rows))
+        f['mw'] = _Field(FLOAT, lambda r: self.__load_mw[r],
+                         lambda r, v: self.__set_load(PD, r, v), noise=True)
+        f['mvar'] = _Field(FLOAT, lambda r: self.__load_mvar[r],
+                           lambda r, v: self.__set_load(QD, r, v), noise=True)
+        f['active'] = _Field(BOOL, lambda r: self.__load_active[r], self.__set_load_active)
+        return table
+
+    def __set_load_active(self, loads: Any, values: Any) -> None:
+        self.__load_active[loads] = values
+        active = self.__load_active[loads]
+        rows = self.__load_rows[loads]
+        self.bus[rows, PD] = np.where(active, self.__load_mw[loads], 0.0)
+        self.bus[rows, QD] = np.where(active, self.__load_mvar[loads], 0.0)
+
+    def __shunt_table(self, names: List[str]) -> _Table:
+        rows = self.__shunt_rows
+        table = _Table(names)
+        f = table.fields
+        f['bus'] = _Field(INT, self.__column('bus', BUS_I, rows))
+        f['actual_mvar'] = _Field(FLOAT, self.__column('bus', BS, rows),
+                                  lambda r, v: self.bus.__setitem__((rows[r], BS), v), noise=True)
+        f['nominal_mvar'] = _Field(FLOAT, lambda r: self.__shunt_nominal[r],
+                                   self.__set_shunt_nominal, noise=True)
+        f['active'] = _Field(BOOL, lambda r: self.__shunt_active[r], self.__set_shunt_active)
+        return table
+
+    def __set_shunt_nominal(self, shunts: Any, values: Any) -> None:
+        self.__shunt_nominal[shunts] = values
+        rows = self.__shunt_rows[shunts]
+        self.bus[rows, BS] = np.where(self.__shunt_active[shunts], values, self.bus[rows, BS])
+
+    def __set_shunt_active(self, shunts: Any, values: Any) -> None:
+        self.__shunt_active[shunts] = values
+        self.bus[self.__shunt_rows[shunts], BS] = np.where(
+            self.__shunt_active[shunts], self.__shunt_nominal[shunts], 0.0)
+
+    def __gen_table(self, names: List[str]) -> _Table:
+        table = _Table(names)
+        f = table.fields
+        f['mw'] = _Field(FLOAT, self.__column('gen', PG), self.__setter('gen', PG), noise=True)
+        f['mvar'] = _Field(FLOAT, self.__column('gen', QG), self.__setter('gen', QG), noise=True)
+        f['mw_max'] = _Field(FLOAT, self.__column('gen', PMAX), self.__setter('gen', PMAX))
+        f['mw_min'] = _Field(FLOAT, self.__column('gen', PMIN), self.__setter('gen', PMIN))
+        f['mvar_max'] = _Field(FLOAT, self.__column('gen', QMAX), self.__setter('gen', QMAX))
+        f['mvar_min'] = _Field(FLOAT, self.__column('gen', QMIN), self.__setter('gen', QMIN))
+        f['voltage'] = _Field(FLOAT, self.__column('gen', VG), self.__setter('gen', VG), noise=True)
+        f['active'] = _Field(BOOL, lambda r: self.gen[r, GEN_STATUS] > 0, self.__setter('gen', GEN_STATUS))
+        return table
+
+    def __branch_table(self, names: List[str]) -> _Table:
+        table = _Table(names)
+        f = table.fields
+        f['source'] = _Field(INT, self.__column('branch', F_BUS))
+        f['target'] = _Field(INT, self.__column('branch', T_BUS))
+        f['resistance'] = _Field(FLOAT, self.__column('branch', BR_R), self.__setter('branch', BR_R))
+        f['reactance'] = _Field(FLOAT, self.__column('branch', BR_X), self.__setter('branch', BR_X))
+        f['charging'] = _Field(FLOAT, self.__column('branch', BR_B), self.__setter('branch', BR_B))
+        f['mva_max'] = _Field(FLOAT, self.__column('branch', RATE_A),
+                              self.__setter('branch', RATE_A, RATE_B, RATE_C))
+        f['turns_ratio'] = _Field(FLOAT, self.__column('branch', TAP), self.__setter('branch', TAP))
+        f['phase_angle'] = _Field(FLOAT, self.__column('branch', SHIFT), self.__setter('branch', SHIFT))
+        f['active'] = _Field(BOOL, lambda r: self.branch[r, BR_STATUS] != 0, self.__setter('branch', BR_STATUS))
+        return table
+
+
+def _scalar(kind: str, value: Any) -> Any:
+    if kind == BOOL:
+        return bool(value)
+    if kind == INT:
+        return int(value)
+    return float(value)
@@ -0,0 +1,295 @@
+"""Quasi-static time series for the PyPower provider.
+
+This module defines the Profile class, time series of tag values read from
+CSV or NumPy files, and the TimeSeries class, which steps a PyPower
+provider through a profile on a real-time or accelerated clock, solving
+each step warm-started from the previous one.
+
+A profile has a time column (seconds from the start of the profile) and one
+column per tag, e.g.:
+
+    time,load-1_bus-2.mw,load-1_bus-2.mvar,generator-1_bus-10.mw
+    0,20.0,9.0,450.0
+    900,21.5,9.4,430.0
+
+Columns named 'scale:<glob pattern>' hold multipliers of the initial
+values of every writable numeric tag matching the pattern instead, e.g.
+'scale:load-*' scales the mw and mvar of every load with a single column.
+A step's values are written with one array operation per field (see
+CaseState.writer()).
+
+NumPy profiles are .npz files with 'time', 'tags' and 'values' (steps x
+tags) arrays, or .npy files holding a structured array with a 'time' field
+and one field per tag.
+
+Profiles can also be solved offline, as fast as possible, to pre-compute
+the trajectory of some tags:
+
+    pybennu-timeseries case118.py day.csv --record 'bus-*.voltage' -o day.npz
+"""
+
+import argparse
+import csv
+import threading
+import time
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from pypower.api import loadcase
+
+import pybennu.distributed.metrics as metrics
+from pybennu.providers.power.solvers.python_power_engine import AC, MODES, SolveEngine
+from pybennu.providers.power.solvers.python_power_state import FLOAT, CaseState
+
+SCALE = 'scale:'
+
+
+class Profile:
+    """Tag values at increasing times (seconds from the start)."""
+
+    def __init__(self, times: Sequence[float], tags: Sequence[str], values: Any) -> None:
+        self.times = np.asarray(times, dtype=float)
+        self.tags = list(tags)
+        self.values = np.asarray(values, dtype=float).reshape(len(self.times), len(self.tags))
+        if len(self.times) == 0:
+            raise ValueError('Profile has no steps')
+        if np.any(np.diff(self.times) <= 0):
+            raise ValueError('Profile times must be increasing')
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1] - self.times[0])
+
+    @classmethod
+    def load(cls, path: str) -> 'Profile':
+        """Read a profile from a .csv, .npz or .npy file."""
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                return cls(data['time'], [str(tag) for tag in data['tags']], data['values'])
+        if path.endswith('.npy'):
+            data = np.load(path)
+            if data.dtype.names is None or 'time' not in data.dtype.names:
+                raise ValueError("{}: expected a structured array with a 'time' field".format(path))
+            tags = [name for name in data.dtype.names if name != 'time']
+            return cls(data['time'], tags, np.column_stack([data[tag] for tag in tags]))
+
+        with open(path, newline='') as f:
+            rows = [row for row in csv.reader(f) if row and not row[0].startswith('#')]
+        if not rows or rows[0][0].strip() != 'time':
+            raise ValueError("{}: the first column must be 'time'".format(path))
+        tags = [tag.strip() for tag in rows[0][1:]]
+        data = np.array([[float(value) for value in row] for row in rows[1:]])
+        return cls(data[:, 0], tags, data[:, 1:])
+
+    @classmethod
+    def combine(cls, profiles: Sequence['Profile']) -> 'Profile':
+        """A profile with the steps of all the given profiles. Each profile's
+        values are held from one of its steps to the next, and before its
+        first step its first values are used."""
+        if len(profiles) == 1:
+            return profiles[0]
+        times = np.unique(np.concatenate([profile.times for profile in profiles]))
+        tags: List[str] = []
+        columns = []
+        for profile in profiles:
+            steps = np.clip(np.searchsorted(profile.times, times, side='right') - 1, 0, None)
+            tags.extend(profile.tags)
+            columns.append(profile.values[steps])
+        return cls(times, tags, np.hstack(columns))
+
+
+class _Plan:
+    """A profile resolved against the tags of a case: the tags it writes and
+    how to compute their values at a step."""
+
+    def __init__(self, profile: Profile, state: CaseState) -> None:
+        tags: List[str] = []
+        absolute: List[int] = []
+        scaled: List[str] = []
+        owners: List[int] = []
+        writable = _writable_tags(state)
+        for column, tag in enumerate(profile.tags):
+            if tag.startswith(SCALE):
+                matches = [name for name in state.tags() if name in writable
+                           and fnmatchcase(name, tag[len(SCALE):])]
+                if not matches:
+                    raise ValueError('Profile column matches no tags: {}'.format(tag))
+                scaled.extend(matches)
+                owners.extend([column] * len(matches))
+            else:
+                tags.append(tag)
+                absolute.append(column)
+
+        # values are written in this order, scaled tags after the others
+        self.tags = tags + scaled
+        self.write = state.writer(self.tags)
+        self.__absolute = np.array(absolute, dtype=int)
+        self.__owners = np.array(owners, dtype=int)
+        self.__base = state.reader(scaled)() if scaled else np.empty(0)
+        self.__profile = profile
+
+    def values(self, step: int) -> np.ndarray:
+        row = self.__profile.values[step]
+        return np.concatenate([row[self.__absolute], self.__base * row[self.__owners]])
+
+
+def _writable_tags(state: CaseState) -> Set[str]:
+    """Tags a scale column can apply to: writable numeric tags."""
+    writable = set()
+    for table in state.tables.values():
+        for field_name, field in table.fields.items():
+            if field.set is not None and field.kind == FLOAT:
+                writable.update(name + '.' + field_name for name in table.names)
+    return writable
+
+
+class TimeSeries:
+    """Steps a PyPower provider through a profile.
+
+    Each step's values are written to the provider's case and solved (see
+    PyPower.apply()), with the step time as the simulation time of the new
+    state. The clock runs speed times faster than real time; with a speed of
+    0 steps are solved back to back, as fast as possible.
+    """
+
+    def __init__(self, provider: Any, profile: Profile, speed: float = 1.0,
+                 loop: bool = False) -> None:
+        """
+        Args:
+            provider: PyPower provider
+            profile: profile to apply (see Profile.combine() for several)
+            speed: simulated seconds per real second (0 = as fast as possible)
+            loop: start over from the first step after the last one
+        """
+        self.provider = provider
+        self.profile = profile
+        self.speed = speed
+        self.loop = loop
+        self.step = 0              # index of the last step applied
+        self.metrics = metrics.get_registry()
+        self.__plan = _Plan(profile, provider.state)
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Run the time series in a background thread."""
+        self.__thread = threading.Thread(target=self.run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """Stop after the current step."""
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def run(self) -> None:
+        """Apply every step of the profile (forever if looping)."""
+        times = self.profile.times - self.profile.times[0]
+        # a looping profile starts over one typical step after its last one
+        period = times[-1] + (float(np.median(np.diff(times))) if len(times) > 1 else 1.0)
+        offset = 0.0
+        start = time.monotonic()
+        while not self.__stop.is_set():
+            for step, at in enumerate(times):
+                if self.speed > 0:
+                    delay = start + (offset + at) / self.speed - time.monotonic()
+                    if delay > 0 and self.__stop.wait(delay):
+                        return
+                    if delay < 0:
+                        self.metrics.observe("timeseries.lag", -delay)
+                elif self.__stop.is_set():
+                    return
+                self.step = step
+                self.provider.apply(self.__plan.write, self.__plan.values(step),
+                                    float(self.profile.times[0] + offset + at))
+                self.metrics.count("timeseries.steps")
+            if not self.loop:
+                return
+            offset += period
+
+
+def precompute(ppc: Dict[str, Any], profile: Profile, record: Sequence[str],
+               engine: Optional[SolveEngine] = None,
+               progress: Optional[Callable[[int], None]] = None
+               ) -> Tuple[np.ndarray, List[str], np.ndarray, np.ndarray]:
+    """Solve every step of a profile as fast as possible, without a provider.
+
+    Args:
+        ppc: case, which is not modified
+        profile: profile to apply
+        record: glob patterns of the tags to record at each step
+        engine: engine to solve with (a new one by default)
+        progress: called with the index of each step solved
+
+    Returns:
+        The step times, the recorded tags, their values (steps x tags, NaN
+        where a step did not converge) and whether each step converged.
+    """
+    engine = engine or SolveEngine()
+    ppc = dict(ppc)
+    for name in ('bus', 'gen', 'branch'):
+        ppc[name] = ppc[name].copy()
+    state = CaseState(ppc)
+    plan = _Plan(profile, state)
+    tags = [tag for tag in state.tags() if any(fnmatchcase(tag, pattern) for pattern in record)]
+    if not tags:
+        raise ValueError('No tags match {}'.format(', '.join(record)))
+    read = state.reader(tags)
+
+    values = np.full((len(profile), len(tags)), np.nan)
+    converged = np.zeros(len(profile), dtype=bool)
+    for step in range(len(profile)):
+        plan.write(plan.values(step))
+        results, success = engine.solve(ppc)
+        if success:
+            ppc = results
+            state.bind(results)
+            values[step] = read()
+            converged[step] = True
+        if progress:
+            progress(step)
+    return profile.times, tags, values, converged
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Solve a PyPower case through load/generation profiles as fast as possible")
+    parser.add_argument('case', help='PyPower case file')
+    parser.add_argument('profiles', nargs='+', help='profile files (.csv, .npz or .npy)')
+    parser.add_argument('--record', action='append', default=[],
+                        help="glob pattern of the tags to record (repeatable, default: 'bus-*.voltage')")
+    parser.add_argument('-o', '--output', help='write the trajectories to a .csv or .npz file')
+    parser.add_argument('--mode', choices=MODES, default=AC,
+                        help='power flow formulation (default: ac)')
+    args = parser.parse_args()
+
+    profile = Profile.combine([Profile.load(path) for path in args.profiles])
+    engine = SolveEngine(args.mode)
+    start = time.perf_counter()
+    times, tags, values, converged = precompute(
+        loadcase(args.case), profile, args.record or ['bus-*.voltage'], engine)
+    elapsed = time.perf_counter() - start
+
+    print('{} steps ({:.0f} s of profile) solved in {:.2f} s, {:.0f}x real time, {} failed'.format(
+        len(times), profile.duration, elapsed,
+        profile.duration / elapsed if elapsed > 0 else float('inf'),
+        int(np.count_nonzero(~converged))))
+    if not args.output:
+        return
+    if args.output.endswith('.npz'):
+        np.savez(args.output, time=times, tags=np.array(tags), values=values, converged=converged)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['time'] + tags)
+            for at, row in zip(times.tolist(), values.tolist()):
+                writer.writerow([at] + row)
+
+
+if __name__ == '__main__':
+    main()
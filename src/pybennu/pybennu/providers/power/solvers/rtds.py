@@ -349,6 +349,9 @@ class RTDS(Provider):
                             self.current_values[f"{pmu.name}_ANALOG_{i+1}.real"] = analog_value
                             self.current_values[f"{pmu.name}_ANALOG_{i+1}.angle"] = analog_value
 
+                    # values from the same PMU frame share a state version
+                    self.state_changed(sim_time=frame["time"])
+
                 # Create CSV writer if it doesn't exist
                 if self.conf.csv.enabled and pmu.csv_writer is None:
                     # Build the CSV header
@@ -483,6 +486,7 @@ class RTDS(Provider):
         # This is done AFTER sending value to ensure the right values are always available
         with self.__current_values_lock:
             self.current_values.update(self.gtnet.state)
+            self.state_changed()
 
         msg = f"ACK=Wrote {len(tags)} tags to RTDS via GTNET-SKT"
 
@@ -506,13 +510,14 @@ class RTDS(Provider):
         while True:
             # mutex to prevent threads from writing while we're reading
             with self.__current_values_lock:
+                version = self.version()
                 tags = [
                     f"{tag}:{self._serialize_value(tag, value)}"
                     for tag, value in self.current_values.items()
                 ]
 
             msg = "Write={" + ",".join(tags) + "}"
-            self.publish(msg)
+            self.publish(msg, version)
 
             # If publish_rate is not positive (0), don't sleep and go as fast as possible
             # Otherwise (if it's non-zero), log the points, and sleep like usual
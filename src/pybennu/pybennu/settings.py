@@ -6,7 +6,7 @@ Full Documentation: https://sandialabs.github.io/sceptre-docs/13-providers.html
 
 import argparse
 import json
-from typing import List, Literal, Tuple, Type, Union
+from typing import List, Literal, Optional, Tuple, Type, Union
 from ipaddress import IPv4Address
 from pathlib import Path
 
@@ -373,6 +373,73 @@ class ElasticSettings(BaseModel):
         return str(HttpUrl(v))
 
 
+class TransportSettings(BaseModel):
+    """
+    ZMQ transport options shared by all of the provider's sockets. Options
+    left unset use the ZMQ defaults.
+    """
+    io_threads: int = Field(
+        default=1,
+        gt=0,
+        title="I/O Threads",
+        description="Number of ZMQ I/O threads shared by all sockets in the process.",
+    )
+    sndhwm: Optional[int] = Field(
+        default=None,
+        ge=0,
+        title="Send High Water Mark",
+        description="Maximum number of queued outgoing messages per socket (0 = unlimited).",
+    )
+    rcvhwm: Optional[int] = Field(
+        default=None,
+        ge=0,
+        title="Receive High Water Mark",
+        description="Maximum number of queued incoming messages per socket (0 = unlimited).",
+    )
+    linger: Optional[int] = Field(
+        default=None,
+        ge=-1,
+        description="Milliseconds to keep trying to send queued messages after a socket is closed (-1 = forever).",
+    )
+    sndbuf: Optional[int] = Field(
+        default=None,
+        ge=0,
+        title="Send Buffer Size",
+        description="Kernel send buffer size in bytes.",
+    )
+    rcvbuf: Optional[int] = Field(
+        default=None,
+        ge=0,
+        title="Receive Buffer Size",
+        description="Kernel receive buffer size in bytes. Raise this if subscribers drop publish datagrams.",
+    )
+    tcp_keepalive: Optional[int] = Field(
+        default=None,
+        ge=-1,
+        le=1,
+        title="TCP Keepalive",
+        description="1 to enable TCP keepalive on TCP sockets, 0 to disable it.",
+    )
+    tcp_keepalive_idle: Optional[int] = Field(
+        default=None,
+        gt=0,
+        title="TCP Keepalive Idle",
+        description="Seconds a connection is idle before keepalive probes are sent.",
+    )
+    tcp_keepalive_intvl: Optional[int] = Field(
+        default=None,
+        gt=0,
+        title="TCP Keepalive Interval",
+        description="Seconds between keepalive probes.",
+    )
+    tcp_keepalive_cnt: Optional[int] = Field(
+        default=None,
+        gt=0,
+        title="TCP Keepalive Count",
+        description="Number of unanswered keepalive probes before the connection is dropped.",
+    )
+
+
 class PybennuSettings(BaseSettings):
     """
     Configuration settings for a Pybennu Provider.
@@ -456,6 +523,9 @@ class PybennuSettings(BaseSettings):
     gtnet_skt: GtnetSktSettings = GtnetSktSettings()
     siren: SirenSettings = SirenSettings()
 
+    # ZMQ socket options
+    transport: TransportSettings = TransportSettings()
+
     # Configuration of the Pydantic model
     model_config = SettingsConfigDict(
         # Environment variables start with this, e.g.
@@ -13,7 +13,7 @@ import sys
 import threading
 
 from pybennu.distributed.client import Client
-from pybennu.distributed.subscriber import Subscriber
+from pybennu.distributed.subscriber import Subscriber, SubscriberCache
 import pybennu.distributed.swig._Endpoint as E
 
 from time import sleep
@@ -160,6 +160,9 @@ class siren(Subscriber, Client):
         Client.__init__(self, server_endpoint)
 
         # Overwrite the subscriber's subscription handler with siren's handler.
+        # The cache parses each message once and only keeps the tags that are
+        # sent to the hardware.
+        self.cache = SubscriberCache(self.device_config.to_device)
         self.subscription_handler = self._subscription_handler
 
         self.__lock = threading.Lock()
@@ -221,21 +224,9 @@ class siren(Subscriber, Client):
         Args:
             message (str): published zmq message as a string
         """
+        values = self.cache.update_text(message)
         with self.__lock:
-            points = message.split(',')
-            
-            for point in points:
-                split = point.split(':')
-
-                # Point is empty, cutoff, or malformed
-                if len(split) < 2 or any([len(s) == 0 for s in split]):
-                    continue
-                    
-                tag = split[0]
-                value = split[1]
-
-                if tag not in self.device_config.to_device:
-                    continue
+            for tag, value in values.items():
                 label = self.device_config.to_device[tag]
 
                 # Here is a default range for the sensor data for the case that the configs do not
@@ -250,15 +241,15 @@ class siren(Subscriber, Client):
                 # Find an approprate scaled voltage to output
                 #voltage = virtualsensor(data, sensor_range[0], sensor_range[1], 0, 3.2)
 
-                if value.lower() == 'false':
-                    value = False
+                if isinstance(value, str) and value.lower() in ('true', 'false'):
+                    value = value.lower() == 'true'
+                if isinstance(value, bool):
                     field = 'status'
-                elif value.lower() == 'true':
-                    value = True
-                    field = 'status'
-                else:
-                    value = float(value)
+                elif isinstance(value, float):
                     field = 'value'
+                else:
+                    # Point is malformed
+                    continue
                 self.device.logger.log(LEVELS['debug'], f'TO HARDWARE {tag}:{value} with field:{field}')
                 self._to_hardware(field, label, value)
 
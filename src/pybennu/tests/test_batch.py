@@ -0,0 +1,57 @@
+"""Tests for pybennu.distributed.batch."""
+
+import logging
+
+from pypower.case9 import case9
+
+import pybennu.distributed.metrics as metrics
+from pybennu.distributed.batch import WriteBatcher
+from pybennu.providers.power.solvers.python_power import PyPower
+
+
+def counter(name):
+    return metrics.get_registry().snapshot(name).get(name, 0)
+
+
+def test_reject_invalid_write_before_queuing():
+    metrics.get_registry().reset()
+    writes = []
+
+    def write(tags):
+        writes.append(tags)
+        return 'ACK=Success'
+
+    def validate(tags):
+        unknown = [tag for tag in tags if not tag.startswith('bus-')]
+        return 'ERR=Tag not found: {}'.format(unknown[0]) if unknown else None
+
+    batcher = WriteBatcher(write, validate=validate)
+
+    assert batcher.submit({'bus-1.active': 'false'}).startswith('ACK=')
+    assert batcher.submit({'typo-1.active': 'true'}) == 'ERR=Tag not found: typo-1.active'
+    assert batcher.flush() == 'ACK=Success'
+    assert writes == [{'bus-1.active': 'false'}]
+    assert counter('writes.rejected') == 1
+
+
+def test_log_failed_batched_write(caplog):
+    metrics.get_registry().reset()
+    batcher = WriteBatcher(lambda tags: 'ERR=Solve failed')
+
+    batcher.submit({'bus-1.active': 'false'})
+    with caplog.at_level(logging.ERROR, logger='pybennu.distributed.batch'):
+        assert batcher.flush() == 'ERR=Solve failed'
+
+    assert 'Batched write of 1 tags failed: ERR=Solve failed' in caplog.text
+    assert counter('writes.errors') == 1
+
+
+def test_pypower_validate_write(tmp_path):
+    provider = PyPower('tcp://127.0.0.1:0', 'shm://' + str(tmp_path / 'ring'), case9())
+
+    assert provider.validate_write({'bus-5.load_mw': '100'}) is None
+    assert provider.validate_write({'bus-50.load_mw': '100'}) == \
+        'ERR=Tag not found: bus-50.load_mw'
+    assert provider.validate_write({'bus-5.load_mw': 'on'}).startswith('ERR=')
+    assert provider.validate_write({'bus-alert.active': 'true'}) == \
+        'ERR=Tag is read-only: bus-alert.active'
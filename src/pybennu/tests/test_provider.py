@@ -0,0 +1,109 @@
+"""Tests for pybennu.distributed.provider.
+
+Providers are served by a WorkerServer on a local TCP port and publish to
+a shared-memory ring, so no multicast (or draft ZMQ RADIO socket) is
+needed.
+"""
+
+import socket
+import threading
+
+import pytest
+from pypower.case9 import case9
+
+from pybennu.distributed.client import ConnectionPool
+from pybennu.distributed.provider import Provider
+from pybennu.providers.power.solvers.python_power import PyPower
+
+
+def free_endpoint():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return 'tcp://127.0.0.1:{}'.format(sock.getsockname()[1])
+
+
+def serve(provider):
+    provider.set_server_workers(2)
+    threading.Thread(target=provider.run, daemon=True).start()
+
+
+class SlowProvider(Provider):
+    """Swaps its values in whole once a write, held until release is set,
+    is done."""
+
+    def __init__(self, server_endpoint, publish_endpoint):
+        Provider.__init__(self, server_endpoint, publish_endpoint)
+        self.values = {'load-1.mw': '1.0'}
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def query(self):
+        return 'ACK=' + ','.join(self.values)
+
+    def read(self, tag):
+        try:
+            return 'ACK=' + self.values[tag]
+        except KeyError:
+            return 'ERR=Tag not found: {}'.format(tag)
+
+    def write(self, tags):
+        self.writing.set()
+        self.release.wait(10)
+        self.values = dict(self.values, **tags)
+        return 'ACK=Success'
+
+    def periodic_publish(self):
+        pass
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool(timeout=5)
+    yield pool
+    pool.close()
+
+
+def test_read_during_slow_write(tmp_path, pool):
+    endpoint = free_endpoint()
+    provider = SlowProvider(endpoint, 'shm://' + str(tmp_path / 'ring'))
+    serve(provider)
+
+    writer = threading.Thread(target=pool.request, args=(endpoint, 'WRITE=load-1.mw:2.0'))
+    writer.start()
+    assert provider.writing.wait(5)
+
+    assert pool.request(endpoint, 'READ=load-1.mw') == 'ACK=1.0'
+    assert writer.is_alive()
+
+    provider.release.set()
+    writer.join(5)
+    assert pool.request(endpoint, 'READ=load-1.mw') == 'ACK=2.0'
+
+
+def test_pypower_read_during_slow_solve(tmp_path, pool):
+    endpoint = free_endpoint()
+    provider = PyPower(endpoint, 'shm://' + str(tmp_path / 'ring'), case9())
+    solving = threading.Event()
+    release = threading.Event()
+    solve = provider.engine.solve
+
+    def slow_solve(system):
+        solving.set()
+        release.wait(10)
+        return solve(system)
+
+    provider.engine.solve = slow_solve
+    serve(provider)
+
+    writer = threading.Thread(target=pool.request, args=(endpoint, 'WRITE=bus-5.load_mw:100'))
+    writer.start()
+    assert solving.wait(5)
+
+    # served from the solved state, not the half-written case
+    assert pool.request(endpoint, 'READ=bus-5.load_mw,bus-alert.active') == \
+        'ACK=bus-5.load_mw:90.0,bus-alert.active:false'
+    assert writer.is_alive()
+
+    release.set()
+    writer.join(5)
+    assert pool.request(endpoint, 'READ=bus-5.load_mw') == 'ACK=bus-5.load_mw:100.0'
@@ -0,0 +1,84 @@
+"""Tests for pybennu.distributed.publisher.
+
+Messages are published to a shared-memory ring, so no multicast (or
+draft ZMQ RADIO socket) is needed, and read back the way Subscriber
+does.
+"""
+
+import pybennu.distributed.codec as codec
+import pybennu.distributed.metrics as metrics
+import pybennu.distributed.shm as shm
+from pybennu.distributed.publisher import Publisher
+
+
+def receive(reader):
+    """Reassemble and decompress the frames published since the last call."""
+    assembler = codec.FragmentAssembler()
+    decompressor = codec.Decompressor()
+    messages = []
+    for frame in reader.read():
+        reassembled = assembler.add(frame)
+        if reassembled is None:
+            continue
+        flags, message = reassembled
+        if flags & codec.FLAG_DICTIONARY:
+            decompressor.add_dictionary(message)
+        elif flags & codec.FLAG_COMPRESSED:
+            messages.append(decompressor.decompress(message))
+        else:
+            messages.append(message)
+    return messages
+
+
+def publisher(tmp_path):
+    ring = str(tmp_path / 'ring')
+    pub = Publisher('shm://' + ring)
+    reader = shm.RingReader(ring)
+    reader.read()  # open the ring, later reads return new frames only
+    metrics.get_registry().reset()
+    return pub, reader
+
+
+def errors():
+    return metrics.get_registry().snapshot('publish.errors').get('publish.errors', 0)
+
+
+def test_publish_compressed_text(tmp_path):
+    pub, reader = publisher(tmp_path)
+    pub.compress = True
+    message = ','.join('bus-{}.voltage:{}'.format(i, 1.0 + i / 1000) for i in range(200))
+
+    pub.publish(message)
+    pub.publish({'bus-1.voltage': 0.98, 'bus-2.active': True})
+
+    assert receive(reader) == [
+        message.encode('utf-8'),
+        b'bus-1.voltage:0.98,bus-2.active:true,',
+    ]
+    assert errors() == 0
+
+
+def test_publish_fragmented_text(tmp_path):
+    pub, reader = publisher(tmp_path)
+    pub.fragment = True
+    pub.MTU = 64
+    message = ','.join('bus-{}.voltage:1.0'.format(i) for i in range(20))
+
+    pub.publish(message)
+
+    assert receive(reader) == [message.encode('utf-8')]
+    assert errors() == 0
+
+
+def test_publish_enveloped_text_as_binary(tmp_path):
+    pub, reader = publisher(tmp_path)
+    pub.binary = True
+    decoder = codec.BinaryDecoder()
+
+    pub.publish('Write={G1CB1.closed:true,QsetL8.value:1.5,}')
+
+    values = {}
+    for frame in reader.read():
+        values.update(decoder.decode(frame) or {})
+    assert values == {'G1CB1.closed': True, 'QsetL8.value': 1.5}
+    assert errors() == 0
@@ -0,0 +1,26 @@
+"""Tests for pybennu.providers.power.solvers.python_power_contingency."""
+
+from pypower.case9 import case9
+from pypower.idx_brch import BR_STATUS
+
+import pybennu.providers.power.solvers.python_power_contingency as contingency
+
+
+def outage(ppc, index):
+    case = dict(ppc, branch=ppc['branch'].copy())
+    case['branch'][index, BR_STATUS] = 0
+    return case
+
+
+def test_islanded_against_base_components():
+    ppc = case9()
+    assert contingency._components(ppc) == 1
+    # branch 1-4 is radial, bus 1 becomes an island of its own
+    assert contingency._islanded(outage(ppc, 0), 1)
+
+    # a base case that is already split doesn't make every outage islanding
+    split = outage(ppc, 0)
+    components = contingency._components(split)
+    assert components == 2
+    assert not contingency._islanded(outage(split, 1), components)  # 4-5, in the ring
+    assert contingency._islanded(outage(split, 6), components)  # 8-2, radial
@@ -0,0 +1,41 @@
+"""Tests for pybennu.distributed.subscriber."""
+
+from types import SimpleNamespace
+
+import pybennu.distributed.codec as codec
+from pybennu.distributed.subscriber import SubscriberCache
+
+
+def versioned(version, sim_time, values):
+    return codec.encode_text(dict(codec.version_values(version, sim_time), **values))
+
+
+def test_versions_tracked_per_source():
+    cache = SubscriberCache()
+    subscriber = SimpleNamespace(current_source=None)
+    cache.attach(subscriber)
+
+    subscriber.current_source = 'feeder-1'
+    subscriber.subscription_handler(versioned(200, 2.0, {'bus-1.voltage': 1.0}))
+    # another provider counts its own, lower, versions
+    subscriber.current_source = 'feeder-2'
+    subscriber.subscription_handler(versioned(100, 1.0, {'bus-2.voltage': 0.99}))
+
+    assert cache.stale_messages == 0
+    assert cache.snapshot() == {'bus-1.voltage': 1.0, 'bus-2.voltage': 0.99}
+    assert cache.version(source='feeder-1') == (200, 2.0)
+    assert cache.version(source='feeder-2') == (100, 1.0)
+    assert cache.version() is None
+
+    # an older message from the same source is still dropped
+    subscriber.subscription_handler(versioned(99, 0.9, {'bus-2.voltage': 0.5}))
+    assert cache.stale_messages == 1
+    assert cache.get('bus-2.voltage') == 0.99
+
+
+def test_version_of_single_source():
+    cache = SubscriberCache()
+    cache.update_text(versioned(7, 0.5, {'bus-1.voltage': 1.0}))
+
+    assert cache.version() == (7, 0.5)
+    assert cache.entry('bus-1.voltage').version == 7